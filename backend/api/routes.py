@@ -1,81 +1,228 @@
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse, PlainTextResponse
-import shutil
-import os
+from fastapi import APIRouter, UploadFile, File, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
+from starlette.background import BackgroundTask
+from email.utils import formatdate, parsedate_to_datetime
+import asyncio
+import hashlib
 import json
+import logging
+import os
+import tempfile
+import threading
 import uuid
-from datetime import datetime
-from typing import List, Dict
-from ..core.processor import process_file_content
+import zipfile
+from datetime import date, datetime
+from typing import List, Optional
+from ..core import config
+from ..core.analytics import ORDER_BY, AnalyticsStore
+from ..core.artifacts import read_lines, select_representation
+from ..core.cache import ResultCache, save_and_hash
+from ..core.export import FORMATS, ROWS, ensure_export, format_for_media_type
+from ..core.jobs import JobManager, QueueFullError
+from ..core.metrics import profiled
+from ..core.parallel import get_executor, shutdown_executor
+from ..core.pipeline import append_upload, ingest_upload, process_upload
+from ..core.models import ProcessingResult, SubmissionSelection
+from ..core.ingest import mapped_chunks
+from ..core.processor import aggregate_stream, aggregator_from_state, load_error_counts, load_state, warm_up
+from ..core.report import render_report
+from ..core.retention import ArtifactFiles, RetentionPolicy, apply_retention
+from ..core.storage import SubmissionStore, open_store
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
 
-DATA_DIR = "backend/data"
+DATA_DIR = config.DATA_DIR
 UPLOAD_DIR = os.path.join(DATA_DIR, "uploads")
 OUTPUT_DIR = os.path.join(DATA_DIR, "outputs")
 ERROR_DIR = os.path.join(DATA_DIR, "errors")
-HISTORY_FILE = os.path.join(DATA_DIR, "history.json")
 
-# Ensure directories exist
-for directory in [UPLOAD_DIR, OUTPUT_DIR, ERROR_DIR]:
-    os.makedirs(directory, exist_ok=True)
+# The stores below are opened per worker by startup(), from the app's lifespan,
+# so importing this module touches no files
 
-# Initialize history file if not exists
-if not os.path.exists(HISTORY_FILE):
-    with open(HISTORY_FILE, "w") as f:
-        json.dump([], f)
+# Submissions are looked up by id here instead of scanning the data directories
+store: Optional[SubmissionStore] = None
 
-def load_history() -> List[Dict]:
-    try:
-        with open(HISTORY_FILE, "r") as f:
-            return json.load(f)
-    except json.JSONDecodeError:
-        return []
+# Artifacts on disk, for batched removal and packing of old submissions into archives
+artifact_files: Optional[ArtifactFiles] = None
+
+# Customer totals of every processed file, for queries across submissions
+analytics: Optional[AnalyticsStore] = None
+
+# Identical uploads reuse earlier results instead of being processed again; None when disabled
+result_cache: Optional[ResultCache] = None
+
+# Uploads sent with mode=async are processed here in the background
+job_manager = JobManager(config.JOB_WORKERS, config.JOB_QUEUE_SIZE)
+
+# Seconds between job status checks on an open event stream
+JOB_EVENT_INTERVAL = 0.5
+
+# Appends to the same file are applied one at a time
+_append_locks: dict = {}
+_append_locks_guard = threading.Lock()
+
+def _get_file(file_id: str) -> Optional[dict]:
+    """A file's entry, with its artifacts unpacked first if retention archived them."""
+    entry = store.get_file(file_id)
+    if entry is not None:
+        artifact_files.unpack(entry["submission_id"])
+    return entry
+
+def find_artifact(file_id: str, type: str) -> Optional[str]:
+    """Returns the path of a file's output or error artifact, or None if it isn't known."""
+    entry = _get_file(file_id)
+    if entry is None:
+        return None
+    if type == "output":
+        path = os.path.join(OUTPUT_DIR, entry["output_file"])
+    else:
+        path = os.path.join(ERROR_DIR, entry["error_file"])
+    return path if os.path.exists(path) else None
+
+def _file_entry(filename: str) -> dict:
+    file_id = str(uuid.uuid4())
+    return {
+        "id": file_id,
+        "filename": filename,
+        "upload_file": f"{file_id}_{filename}",
+        "output_file": f"{file_id}_output.txt",
+        "error_file": f"{file_id}_error.txt"
+    }
+
+def _artifact_paths(file_entry: dict):
+    # Entries imported from history.json don't record the upload name, it follows {file_id}_{filename}
+    upload_filename = file_entry.get("upload_file") or f"{file_entry['id']}_{file_entry['filename']}"
+    return (
+        os.path.join(UPLOAD_DIR, upload_filename),
+        os.path.join(OUTPUT_DIR, file_entry["output_file"]),
+        os.path.join(ERROR_DIR, file_entry["error_file"]),
+    )
+
+def _error_log(file_id: str) -> Optional[str]:
+    """
+    The path of a processed file's error log, or None if the file isn't known.
+    Files without rejected lines have no log on disk; theirs is served empty.
+    """
+    entry = _get_file(file_id)
+    if entry is None:
+        return None
+    _, output_path, error_path = _artifact_paths(entry)
+    return error_path if os.path.exists(output_path) else None
+
+def _file_result(file_entry: dict) -> Optional[ProcessingResult]:
+    """A processed file's result, from its saved report state, or None without one."""
+    state = load_state(_artifact_paths(file_entry)[1])
+    return aggregator_from_state(state).result() if state is not None else None
+
+def _stored_result(file_entry: dict) -> Optional[ProcessingResult]:
+    """
+    _file_result, or for a file processed before report state was saved, the
+    result of processing its stored upload again (nothing is written). None if
+    the upload is gone too.
+    """
+    result = _file_result(file_entry)
+    if result is not None:
+        return result
+    upload_path = _artifact_paths(file_entry)[0]
+    if not os.path.exists(upload_path):
+        return None
+    with open(os.devnull, "w") as discarded:
+        aggregator, _ = aggregate_stream(mapped_chunks(upload_path), discarded)
+    return aggregator.result()
+
+def _record_analytics(submission: dict):
+    for file_entry in submission["files"]:
+        result = _file_result(file_entry)
+        if result is not None:
+            analytics.record_file(file_entry["id"], submission["id"], file_entry["filename"],
+                                  submission["timestamp"], result)
+
+def startup():
+    """
+    Per-worker setup, run once by the app's lifespan before the first request:
+    creates the data directories, opens the stores and the result cache (importing
+    history.json, dropping stale cache entries and backfilling analytics the first
+    time), and warms up processing here and in the process pool.
+    """
+    global store, artifact_files, analytics, result_cache
+    for directory in [UPLOAD_DIR, OUTPUT_DIR, ERROR_DIR]:
+        os.makedirs(directory, exist_ok=True)
+
+    store = open_store(config.STORE_BACKEND, DATA_DIR)
+    artifact_files = ArtifactFiles(DATA_DIR)
+    analytics = AnalyticsStore(os.path.join(DATA_DIR, "analytics.db"))
+    if config.CACHE_ENABLED:
+        result_cache = ResultCache(
+            os.path.join(DATA_DIR, "cache"),
+            max_entries=config.CACHE_MAX_ENTRIES,
+            max_bytes=config.CACHE_MAX_BYTES,
+            memory_entries=config.CACHE_MEMORY_ENTRIES,
+        )
+        result_cache.purge_stale()
+
+    # Submissions stored before analytics existed are added once
+    analytics.backfill(store.list_submissions, _stored_result)
+
+    warm_up()
+    executor = get_executor()
+    if executor is not None:
+        # Not waited for: pool workers start and warm up while the first requests come in
+        for _ in range(config.PROCESS_WORKERS):
+            executor.submit(warm_up)
 
-def save_history(history: List[Dict]):
-    with open(HISTORY_FILE, "w") as f:
-        json.dump(history, f, indent=4)
+def shutdown():
+    shutdown_executor()
 
 @router.post("/upload")
-async def upload_files(files: List[UploadFile] = File(...)):
+async def upload_files(
+    files: List[UploadFile] = File(...),
+    mode: str = Query("sync", pattern="^(sync|async)$"),
+    profile: bool = False,
+):
+    """
+    Stores and processes the uploaded files as one submission. With mode=async the
+    files are only saved before the response (202, with the job status); processing
+    runs in the background and the submission appears in the history once it is done.
+    With profile=true (sync only, and only while ORDER_PROFILE_DIR is set) each file is
+    processed in the request's own thread, bypassing the cache and process pool, under
+    cProfile; the dumps written are listed under "profiles" in the response.
+    """
+    if profile and (mode == "async" or not config.PROFILE_DIR):
+        raise HTTPException(status_code=400, detail="Profiling needs mode=sync and ORDER_PROFILE_DIR set")
+
     submission_id = str(uuid.uuid4())
     timestamp = datetime.now().isoformat()
-    processed_files = []
+    processed_files = [_file_entry(file.filename) for file in files]
+
+    if mode == "async":
+        return await _queue_upload(submission_id, timestamp, files, processed_files)
+
+    executor = get_executor()
+    jobs = []
+    profiles = []
     
-    for file in files:
-        file_id = str(uuid.uuid4())
-        
-        # Save uploaded file
-        file_path = os.path.join(UPLOAD_DIR, f"{file_id}_{file.filename}")
-        with open(file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        # Read content for processing
-        with open(file_path, "r") as f:
-            content = f.read()
-            
-        # Process content
-        output_content, error_content = process_file_content(content)
-        
-        # Save output and error files
-        output_filename = f"{file_id}_output.txt"
-        error_filename = f"{file_id}_error.txt"
-        
-        output_path = os.path.join(OUTPUT_DIR, output_filename)
-        error_path = os.path.join(ERROR_DIR, error_filename)
+    for file, file_entry in zip(files, processed_files):
+        if profile:
+            name = f"{submission_id}_{file_entry['id']}"
+            profiles.append(f"{name}.prof")
+            jobs.append(run_in_threadpool(
+                profiled, config.PROFILE_DIR, name, ingest_upload, file.file, *_artifact_paths(file_entry)
+            ))
+            continue
+        jobs.append(run_in_threadpool(
+            ingest_upload,
+            file.file,
+            *_artifact_paths(file_entry),
+            result_cache,
+            executor,
+            config.PROCESS_WORKERS
+        ))
         
-        with open(output_path, "w") as f:
-            f.write(output_content)
-            
-        with open(error_path, "w") as f:
-            f.write(error_content)
-            
-        processed_files.append({
-            "id": file_id,
-            "filename": file.filename,
-            "output_file": output_filename,
-            "error_file": error_filename
-        })
+    # Disk and CPU work runs on worker threads (and the process pool, if configured)
+    # so the event loop keeps serving other requests meanwhile
+    await asyncio.gather(*jobs)
         
     # Create Submission Entry
     submission_entry = {
@@ -84,109 +231,466 @@ async def upload_files(files: List[UploadFile] = File(...)):
         "files": processed_files
     }
     
-    history = load_history()
-    # Handle legacy history migration if needed (simple check if items have 'files' key)
-    # If legacy items exist and don't match new structure, we might want to filter or migrate them.
-    # For this assignment, assuming we can just append new structure and frontend handles valid ones, 
-    # or we clear old history. Let's append and filter in frontend or migration here.
-    # Simple migration:
-    new_history = []
-    for item in history:
-        if "files" in item:
-            new_history.append(item)
-    
-    new_history.insert(0, submission_entry)
-    save_history(new_history)
+    await run_in_threadpool(store.add_submission, submission_entry)
+    await run_in_threadpool(_record_analytics, submission_entry)
     
+    if profile:
+        return dict(submission_entry, profiles=profiles)
     return submission_entry
 
+async def _queue_upload(submission_id: str, timestamp: str, files: List[UploadFile], processed_files: List[dict]):
+    if not job_manager.can_accept(len(files)):
+        raise HTTPException(status_code=503, detail="Processing queue is full, try again later")
+
+    # The request body goes away with the response, so the uploads are saved (and hashed) now
+    hashes = await asyncio.gather(*(
+        run_in_threadpool(save_and_hash, file.file, _artifact_paths(file_entry)[0])
+        for file, file_entry in zip(files, processed_files)
+    ))
+    content_hashes = {file_entry["id"]: content_hash for file_entry, content_hash in zip(processed_files, hashes)}
+
+    def task(job: dict, file_status: dict):
+        def progress(lines: int, bytes_read: int):
+            job_manager.update(job, file_status, lines_processed=lines, bytes_processed=bytes_read)
+
+        upload_path, output_path, error_path = _artifact_paths(file_status)
+        error_count = process_upload(
+            upload_path, output_path, error_path, content_hashes[file_status["id"]],
+            result_cache, get_executor(), config.PROCESS_WORKERS, progress,
+        )
+        job_manager.update(job, file_status, error_count=error_count, bytes_processed=os.path.getsize(upload_path))
+
+    def on_complete(job: dict):
+        completed = {f["id"] for f in job["files"] if f["status"] == "completed"}
+        if completed:
+            submission = {
+                "id": submission_id,
+                "timestamp": timestamp,
+                "files": [f for f in processed_files if f["id"] in completed]
+            }
+            store.add_submission(submission)
+            _record_analytics(submission)
+
+    try:
+        job = job_manager.submit(submission_id, timestamp, processed_files, task, on_complete)
+    except QueueFullError:
+        # Filled up by another request while these files were being saved
+        for file_entry in processed_files:
+            os.remove(_artifact_paths(file_entry)[0])
+        raise HTTPException(status_code=503, detail="Processing queue is full, try again later")
+
+    return JSONResponse({"id": submission_id, "timestamp": timestamp, "files": processed_files, "job": job},
+                        status_code=202)
+
+@router.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@router.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str):
+    """Server-sent events: the job status each time it changes, until it completes or fails."""
+    if job_manager.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def events():
+        version = None
+        while True:
+            job = job_manager.get(job_id)
+            if job is None:
+                return
+            if job["version"] != version:
+                version = job["version"]
+                yield f"data: {json.dumps(job)}\n\n"
+            if job["status"] in ("completed", "failed"):
+                return
+            await asyncio.sleep(JOB_EVENT_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
 @router.delete("/history/{submission_id}")
-async def delete_submission(submission_id: str):
-    history = load_history()
-    submission = next((item for item in history if item["id"] == submission_id), None)
+def delete_submission(submission_id: str):
+    submission = store.delete_submission(submission_id)
     
     if not submission:
         raise HTTPException(status_code=404, detail="Submission not found")
+    analytics.remove_submission(submission_id)
     
-    # Delete associated files
-    for file_entry in submission["files"]:
-        try:
-            # Construct paths (assuming patterns from upload)
-            # We don't have original upload filename stored fully with ID prefix, but we have output/error
-            # Upload file: {id}_{filename} -> we need to find it or store it better.
-            # Current storage: UPLOAD_DIR/{file_id}_{filename}
-            # We have file_id and filename.
-            upload_path = os.path.join(UPLOAD_DIR, f"{file_entry['id']}_{file_entry['filename']}")
-            output_path = os.path.join(OUTPUT_DIR, file_entry['output_file'])
-            error_path = os.path.join(ERROR_DIR, file_entry['error_file'])
-            
-            for path in [upload_path, output_path, error_path]:
-                if os.path.exists(path):
-                    os.remove(path)
-        except Exception as e:
-            print(f"Error deleting info for file {file_entry['id']}: {e}")
-            
-    # Remove from history
-    new_history = [item for item in history if item["id"] != submission_id]
-    save_history(new_history)
+    # Every artifact (upload, report and error log, and what was derived from them) in one pass
+    try:
+        files_removed, bytes_reclaimed = artifact_files.remove_submission(submission)
+    except OSError:
+        logger.exception("Error deleting files for submission %s", submission_id)
+        files_removed = bytes_reclaimed = 0
     
-    return {"message": "Submission deleted successfully"}
+    return {"message": "Submission deleted successfully", "files_removed": files_removed,
+            "bytes_reclaimed": bytes_reclaimed}
+
+def _history_timestamp(value: Optional[datetime]) -> Optional[str]:
+    """Normalizes a filter bound to the naive local ISO format submissions are stamped with."""
+    if value is None:
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone().replace(tzinfo=None)
+    return value.isoformat()
+
+def _not_modified(request: Request, etag: str, modified: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _selected_ids(selection: SubmissionSelection) -> List[str]:
+    """
+    Ids of the submissions a bulk request picks. A selection without any
+    criteria is refused rather than taken to mean every submission.
+    """
+    filtered = selection.since is not None or selection.until is not None or bool(selection.filename)
+    if selection.ids is None and not filtered:
+        raise HTTPException(status_code=400, detail="Select submissions by ids, since/until or filename")
+    if not filtered:
+        return selection.ids
+    matches, _ = store.query_submissions(
+        since=_history_timestamp(selection.since),
+        until=_history_timestamp(selection.until),
+        filename=selection.filename,
+        summary=True,
+    )
+    ids = [submission["id"] for submission in matches]
+    if selection.ids is not None:
+        wanted = set(selection.ids)
+        ids = [submission_id for submission_id in ids if submission_id in wanted]
+    return ids
+
+@router.post("/history/delete")
+def delete_submissions(selection: SubmissionSelection):
+    """
+    Deletes every selected submission with one write to the store and one to
+    analytics, then removes their artifacts from a single scan of the data
+    directories, several submissions at a time.
+    """
+    submissions = store.delete_submissions(_selected_ids(selection))
+    ids = [submission["id"] for submission in submissions]
+    analytics.remove_submissions(ids)
+
+    try:
+        files_removed, bytes_reclaimed = artifact_files.remove_submissions(submissions)
+    except OSError:
+        logger.exception("Error deleting files for %d submissions", len(submissions))
+        files_removed = bytes_reclaimed = 0
+
+    return {"deleted": ids, "files_removed": files_removed, "bytes_reclaimed": bytes_reclaimed}
+
+def _write_export(submissions: List[dict], target):
+    """Zips the submissions' records (submissions.json) and their uploads, reports and error logs."""
+    with zipfile.ZipFile(target, "w", zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr("submissions.json", json.dumps(submissions, indent=4))
+        for submission in submissions:
+            artifact_files.unpack(submission["id"])
+            for entry in submission["files"]:
+                for path in _artifact_paths(entry):
+                    # Files without rejected lines have no error log
+                    if os.path.exists(path):
+                        archive.write(path, f"{submission['id']}/{os.path.relpath(path, DATA_DIR)}")
+
+@router.post("/history/export")
+def export_submissions(selection: SubmissionSelection):
+    """
+    The selected submissions as one zip: submissions.json with their records,
+    and each file's upload, report and error log under {submission_id}/.
+    """
+    submissions = [submission for submission in map(store.get_submission, _selected_ids(selection)) if submission]
+    if not submissions:
+        raise HTTPException(status_code=404, detail="No submissions selected")
+
+    fd, path = tempfile.mkstemp(suffix=".zip")
+    try:
+        with os.fdopen(fd, "wb") as target:
+            _write_export(submissions, target)
+    except BaseException:
+        os.remove(path)
+        raise
+    return FileResponse(path, media_type="application/zip", filename=f"submissions_{datetime.now():%Y%m%d_%H%M%S}.zip",
+                        background=BackgroundTask(os.remove, path))
 
 @router.get("/history")
-async def get_history():
-    return load_history()
+def get_history(
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    filename: Optional[str] = None,
+    view: str = Query("full", pattern="^(full|summary)$"),
+):
+    """
+    Submissions, newest first. With limit set the response is one page and the
+    X-Next-Cursor header carries the cursor for the next one. Responses carry an
+    ETag/Last-Modified derived from the store's change counter, so an unchanged
+    history answers If-None-Match/If-Modified-Since with 304 without being read.
+    """
+    version, modified = store.get_version()
+    query = "&".join(f"{key}={value}" for key, value in sorted(request.query_params.multi_items()))
+    etag = f'W/"{version}-{hashlib.sha1(query.encode()).hexdigest()[:16]}"'
+    headers = {
+        "ETag": etag,
+        "Last-Modified": formatdate(modified, usegmt=True),
+        "Cache-Control": "no-cache",
+    }
+    if _not_modified(request, etag, modified):
+        return Response(status_code=304, headers=headers)
+
+    try:
+        submissions, next_cursor = store.query_submissions(
+            limit=limit,
+            cursor=cursor,
+            since=_history_timestamp(since),
+            until=_history_timestamp(until),
+            filename=filename,
+            summary=view == "summary",
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = next_cursor
+    return JSONResponse(submissions, headers=headers)
+
+@router.get("/history/{submission_id}")
+def get_submission(submission_id: str):
+    submission = store.get_submission(submission_id)
+    if not submission:
+        raise HTTPException(status_code=404, detail="Submission not found")
+    return submission
+
+def _append_lock(file_id: str) -> threading.Lock:
+    with _append_locks_guard:
+        return _append_locks.setdefault(file_id, threading.Lock())
+
+def _append_to_file(file_id: str, source):
+    entry = _get_file(file_id)
+    if entry is None:
+        return None
+    upload_path, output_path, error_path = _artifact_paths(entry)
+    if not os.path.exists(upload_path):
+        return None
+    with _append_lock(file_id):
+        result = append_upload(source, upload_path, output_path, error_path)
+        submission = store.get_submission(entry["submission_id"])
+        file_result = _file_result(entry)
+        if submission is not None and file_result is not None:
+            analytics.record_file(file_id, submission["id"], entry["filename"], submission["timestamp"], file_result)
+        return result
+
+@router.post("/file/{file_id}/append")
+async def append_file(file_id: str, file: UploadFile = File(...)):
+    """
+    Appends the uploaded order lines to a processed file and updates its report
+    and error log in place of reprocessing the whole file.
+    """
+    result = await run_in_threadpool(_append_to_file, file_id, file.file)
+    if result is None:
+        raise HTTPException(status_code=404, detail="File not found")
+    return dict(result, id=file_id)
+
+def _serve_artifact(request: Request, path: str, offset: Optional[int], limit: Optional[int],
+                    tail: Optional[int], filename: Optional[str] = None) -> Response:
+    """
+    Streams a stored text file, honouring Range and Accept-Encoding (through
+    compressed sidecars). With offset/limit or tail only that window of lines is
+    returned, with X-Total-Lines and X-Line-Offset headers. A missing path is
+    served as an empty file.
+    """
+    windowed = offset is not None or limit is not None or tail is not None
+    if not os.path.exists(path):
+        headers = {"X-Total-Lines": "0", "X-Line-Offset": "0"} if windowed else {}
+        if filename:
+            headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return Response(b"", media_type="text/plain; charset=utf-8", headers=headers)
+    if windowed:
+        content, first, total = read_lines(path, offset, limit, tail)
+        return Response(content, media_type="text/plain; charset=utf-8",
+                        headers={"X-Total-Lines": str(total), "X-Line-Offset": str(first)})
+
+    served, encoding = select_representation(path, request.headers.get("accept-encoding"), config.COMPRESS_MIN_BYTES)
+    headers = {"Vary": "Accept-Encoding"}
+    if encoding:
+        headers["Content-Encoding"] = encoding
+    return FileResponse(path=served, filename=filename, media_type="text/plain", headers=headers)
 
 @router.get("/file/{file_id}/output")
-async def get_output_file(file_id: str):
-    # Find filename from history or construct it (assuming pattern)
-    # Constructing is riskier if we change naming convention, but faster.
-    # Let's verify existence.
-    files = os.listdir(OUTPUT_DIR)
-    target_file = None
-    for f in files:
-        if f.startswith(file_id):
-            target_file = f
-            break
-            
-    if not target_file:
+def get_output_file(
+    file_id: str,
+    request: Request,
+    offset: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=100_000),
+    tail: Optional[int] = Query(None, ge=1, le=100_000),
+):
+    path = find_artifact(file_id, "output")
+    if not path:
         raise HTTPException(status_code=404, detail="Output file not found")
-        
-    path = os.path.join(OUTPUT_DIR, target_file)
-    with open(path, "r") as f:
-        content = f.read()
-    return PlainTextResponse(content)
+    return _serve_artifact(request, path, offset, limit, tail)
+
+@router.get("/file/{file_id}/report")
+def get_report_view(
+    file_id: str,
+    top: Optional[int] = Query(None, ge=1),
+    offset: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=100_000),
+):
+    """
+    The report cut down to the `top` customers by net total and/or one page of
+    rows, rendered from the file's saved totals. X-Total-Customers carries the
+    number of rows before paging.
+    """
+    entry = _get_file(file_id)
+    result = _file_result(entry) if entry is not None else None
+    if result is None:
+        raise HTTPException(status_code=404, detail="Report not found")
+
+    total = len(result.summary_report) if top is None else min(top, len(result.summary_report))
+    return PlainTextResponse(
+        render_report(result, top=top, offset=offset, limit=limit),
+        headers={"X-Total-Customers": str(total)},
+    )
 
 @router.get("/file/{file_id}/error")
-async def get_error_file(file_id: str):
-    files = os.listdir(ERROR_DIR)
-    target_file = None
-    for f in files:
-        if f.startswith(file_id):
-            target_file = f
-            break
-            
-    if not target_file:
+def get_error_file(
+    file_id: str,
+    request: Request,
+    offset: Optional[int] = Query(None, ge=0),
+    limit: Optional[int] = Query(None, ge=1, le=100_000),
+    tail: Optional[int] = Query(None, ge=1, le=100_000),
+):
+    path = _error_log(file_id)
+    if not path:
         raise HTTPException(status_code=404, detail="Error file not found")
-        
-    path = os.path.join(ERROR_DIR, target_file)
-    with open(path, "r") as f:
-        content = f.read()
-    return PlainTextResponse(content)
+    return _serve_artifact(request, path, offset, limit, tail)
+
+@router.get("/file/{file_id}/error/summary")
+def get_error_summary(file_id: str):
+    """
+    How many lines of the file were rejected, per category with the first
+    offending line number and value, and how many of them the error log holds.
+    Read from the counts saved at processing time, never from the log itself.
+    """
+    entry = _get_file(file_id)
+    counts = load_error_counts(_artifact_paths(entry)[1]) if entry is not None else None
+    if counts is None:
+        raise HTTPException(status_code=404, detail="Error summary not found")
+    return {"id": file_id, **counts}
 
 @router.get("/download/{file_id}/{type}")
-async def download_file(file_id: str, type: str):
+def download_file(file_id: str, type: str, request: Request):
     if type not in ["output", "error"]:
         raise HTTPException(status_code=400, detail="Invalid file type")
         
-    directory = OUTPUT_DIR if type == "output" else ERROR_DIR
-    files = os.listdir(directory)
-    target_file = None
-    for f in files:
-        if f.startswith(file_id):
-            target_file = f
-            break
-            
-    if not target_file:
+    path = find_artifact(file_id, type) if type == "output" else _error_log(file_id)
+    if not path:
         raise HTTPException(status_code=404, detail="File not found")
         
-    return FileResponse(path=os.path.join(directory, target_file), filename=target_file, media_type='text/plain')
+    return _serve_artifact(request, path, None, None, None, filename=os.path.basename(path))
+
+@router.get("/file/{file_id}/export")
+def export_file(
+    file_id: str,
+    request: Request,
+    format: Optional[str] = Query(None, pattern=f"^({'|'.join(FORMATS)})$"),
+    rows: str = Query("summary", pattern=f"^({'|'.join(ROWS)})$"),
+):
+    """
+    The file's results as JSON, CSV, Parquet or Arrow: the customer summary, or
+    with rows=orders every valid order line with its totals. Without format=
+    the Accept header picks the format, falling back to JSON. Exports are built
+    on first request and kept until the file changes.
+    """
+    fmt = format or format_for_media_type(request.headers.get("accept")) or "json"
+    entry = _get_file(file_id)
+    if entry is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    upload_path, output_path, _ = _artifact_paths(entry)
+    try:
+        path = ensure_export(upload_path, output_path, rows, fmt)
+    except ImportError:
+        raise HTTPException(status_code=501, detail=f"{fmt} export needs pyarrow installed")
+    if path is None:
+        raise HTTPException(status_code=404, detail="Results not available for export")
+
+    media_type, extension = FORMATS[fmt]
+    filename = f"{os.path.splitext(entry['filename'])[0]}_{rows}.{extension}"
+    return FileResponse(path=path, filename=filename, media_type=media_type)
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    if result_cache is None:
+        return {"enabled": False}
+    return dict(result_cache.stats(), enabled=True)
+
+@router.delete("/cache")
+def clear_cache():
+    """Drops every cached result; submissions keep their own links to the files."""
+    if result_cache is None:
+        return {"removed": 0}
+    return {"removed": result_cache.clear()}
+
+@router.post("/admin/retention")
+def run_retention(
+    dry_run: bool = False,
+    max_age_days: Optional[int] = Query(None, ge=0),
+    max_bytes: Optional[int] = Query(None, ge=0),
+    archive_after_days: Optional[int] = Query(None, ge=0),
+):
+    """
+    Runs one retention sweep: deletes submissions older than max_age_days, packs
+    the files of those older than archive_after_days into one zip per submission
+    and deletes the oldest while the data directories hold more than max_bytes.
+    Parameters left out take the configured policy (ORDER_RETENTION_DAYS,
+    ORDER_ARCHIVE_AFTER_DAYS, ORDER_RETENTION_MAX_BYTES); 0 turns one off.
+    With dry_run=true nothing changes and the reply says what would be deleted.
+    """
+    configured = RetentionPolicy.configured()
+    policy = RetentionPolicy(
+        configured.max_age_days if max_age_days is None else max_age_days,
+        configured.max_bytes if max_bytes is None else max_bytes,
+        configured.archive_after_days if archive_after_days is None else archive_after_days,
+    )
+    report = apply_retention(store, artifact_files, policy, analytics.remove_submissions, dry_run)
+    return dict(report, policy=policy._asdict())
+
+@router.get("/analytics/customers")
+def get_customer_totals(
+    since: Optional[date] = None,
+    until: Optional[date] = None,
+    order_by: str = Query("net_total", pattern=f"^({'|'.join(ORDER_BY)})$"),
+    limit: Optional[int] = Query(None, ge=1, le=10_000),
+    offset: int = Query(0, ge=0),
+):
+    """
+    Totals per customer across every file submitted from `since` up to (not
+    including) `until`, largest `order_by` first: limit=10 is the top ten.
+    X-Total-Customers carries the number of customers before paging.
+    """
+    rows, total = analytics.customers(since, until, order_by=order_by, limit=limit, offset=offset)
+    return JSONResponse(rows, headers={"X-Total-Customers": str(total)})
+
+@router.get("/analytics/customers/{customer_name:path}")
+def get_customer_analytics(customer_name: str, since: Optional[date] = None, until: Optional[date] = None):
+    """One customer's totals across files submitted in the range, with the per-file breakdown."""
+    rows, _ = analytics.customers(since, until, customer=customer_name)
+    if not rows:
+        raise HTTPException(status_code=404, detail="No orders for this customer")
+    return dict(rows[0], files=analytics.customer_files(customer_name, since, until))
+
+@router.get("/analytics/daily")
+def get_daily_totals(since: Optional[date] = None, until: Optional[date] = None, customer: Optional[str] = None):
+    """Totals per submission day, of every customer or of one."""
+    return analytics.daily(since, until, customer)
@@ -0,0 +1,327 @@
+"""
+Cross-submission analytics.
+
+Every processed file's customer summary rows and grand totals are saved in an
+SQLite database next to the submission store, so questions across submissions
+("John Smith's net total this month", "top 10 customers last week") are
+answered from indexed tables instead of re-reading reports or uploads.
+
+Three tables hold them: files (grand totals per file), file_customers (one
+row per customer per file, indexed by customer and time) and rollups, the
+totals per customer for all time, per submission month and per submission day,
+which files are added to and subtracted from as they come and go. A date range
+is answered from whole months plus the odd days at either end, so its cost
+follows the number of customers and months rather than the number of files.
+Days are the local date of the submission timestamp.
+"""
+import sqlite3
+import threading
+from datetime import date
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .models import ProcessingResult
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id TEXT PRIMARY KEY,
+    submission_id TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    customer_count INTEGER NOT NULL,
+    gross_total REAL NOT NULL,
+    total_discount REAL NOT NULL,
+    net_total REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_submission ON files(submission_id);
+CREATE INDEX IF NOT EXISTS idx_files_timestamp ON files(timestamp);
+
+CREATE TABLE IF NOT EXISTS file_customers (
+    file_id TEXT NOT NULL REFERENCES files(file_id) ON DELETE CASCADE,
+    customer_name TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    order_count INTEGER NOT NULL,
+    total_items INTEGER NOT NULL,
+    gross_total REAL NOT NULL,
+    total_discount REAL NOT NULL,
+    net_total REAL NOT NULL,
+    PRIMARY KEY (file_id, customer_name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_file_customers_customer ON file_customers(customer_name, timestamp);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    period TEXT NOT NULL,
+    bucket TEXT NOT NULL,
+    customer_name TEXT NOT NULL,
+    file_count INTEGER NOT NULL,
+    order_count INTEGER NOT NULL,
+    total_items INTEGER NOT NULL,
+    gross_total REAL NOT NULL,
+    total_discount REAL NOT NULL,
+    net_total REAL NOT NULL,
+    PRIMARY KEY (period, bucket, customer_name)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_rollups_customer ON rollups(customer_name, period, bucket);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Columns a customer ranking can be ordered by
+ORDER_BY = ("net_total", "gross_total", "total_discount", "order_count", "total_items")
+
+_TOTALS = ("order_count", "total_items", "gross_total", "total_discount", "net_total")
+
+# Rollup periods -> length of the timestamp prefix that names the bucket ("" for all, "2024-03", "2024-03-05")
+_PERIODS = (("all", 0), ("month", 7), ("day", 10))
+
+# Adds (sign 1) or subtracts (sign -1) one customer row in a rollup bucket
+_ROLLUP = """
+INSERT INTO rollups (period, bucket, customer_name, file_count, order_count, total_items, gross_total,
+                     total_discount, net_total)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(period, bucket, customer_name) DO UPDATE SET
+    file_count = file_count + excluded.file_count,
+    order_count = order_count + excluded.order_count,
+    total_items = total_items + excluded.total_items,
+    gross_total = gross_total + excluded.gross_total,
+    total_discount = total_discount + excluded.total_discount,
+    net_total = net_total + excluded.net_total
+"""
+
+
+def _month_start(day: date, later: bool) -> date:
+    """The first of day's month, or with later the first of the next month unless day is a first."""
+    if not later or day.day == 1:
+        return day.replace(day=1)
+    return date(day.year + day.month // 12, day.month % 12 + 1, 1)
+
+
+def _range_clause(since: Optional[date], until: Optional[date]) -> Tuple[str, List[str]]:
+    """
+    A WHERE clause over rollups covering submission days from since (inclusive) to
+    until (exclusive), either open: whole months from the month rollup and the
+    days before the first and after the last whole month from the day rollup.
+    """
+    if since is None and until is None:
+        return "period = 'all'", []
+
+    ranges = []  # (period, first bucket or None, bucket after the last or None)
+    first_month = _month_start(since, later=True) if since is not None else None
+    last_month = _month_start(until, later=False) if until is not None else None
+    if first_month is not None and last_month is not None and first_month >= last_month:
+        ranges.append(("day", since.isoformat(), until.isoformat()))
+    else:
+        if since is not None and since < first_month:
+            ranges.append(("day", since.isoformat(), first_month.isoformat()))
+        ranges.append(("month", first_month and first_month.isoformat()[:7], last_month and last_month.isoformat()[:7]))
+        if until is not None and last_month < until:
+            ranges.append(("day", last_month.isoformat(), until.isoformat()))
+
+    clauses, params = [], []
+    for period, low, high in ranges:
+        clause = ["period = ?"]
+        params.append(period)
+        if low is not None:
+            clause.append("bucket >= ?")
+            params.append(low)
+        if high is not None:
+            clause.append("bucket < ?")
+            params.append(high)
+        clauses.append(f"({' AND '.join(clause)})")
+    return f"({' OR '.join(clauses)})", params
+
+
+def _totals(row) -> Dict:
+    return {name: row[name] for name in _TOTALS}
+
+
+class AnalyticsStore:
+    """SQLite store of per-file customer totals. Each thread gets its own connection; every write is one transaction."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _roll_up(self, conn: sqlite3.Connection, file_ids: Iterable[str], sign: int):
+        keys, changes = [], []
+        for file_id in file_ids:
+            for row in conn.execute(
+                "SELECT timestamp, customer_name, order_count, total_items, gross_total, total_discount, net_total"
+                " FROM file_customers WHERE file_id = ?",
+                (file_id,),
+            ):
+                totals = [sign * row[name] for name in _TOTALS]
+                for period, length in _PERIODS:
+                    key = (period, row["timestamp"][:length], row["customer_name"])
+                    keys.append(key)
+                    changes.append((*key, sign, *totals))
+        conn.executemany(_ROLLUP, changes)
+        if sign < 0:
+            conn.executemany(
+                "DELETE FROM rollups WHERE period = ? AND bucket = ? AND customer_name = ? AND file_count <= 0", keys
+            )
+
+    def _remove_files(self, conn: sqlite3.Connection, file_ids: List[str]):
+        self._roll_up(conn, file_ids, -1)
+        conn.executemany("DELETE FROM files WHERE file_id = ?", [(file_id,) for file_id in file_ids])
+
+    def record_file(self, file_id: str, submission_id: str, filename: str, timestamp: str,
+                    result: ProcessingResult):
+        """Saves a file's summary, replacing what was saved for it before (e.g. ahead of an append)."""
+        with self._connect() as conn:
+            self._remove_files(conn, [file_id])
+            conn.execute(
+                "INSERT INTO files (file_id, submission_id, filename, timestamp, customer_count, gross_total,"
+                " total_discount, net_total) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (file_id, submission_id, filename, timestamp, len(result.summary_report),
+                 result.grand_total_gross, result.grand_total_discount, result.grand_total_net),
+            )
+            conn.executemany(
+                "INSERT INTO file_customers (file_id, customer_name, timestamp, order_count, total_items,"
+                " gross_total, total_discount, net_total) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (file_id, s.customer_name, timestamp, s.order_count, s.total_items, s.gross_total,
+                     s.total_discount, s.net_total)
+                    for s in result.summary_report
+                ],
+            )
+            self._roll_up(conn, [file_id], 1)
+
+    def remove_submission(self, submission_id: str) -> int:
+        """Drops a submission's files and takes them out of the rollup. Returns how many files were removed."""
+        return self.remove_submissions([submission_id])
+
+    def remove_submissions(self, submission_ids: Iterable[str]) -> int:
+        """remove_submission for many submissions, in one transaction."""
+        ids = list(submission_ids)
+        with self._connect() as conn:
+            file_ids = []
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                file_ids += [row["file_id"] for row in conn.execute(
+                    f"SELECT file_id FROM files WHERE submission_id IN ({', '.join('?' * len(batch))})", batch
+                )]
+            self._remove_files(conn, file_ids)
+        return len(file_ids)
+
+    def has_file(self, file_id: str) -> bool:
+        return self._connect().execute("SELECT 1 FROM files WHERE file_id = ?", (file_id,)).fetchone() is not None
+
+    def customers(self, since: Optional[date] = None, until: Optional[date] = None,
+                  customer: Optional[str] = None, order_by: str = "net_total", limit: Optional[int] = None,
+                  offset: int = 0) -> Tuple[List[Dict], int]:
+        """
+        Totals per customer over the files submitted from `since` up to (not
+        including) `until`, largest `order_by` first (ties by name), as one page.
+        Returns (rows, number of customers before paging).
+        """
+        if order_by not in ORDER_BY:
+            raise ValueError(f"Unknown order: {order_by}. Expected one of {', '.join(ORDER_BY)}")
+        where, params = _range_clause(since, until)
+        if customer is not None:
+            where += " AND customer_name = ?"
+            params.append(customer)
+
+        conn = self._connect()
+        total = conn.execute(f"SELECT COUNT(DISTINCT customer_name) FROM rollups WHERE {where}", params).fetchone()[0]
+        sql = (
+            "SELECT customer_name, SUM(file_count) AS file_count,"
+            f" {', '.join(f'SUM({name}) AS {name}' for name in _TOTALS)}"
+            f" FROM rollups WHERE {where} GROUP BY customer_name ORDER BY {order_by} DESC, customer_name"
+        )
+        if limit is not None:
+            sql += " LIMIT ? OFFSET ?"
+            params = [*params, limit, offset]
+        elif offset:
+            sql += " LIMIT -1 OFFSET ?"
+            params = [*params, offset]
+        rows = [
+            {"customer_name": row["customer_name"], "file_count": row["file_count"], **_totals(row)}
+            for row in conn.execute(sql, params)
+        ]
+        return rows, total
+
+    def customer_files(self, customer: str, since: Optional[date] = None,
+                       until: Optional[date] = None) -> List[Dict]:
+        """One customer's totals in each file submitted in the range, oldest first."""
+        sql = (
+            "SELECT c.file_id, f.submission_id, f.filename, c.timestamp, "
+            + ", ".join(f"c.{name}" for name in _TOTALS)
+            + " FROM file_customers c JOIN files f ON f.file_id = c.file_id WHERE c.customer_name = ?"
+        )
+        params: List = [customer]
+        if since is not None:
+            sql += " AND c.timestamp >= ?"
+            params.append(since.isoformat())
+        if until is not None:
+            sql += " AND c.timestamp < ?"
+            params.append(until.isoformat())
+        sql += " ORDER BY c.timestamp, c.file_id"
+        return [
+            {"file_id": row["file_id"], "submission_id": row["submission_id"], "filename": row["filename"],
+             "timestamp": row["timestamp"], **_totals(row)}
+            for row in self._connect().execute(sql, params)
+        ]
+
+    def daily(self, since: Optional[date] = None, until: Optional[date] = None,
+              customer: Optional[str] = None) -> List[Dict]:
+        """Totals per submission day (of one customer, or of everyone), oldest first."""
+        where, params = "period = 'day'", []
+        if since is not None:
+            where += " AND bucket >= ?"
+            params.append(since.isoformat())
+        if until is not None:
+            where += " AND bucket < ?"
+            params.append(until.isoformat())
+        if customer is not None:
+            where += " AND customer_name = ?"
+            params.append(customer)
+        sql = (
+            "SELECT bucket AS day, COUNT(*) AS customer_count,"
+            f" {', '.join(f'SUM({name}) AS {name}' for name in _TOTALS)}"
+            f" FROM rollups WHERE {where} GROUP BY bucket ORDER BY bucket"
+        )
+        return [
+            {"day": row["day"], "customer_count": row["customer_count"], **_totals(row)}
+            for row in self._connect().execute(sql, params)
+        ]
+
+    def backfill(self, list_submissions: Callable[[], Iterable[Dict]],
+                 result_for: Callable[[Dict], Optional[ProcessingResult]]) -> int:
+        """
+        One-time import of the submissions stored before analytics existed
+        (list_submissions() is only called the first time); later calls are
+        no-ops. result_for(file_entry) gives a file's result, or None to skip
+        it. Returns the number of files recorded.
+        """
+        conn = self._connect()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'backfilled'").fetchone():
+            return 0
+        recorded = 0
+        for submission in list_submissions():
+            for entry in submission["files"]:
+                if self.has_file(entry["id"]):
+                    continue
+                result = result_for(entry)
+                if result is not None:
+                    self.record_file(entry["id"], submission["id"], entry["filename"], submission["timestamp"],
+                                     result)
+                    recorded += 1
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('backfilled', '1')")
+        return recorded
@@ -0,0 +1,175 @@
+"""
+Serving helpers for stored report and error-log files.
+
+Responses stream from disk (FileResponse handles Range requests), so nothing
+here reads a whole file into memory. Compressed copies are kept as sidecars
+next to the file ({path}.gz, {path}.zst): existing ones are used when the
+client accepts the encoding and they are newer than the file, and large files
+get one built on first request. zstd needs the optional zstandard package.
+
+Line windows (offset/limit, tail) seek through a sparse index of line starts,
+one entry per LINE_INDEX_STEP lines, built once per file version and kept in
+a small in-process LRU.
+"""
+import gzip
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .ingest import CHUNK_SIZE
+
+# Content-Encoding -> sidecar suffix, in order of preference
+ENCODINGS = (("zstd", ".zst"), ("gzip", ".gz"))
+
+LINE_INDEX_STEP = 1024
+# Lines returned by a window that gives an offset but no limit
+MAX_WINDOW_LINES = 100_000
+_LINE_INDEX_CACHE = 64
+
+_line_indexes: "OrderedDict[Tuple[str, int, int], Tuple[List[int], int]]" = OrderedDict()
+_line_indexes_lock = threading.Lock()
+
+
+def accepted_encodings(header: Optional[str]) -> Dict[str, float]:
+    """Parses Accept-Encoding into {coding: q}, leaving out codings with q=0."""
+    accepted = {}
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        if q > 0:
+            accepted[coding] = q
+    return accepted
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        return None
+    return zstandard
+
+
+def _fresh(sidecar: str, path: str) -> bool:
+    try:
+        return os.stat(sidecar).st_mtime_ns >= os.stat(path).st_mtime_ns
+    except OSError:
+        return False
+
+
+def _build_sidecar(path: str, encoding: str, sidecar: str):
+    temp = f"{sidecar}.{threading.get_ident()}.tmp"
+    try:
+        with open(path, "rb") as source:
+            if encoding == "gzip":
+                with gzip.open(temp, "wb", compresslevel=6) as target:
+                    shutil.copyfileobj(source, target, CHUNK_SIZE)
+            else:
+                with open(temp, "wb") as target:
+                    _zstd().ZstdCompressor().copy_stream(source, target)
+        os.replace(temp, sidecar)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+
+
+def select_representation(path: str, accept_encoding: Optional[str], build_min_bytes: int) -> Tuple[str, Optional[str]]:
+    """
+    Picks what to send for path given the client's Accept-Encoding. Returns
+    (file to send, Content-Encoding or None). Files of at least build_min_bytes
+    get a sidecar built when the client accepts an encoding that has none yet.
+    """
+    accepted = accepted_encodings(accept_encoding)
+    candidates = [
+        (encoding, suffix) for encoding, suffix in ENCODINGS
+        if encoding in accepted and (encoding != "zstd" or _zstd() is not None)
+    ]
+    candidates.sort(key=lambda candidate: -accepted[candidate[0]])
+
+    for encoding, suffix in candidates:
+        if _fresh(path + suffix, path):
+            return path + suffix, encoding
+    if candidates and os.path.getsize(path) >= build_min_bytes:
+        encoding, suffix = candidates[0]
+        _build_sidecar(path, encoding, path + suffix)
+        return path + suffix, encoding
+    return path, None
+
+
+def _build_line_index(path: str) -> Tuple[List[int], int]:
+    import numpy as np
+
+    starts = [0]
+    lines = 0
+    position = 0
+    ends_with_newline = True
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            newlines = np.flatnonzero(np.frombuffer(chunk, dtype=np.uint8) == 10)
+            # Line number n starts right after newline n-1; keep every LINE_INDEX_STEP-th
+            first = (-lines - 1) % LINE_INDEX_STEP
+            starts.extend((newlines[first::LINE_INDEX_STEP] + position + 1).tolist())
+            lines += len(newlines)
+            position += len(chunk)
+            ends_with_newline = chunk.endswith(b"\n")
+    # A final line without a newline still counts; an empty file has none
+    total = lines if ends_with_newline else lines + 1
+    if position == 0:
+        total = 0
+    return starts, total
+
+
+def line_index(path: str) -> Tuple[List[int], int]:
+    """Returns (byte offset of every LINE_INDEX_STEP-th line start, total lines) for path."""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    with _line_indexes_lock:
+        if key in _line_indexes:
+            _line_indexes.move_to_end(key)
+            return _line_indexes[key]
+
+    index = _build_line_index(path)
+    with _line_indexes_lock:
+        _line_indexes[key] = index
+        while len(_line_indexes) > _LINE_INDEX_CACHE:
+            _line_indexes.popitem(last=False)
+    return index
+
+
+def read_lines(path: str, offset: Optional[int] = None, limit: Optional[int] = None,
+               tail: Optional[int] = None) -> Tuple[bytes, int, int]:
+    """
+    Reads a window of lines (split on \\n): `limit` lines from `offset`, or the
+    last `tail` lines; at most MAX_WINDOW_LINES when no limit is given. Returns
+    (the lines joined by \\n, first line number, total lines).
+    """
+    starts, total = line_index(path)
+    if tail is not None:
+        offset = max(0, total - tail)
+        limit = tail
+    offset = min(offset or 0, total)
+    if limit is None:
+        limit = MAX_WINDOW_LINES
+    if offset == total:
+        # Past the last line; with a multiple of LINE_INDEX_STEP lines and no final
+        # newline the index has no entry for it
+        return b"", offset, total
+
+    lines = []
+    with open(path, "rb") as f:
+        f.seek(starts[offset // LINE_INDEX_STEP])
+        for _ in range(offset % LINE_INDEX_STEP):
+            f.readline()
+        for _ in range(min(limit, total - offset)):
+            lines.append(f.readline().rstrip(b"\n"))
+    return b"\n".join(lines), offset, total
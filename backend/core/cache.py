@@ -0,0 +1,227 @@
+"""
+Content-addressed cache of processing results.
+
+Entries are keyed by the SHA-256 of the uploaded bytes plus the processing
+fingerprint (processor version and discount rules), so changing the rules
+never serves a stale report. Each entry keeps one copy of the upload blob,
+report and error log on disk. Submissions get hard links to those files
+rather than copies, so a feed that is resent five times is stored once.
+Linked artifacts must be replaced, never modified in place (detach_file gives
+a submission its own copy first). The report's state file, kept for appends,
+and its error counts are cached along with the report when they exist, and so
+is the error log (files without rejected lines have none).
+
+An SQLite index tracks size and recency for LRU eviction across processes,
+and a small in-memory LRU in front of it answers repeat lookups.
+"""
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import BinaryIO, Dict, Optional
+
+from .ingest import CHUNK_SIZE
+from .metrics import CACHE_LOOKUPS
+from .processor import error_counts_path, processing_fingerprint, state_path
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    fingerprint TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries(last_used);
+"""
+
+_ARTIFACTS = ("blob", "output.txt")
+# Cached alongside the report when present: (name in the entry, path next to the report)
+_SIDECARS = (("state.json", state_path), ("errors.json", error_counts_path))
+_ERROR_LOG = "error.txt"
+
+
+def save_and_hash(source: BinaryIO, path: str) -> str:
+    """Streams source to path, hashing the bytes on the way. Returns the hex SHA-256."""
+    digest = hashlib.sha256()
+    with open(path, "wb") as f:
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+            f.write(chunk)
+    return digest.hexdigest()
+
+
+def link_file(source: str, target: str):
+    """Points target at source's data, via a hard link where the filesystem allows it."""
+    temp = f"{target}.link"
+    try:
+        os.link(source, temp)
+    except OSError:
+        shutil.copyfile(source, temp)
+    os.replace(temp, target)
+
+
+def detach_file(path: str):
+    """Gives path its own copy of the data if it shares it with other links, so it can be modified in place."""
+    if os.stat(path).st_nlink > 1:
+        temp = f"{path}.detach"
+        shutil.copyfile(path, temp)
+        os.replace(temp, path)
+
+
+class ResultCache:
+    """Bounded on-disk + in-memory LRU cache of (upload, report, error log) by content hash."""
+
+    def __init__(self, root: str, max_entries: int, max_bytes: int, memory_entries: int,
+                 fingerprint: Optional[str] = None):
+        self.root = root
+        self.fingerprint = fingerprint or processing_fingerprint()
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.memory_entries = memory_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        os.makedirs(root, exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(root, "index.db"), timeout=30, check_same_thread=False)
+        with self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def key(self, content_hash: str) -> str:
+        return f"{self.fingerprint}-{content_hash}"
+
+    def _entry_dir(self, key: str) -> str:
+        return os.path.join(self.root, key)
+
+    def _remember(self, key: str):
+        self._memory[key] = self._entry_dir(key)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+    def fetch(self, content_hash: str, upload_path: str, output_path: str, error_path: str) -> bool:
+        """
+        On a hit, links the cached blob, report and error log to the given paths
+        (replacing the freshly saved upload) and returns True. Returns False on a miss.
+        """
+        key = self.key(content_hash)
+        entry_dir = self._entry_dir(key)
+        with self._lock:
+            known = key in self._memory or self._conn.execute(
+                "SELECT 1 FROM entries WHERE key = ?", (key,)
+            ).fetchone() is not None
+            try:
+                if not known:
+                    raise FileNotFoundError(key)
+                for name, target in zip(_ARTIFACTS, (upload_path, output_path)):
+                    link_file(os.path.join(entry_dir, name), target)
+                for name, sidecar_path in _SIDECARS:
+                    if os.path.exists(os.path.join(entry_dir, name)):
+                        link_file(os.path.join(entry_dir, name), sidecar_path(output_path))
+                if os.path.exists(os.path.join(entry_dir, _ERROR_LOG)):
+                    link_file(os.path.join(entry_dir, _ERROR_LOG), error_path)
+            except FileNotFoundError:
+                # Unknown, or evicted by another worker since we last saw it
+                self._memory.pop(key, None)
+                self.misses += 1
+                CACHE_LOOKUPS.inc(result="miss")
+                return False
+
+            with self._conn:
+                self._conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._remember(key)
+            self.hits += 1
+            CACHE_LOOKUPS.inc(result="hit")
+            return True
+
+    def add(self, content_hash: str, upload_path: str, output_path: str, error_path: str):
+        """Adds a freshly processed file to the cache, then evicts down to the size limits."""
+        key = self.key(content_hash)
+        entry_dir = self._entry_dir(key)
+        temp_dir = f"{entry_dir}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(temp_dir, exist_ok=True)
+        size = 0
+        for name, source in zip(_ARTIFACTS, (upload_path, output_path)):
+            link_file(source, os.path.join(temp_dir, name))
+            size += os.path.getsize(source)
+        optional = [(name, sidecar_path(output_path)) for name, sidecar_path in _SIDECARS]
+        for name, source in optional + [(_ERROR_LOG, error_path)]:
+            if os.path.exists(source):
+                link_file(source, os.path.join(temp_dir, name))
+                size += os.path.getsize(source)
+
+        with self._lock:
+            try:
+                os.rename(temp_dir, entry_dir)
+            except OSError:
+                # Another request cached the same content first
+                shutil.rmtree(temp_dir, ignore_errors=True)
+                return
+            with self._conn:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO entries (key, fingerprint, size, last_used) VALUES (?, ?, ?, ?)",
+                    (key, self.fingerprint, size, time.time()),
+                )
+            self._remember(key)
+            self._evict()
+
+    def _remove(self, key: str):
+        self._memory.pop(key, None)
+        shutil.rmtree(self._entry_dir(key), ignore_errors=True)
+        self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+
+    def _evict(self):
+        count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+        with self._conn:
+            for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+                if count <= self.max_entries and total <= self.max_bytes:
+                    break
+                self._remove(key)
+                count -= 1
+                total -= size
+                self.evictions += 1
+
+    def purge_stale(self) -> int:
+        """Drops entries built under a different fingerprint (old processor or rules). Returns how many."""
+        with self._lock, self._conn:
+            stale = [
+                key for (key,) in self._conn.execute(
+                    "SELECT key FROM entries WHERE fingerprint != ?", (self.fingerprint,)
+                ).fetchall()
+            ]
+            for key in stale:
+                self._remove(key)
+        return len(stale)
+
+    def clear(self) -> int:
+        """Drops every entry. Returns how many."""
+        with self._lock, self._conn:
+            keys = [key for (key,) in self._conn.execute("SELECT key FROM entries").fetchall()]
+            for key in keys:
+                self._remove(key)
+        return len(keys)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": count,
+                "bytes": total,
+                "memory_entries": len(self._memory),
+                "fingerprint": self.fingerprint,
+            }
@@ -0,0 +1,66 @@
+"""Runtime settings, read from environment variables so they can be tuned per deployment."""
+import os
+
+
+def _int_env(name: str, default: int) -> int:
+    value = os.environ.get(name, "").strip()
+    if not value:
+        return default
+    if value.lower() == "auto":
+        return os.cpu_count() or 1
+    return int(value)
+
+
+# Root of the uploads/outputs/errors directories and the submission store
+DATA_DIR = os.environ.get("ORDER_DATA_DIR", "backend/data")
+
+# Submission store backend: "sqlite" (indexed, transactional) or "json" (legacy history.json)
+STORE_BACKEND = os.environ.get("ORDER_STORE_BACKEND", "sqlite")
+
+# Size of the process pool used for uploads. 0 processes files serially in the API process,
+# "auto" uses one worker per CPU core.
+PROCESS_WORKERS = _int_env("ORDER_PROCESS_WORKERS", 0)
+
+# Files at least this large are split into line-aligned byte ranges processed in parallel
+PARALLEL_SPLIT_BYTES = _int_env("ORDER_PARALLEL_SPLIT_BYTES", 64 * 1024 * 1024)
+
+# Content-addressed result cache for re-uploaded files
+CACHE_ENABLED = os.environ.get("ORDER_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+CACHE_MAX_ENTRIES = _int_env("ORDER_CACHE_MAX_ENTRIES", 10_000)
+CACHE_MAX_BYTES = _int_env("ORDER_CACHE_MAX_BYTES", 1024 * 1024 * 1024)
+CACHE_MEMORY_ENTRIES = _int_env("ORDER_CACHE_MEMORY_ENTRIES", 1024)
+
+# Background jobs for POST /api/upload?mode=async: worker threads, and how many files may wait
+JOB_WORKERS = _int_env("ORDER_JOB_WORKERS", 2)
+JOB_QUEUE_SIZE = _int_env("ORDER_JOB_QUEUE_SIZE", 100)
+
+# Reports and error logs at least this large get a compressed copy built on first download
+COMPRESS_MIN_BYTES = _int_env("ORDER_COMPRESS_MIN_BYTES", 1024 * 1024)
+
+# Error log size: at most this many errors are written per file (0 writes all of them), and
+# with a sample rate of n only every n-th error is. Error counts always cover every line.
+ERROR_LOG_LIMIT = _int_env("ORDER_ERROR_LOG_LIMIT", 0)
+ERROR_LOG_SAMPLE = _int_env("ORDER_ERROR_LOG_SAMPLE", 1)
+
+# Stage timings and counters for GET /metrics; off skips the timing calls altogether
+METRICS_ENABLED = os.environ.get("ORDER_METRICS_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Where POST /api/upload?profile=true writes cProfile dumps; profiling is refused while unset
+PROFILE_DIR = os.environ.get("ORDER_PROFILE_DIR", "")
+
+# How order totals are added up: "float" (dollars as floats) or "cents" (exact integer cents)
+MONEY_MODE = os.environ.get("ORDER_MONEY_MODE", "float").strip().lower()
+
+# Retention (POST /api/admin/retention): submissions older than RETENTION_DAYS are deleted, the
+# files of those older than ARCHIVE_AFTER_DAYS are packed into one zip per submission, and the
+# oldest are deleted while the data directories hold more than RETENTION_MAX_BYTES. 0 is off.
+RETENTION_DAYS = _int_env("ORDER_RETENTION_DAYS", 0)
+RETENTION_MAX_BYTES = _int_env("ORDER_RETENTION_MAX_BYTES", 0)
+ARCHIVE_AFTER_DAYS = _int_env("ORDER_ARCHIVE_AFTER_DAYS", 0)
+
+# Encoding of uploaded order files: "auto" (UTF-8, or UTF-16 with a byte order mark, with Latin-1
+# for lines that aren't UTF-8) or a codec name, e.g. "cp1252"
+INPUT_ENCODING = os.environ.get("ORDER_INPUT_ENCODING", "auto").strip().lower() or "auto"
+
+# JSON file of discount rules (see backend/core/rules.py); unset applies 10% off line totals above $500
+DISCOUNT_RULES = os.environ.get("ORDER_DISCOUNT_RULES", "")
@@ -0,0 +1,203 @@
+"""
+Machine-readable exports of processing results.
+
+Besides the text report, a processed file can be exported as JSON, CSV,
+Parquet or Arrow (IPC file), either as the per-customer summary (built from the
+saved report state) or as the per-order rows (re-read from the stored upload).
+Exports are written on first request next to the report, as
+{report name}.{rows}.{processing fingerprint}.{ext}, and reused until the
+report state or upload they were built from changes. The fingerprint in the
+name means a change of discount rules or money mode builds new ones. Parquet
+and Arrow need pyarrow. JSON has no NaN or infinities, so those are written as
+null.
+"""
+import csv
+import json
+import math
+import os
+import threading
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from .ingest import iter_lines, mapped_chunks
+from .processor import PRICE_SCALE, load_state, parse_order_fields, pricing, processing_fingerprint, state_path
+
+# format -> (media type, file extension)
+FORMATS: Dict[str, Tuple[str, str]] = {
+    "json": ("application/json", "json"),
+    "csv": ("text/csv", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.file", "arrow"),
+}
+ROWS = ("summary", "orders")
+
+SUMMARY_COLUMNS = ("customer_name", "order_count", "total_items", "gross_total", "total_discount", "net_total")
+ORDER_COLUMNS = ("order_id", "customer_name", "product_name", "quantity", "unit_price", "order_date",
+                 "line_total", "discount_amount", "net_total")
+
+# Rows per Arrow record batch when streaming orders
+_BATCH_ROWS = 65_536
+
+
+def format_for_media_type(accept: Optional[str]) -> Optional[str]:
+    """The first export format named in an Accept header, or None."""
+    if not accept:
+        return None
+    for part in accept.split(","):
+        media_type = part.split(";")[0].strip().lower()
+        for fmt, (known, _) in FORMATS.items():
+            if media_type == known:
+                return fmt
+    return None
+
+
+def export_path(output_path: str, rows: str, fmt: str) -> str:
+    return f"{os.path.splitext(output_path)[0]}.{rows}.{processing_fingerprint()}.{FORMATS[fmt][1]}"
+
+
+def _order_rows(upload_path: str) -> Iterator[tuple]:
+    parse_price, totals_of = pricing()
+    for line in iter_lines(mapped_chunks(upload_path)):
+        if not line.strip():
+            continue
+        record, error = parse_order_fields(line, parse_price=parse_price)
+        if error:
+            continue
+        totals = totals_of(record)
+        if parse_price is float:
+            yield (
+                record.order_id, record.customer_name, record.product_name, record.quantity, record.unit_price,
+                record.order_date.isoformat(), *totals
+            )
+        else:
+            # Cents mode: exact ints in the state and arithmetic, dollars in the export
+            yield (
+                record.order_id, record.customer_name, record.product_name, record.quantity,
+                record.unit_price / PRICE_SCALE, record.order_date.isoformat(), *(cents / 100 for cents in totals)
+            )
+
+
+def _summary_rows(state: Dict) -> List[list]:
+    if state.get("money") != "cents":
+        return state["customers"]
+    return [[name, orders, items, *(cents / 100 for cents in money)]
+            for name, orders, items, *money in state["customers"]]
+
+
+def _grand_total(state: Dict) -> Dict[str, float]:
+    gross, discount, net = state["grand_total"]
+    if state.get("money") == "cents":
+        gross, discount, net = gross / 100, discount / 100, net / 100
+    return {"gross_total": gross, "total_discount": discount, "net_total": net}
+
+
+def _json_values(values) -> list:
+    # nan and infinite prices are accepted input, but json.dumps would write them as bare NaN/Infinity
+    return [None if isinstance(value, float) and not math.isfinite(value) else value for value in values]
+
+
+def _write_json(path: str, columns, rows, grand_total: Optional[Dict]):
+    with open(path, "w") as f:
+        f.write('{"columns": ')
+        f.write(json.dumps(list(columns)))
+        if grand_total is not None:
+            f.write(', "grand_total": ')
+            f.write(json.dumps(dict(zip(grand_total, _json_values(grand_total.values()))), allow_nan=False))
+        f.write(', "rows": [')
+        for i, row in enumerate(rows):
+            if i:
+                f.write(", ")
+            f.write(json.dumps(_json_values(row), allow_nan=False))
+        f.write("]}")
+
+
+def _write_csv(path: str, columns, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(rows)
+
+
+def _arrow_schema(columns, grand_total: Optional[Dict]):
+    import pyarrow as pa
+
+    types = {
+        "order_id": pa.string(), "customer_name": pa.string(), "product_name": pa.string(),
+        "order_date": pa.string(), "quantity": pa.int64(), "order_count": pa.int64(), "total_items": pa.int64(),
+    }
+    metadata = {"grand_total": json.dumps(grand_total)} if grand_total is not None else None
+    return pa.schema([(name, types.get(name, pa.float64())) for name in columns], metadata=metadata)
+
+
+def _batches(schema, rows) -> Iterator:
+    import pyarrow as pa
+
+    batch: List[tuple] = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == _BATCH_ROWS:
+            yield pa.record_batch(list(map(list, zip(*batch))), schema=schema)
+            batch = []
+    if batch:
+        yield pa.record_batch(list(map(list, zip(*batch))), schema=schema)
+
+
+def _write_arrow(path: str, fmt: str, columns, rows, grand_total: Optional[Dict]):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = _arrow_schema(columns, grand_total)
+    if fmt == "parquet":
+        writer = pq.ParquetWriter(path, schema)
+    else:
+        writer = pa.ipc.new_file(path, schema)
+    with writer:
+        for batch in _batches(schema, rows):
+            writer.write_batch(batch)
+
+
+def _source_path(upload_path: str, output_path: str, rows: str) -> str:
+    # What the export is built from; a newer source means the export is stale
+    return state_path(output_path) if rows == "summary" else upload_path
+
+
+def ensure_export(upload_path: str, output_path: str, rows: str, fmt: str) -> Optional[str]:
+    """
+    Returns the path of the export, writing it first if it is missing or older
+    than its source. Returns None if the source is missing (no upload, or no
+    saved state for a summary). Raises ImportError for Parquet/Arrow without pyarrow.
+    """
+    if rows not in ROWS or fmt not in FORMATS:
+        raise ValueError(f"Unknown export: {rows} as {fmt}")
+
+    source = _source_path(upload_path, output_path, rows)
+    path = export_path(output_path, rows, fmt)
+    try:
+        if os.stat(path).st_mtime_ns >= os.stat(source).st_mtime_ns:
+            return path
+    except OSError:
+        pass
+
+    if rows == "summary":
+        state = load_state(output_path)
+        if state is None:
+            return None
+        columns, data, grand_total = SUMMARY_COLUMNS, _summary_rows(state), _grand_total(state)
+    else:
+        if not os.path.exists(upload_path):
+            return None
+        columns, data, grand_total = ORDER_COLUMNS, _order_rows(upload_path), None
+
+    temp = f"{path}.{threading.get_ident()}.tmp"
+    try:
+        if fmt == "json":
+            _write_json(temp, columns, data, grand_total)
+        elif fmt == "csv":
+            _write_csv(temp, columns, data)
+        else:
+            _write_arrow(temp, fmt, columns, data, grand_total)
+        os.replace(temp, path)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+    return path
+
@@ -0,0 +1,220 @@
+"""
+Reading order files.
+
+Stored uploads are memory-mapped and read in windows that end on a line break,
+found on the raw bytes, so a file is never held (or copied) whole: each window
+is decoded in one call and split into lines. Streams (an upload being saved,
+or chunks handed in by a caller) go through the same splitting, carrying any
+partial line over to the next chunk.
+
+Encodings (ORDER_INPUT_ENCODING):
+
+- "auto" (the default): a UTF-16 byte order mark selects UTF-16. Anything
+  else is read as UTF-8 (without its byte order mark, if it has one), and
+  lines that aren't valid UTF-8 are read as Latin-1, so mixed or legacy
+  exports decode instead of failing the upload.
+- any codec name Python knows: bytes that don't decode become U+FFFD. A UTF-8
+  byte order mark is still dropped when the codec is UTF-8.
+
+Whatever the encoding, \\n, \\r\\n and \\r all end a line, wherever they fall
+between reads.
+"""
+import codecs
+import mmap
+import os
+import time
+from typing import Callable, Iterable, Iterator, Optional, Tuple
+
+from . import config
+from .metrics import FileMetrics
+
+AUTO = "auto"
+
+# Lines that aren't UTF-8 in auto mode; every byte decodes in it
+FALLBACK_ENCODING = "latin-1"
+
+# Read size used when streaming from file objects, and the window size for mapped files
+CHUNK_SIZE = 1024 * 1024
+
+_BOMS = ((codecs.BOM_UTF8, AUTO), (codecs.BOM_UTF16_LE, "utf-16"), (codecs.BOM_UTF16_BE, "utf-16"))
+_BOM_BYTES = max(len(bom) for bom, _ in _BOMS)
+
+
+def configured_encoding() -> str:
+    """The configured input encoding (ORDER_INPUT_ENCODING), "auto" or a codec name."""
+    encoding = config.INPUT_ENCODING
+    if encoding != AUTO:
+        codecs.lookup(encoding)
+    return encoding
+
+
+def detect_encoding(head: bytes, encoding: Optional[str] = None) -> Tuple[str, int]:
+    """
+    The encoding to read data starting with head in ("auto" or a codec name), and
+    the number of byte order mark bytes to skip. encoding None means the configured one.
+    """
+    encoding = encoding or configured_encoding()
+    if encoding == AUTO:
+        for bom, name in _BOMS:
+            if head.startswith(bom):
+                # The UTF-16 codec reads its own byte order mark
+                return name, len(bom) if name == AUTO else 0
+        return AUTO, 0
+    if head.startswith(codecs.BOM_UTF8) and codecs.lookup(encoding).name == "utf-8":
+        return encoding, len(codecs.BOM_UTF8)
+    return encoding, 0
+
+
+def file_encoding(path: str, encoding: Optional[str] = None) -> str:
+    """The encoding a stored file is read in, from its first bytes; for reading parts of it."""
+    with open(path, "rb") as f:
+        return detect_encoding(f.read(_BOM_BYTES), encoding)[0]
+
+
+def splits_on_bytes(encoding: str) -> bool:
+    """Whether line breaks in this encoding are the bytes \\n and \\r, so lines can be found before decoding."""
+    if encoding == AUTO:
+        return True
+    return "\r\n".encode(encoding) == b"\r\n" and "\r\n".encode(encoding, "replace") == b"\r\n"
+
+
+def _decoder(encoding: str) -> Callable[[bytes], str]:
+    if encoding != AUTO:
+        return lambda data: data.decode(encoding, "replace")
+
+    def decode_line(line: bytes) -> str:
+        try:
+            return line.decode("utf-8")
+        except UnicodeDecodeError:
+            return line.decode(FALLBACK_ENCODING)
+
+    def decode(data: bytes) -> str:
+        try:
+            return data.decode("utf-8")
+        except UnicodeDecodeError:
+            # Only the lines that aren't UTF-8 fall back
+            return "".join(decode_line(line) for line in data.splitlines(keepends=True))
+
+    return decode
+
+
+def _whole_lines(data: bytes) -> int:
+    """How many leading bytes of data are whole lines. A \\r at the very end might still be followed by \\n."""
+    end = data.rfind(b"\n") + 1
+    if not end:
+        end = data.rfind(b"\r", 0, len(data) - 1) + 1
+    return end
+
+
+def _split(text: str):
+    if "\r" in text:
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return text.split("\n")
+
+
+def mapped_chunks(path: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+    """
+    Yields the bytes of a file from start to end (the end of the file by default)
+    in windows of about CHUNK_SIZE that end right after a \\n, read through a
+    memory map. A window without any \\n is yielded as it is.
+    """
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        end = size if end is None else min(end, size)
+        if start >= end:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            position = start
+            while position < end:
+                stop = min(position + CHUNK_SIZE, end)
+                if stop < end:
+                    stop = mapped.rfind(b"\n", position, stop) + 1 or stop
+                yield mapped[position:stop]
+                position = stop
+
+
+def iter_lines(source, encoding: Optional[str] = None, metrics: Optional[FileMetrics] = None) -> Iterator[str]:
+    """
+    An iterator over the lines of a file object or an iterable of chunks, bytes
+    or text, without holding the whole file; after a final line break an empty string is
+    the last line. Bytes are decoded as described above, with encoding (or the
+    configured one) deciding; text chunks are only split on \\n, matching
+    content.split('\\n'). Decoding and splitting time goes to metrics' decode stage, if given.
+    """
+    if hasattr(source, "read"):
+        chunks = iter(lambda: source.read(CHUNK_SIZE), source.read(0))
+    else:
+        chunks = iter(source)
+    # The byte order mark needs the first few bytes, however the chunks were cut. Returning
+    # the generator for the rest, rather than yielding from it, saves a step on every line.
+    head = b""
+    for chunk in chunks:
+        if not isinstance(chunk, (bytes, bytearray, memoryview)):
+            return _text_lines(chunk, chunks, metrics)
+        head += chunk
+        if len(head) >= _BOM_BYTES:
+            break
+
+    encoding, skip = detect_encoding(head[:_BOM_BYTES], encoding)
+    head = head[skip:]
+    if splits_on_bytes(encoding):
+        return _byte_lines(head, chunks, _decoder(encoding), metrics)
+    return _decoded_lines(head, chunks, encoding, metrics)
+
+
+def _text_lines(first: str, chunks: Iterable[str], metrics: Optional[FileMetrics]) -> Iterator[str]:
+    pending = ""
+    for chunk in _chain(first, chunks):
+        start = time.perf_counter() if metrics is not None else 0.0
+        if not chunk:
+            continue
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        if metrics is not None:
+            metrics.add("decode", time.perf_counter() - start)
+        yield from lines
+    yield from pending.split("\n")
+
+
+def _byte_lines(first: bytes, chunks: Iterable[bytes], decode, metrics: Optional[FileMetrics]) -> Iterator[str]:
+    pending = b""
+    for chunk in _chain(first, chunks):
+        start = time.perf_counter() if metrics is not None else 0.0
+        if not chunk:
+            continue
+        data = pending + chunk if pending else bytes(chunk)
+        end = _whole_lines(data)
+        if not end:
+            pending = data
+            continue
+        pending = data[end:]
+        # Whole lines end with a line break, the empty string after it isn't a line yet
+        lines = _split(decode(data[:end]))
+        lines.pop()
+        if metrics is not None:
+            metrics.add("decode", time.perf_counter() - start)
+        yield from lines
+    yield from _split(decode(pending))
+
+
+def _decoded_lines(first: bytes, chunks: Iterable[bytes], encoding: str, metrics: Optional[FileMetrics]) -> Iterator[str]:
+    # Line breaks take more than one byte here, so chunks are decoded before they are split
+    decoder = codecs.getincrementaldecoder(encoding)("replace")
+    pending = ""
+    for chunk in _chain(first, chunks):
+        start = time.perf_counter() if metrics is not None else 0.0
+        text = pending + decoder.decode(chunk)
+        # Held back in case the \n of a \r\n is in the next chunk
+        keep = 1 if text.endswith("\r") else 0
+        lines = _split(text[:len(text) - keep])
+        pending = lines.pop() + text[len(text) - keep:]
+        if metrics is not None:
+            metrics.add("decode", time.perf_counter() - start)
+        yield from lines
+    yield from _split(pending + decoder.decode(b"", final=True))
+
+
+def _chain(first, chunks):
+    if first:
+        yield first
+    yield from chunks
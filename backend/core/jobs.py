@@ -0,0 +1,143 @@
+"""
+Background processing jobs.
+
+A JobManager runs file tasks on a fixed number of worker threads fed from a
+bounded queue. A submission is accepted only if all its files fit in the
+queue, so a burst of uploads is turned away with QueueFullError instead of
+piling up. Each job keeps a status record (per-file state, lines and bytes
+processed) that the API serves for polling and server-sent events. Finished
+jobs are remembered up to a fixed count.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, List, Optional
+
+
+class QueueFullError(Exception):
+    """Raised when a submission doesn't fit in the job queue."""
+
+
+# Called with (job, file_status) on a worker thread; updates file_status as it goes
+FileTask = Callable[[Dict, Dict], None]
+# Called with a snapshot of the finished job on the worker thread that completed its last file
+JobCallback = Callable[[Dict], None]
+
+
+class JobManager:
+    def __init__(self, workers: int, max_queue: int, keep_finished: int = 1000):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.keep_finished = keep_finished
+        self._tasks: deque = deque()
+        self._jobs: "OrderedDict[str, Dict]" = OrderedDict()
+        self._cond = threading.Condition()
+        self._threads: List[threading.Thread] = []
+
+    def _start(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._work, name=f"job-worker-{len(self._threads)}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def queue_depth(self) -> int:
+        with self._cond:
+            return len(self._tasks)
+
+    def can_accept(self, file_count: int) -> bool:
+        with self._cond:
+            return len(self._tasks) + file_count <= self.max_queue
+
+    def submit(self, job_id: str, timestamp: str, files: List[Dict], task: FileTask,
+               on_complete: Optional[JobCallback] = None) -> Dict:
+        """
+        Queues one task per file. files are dicts with at least id and filename.
+        Returns a snapshot of the new job. Raises QueueFullError if the queue can't take them all.
+        """
+        job = {
+            "id": job_id,
+            "timestamp": timestamp,
+            "status": "queued",
+            "files": [
+                dict(f, status="queued", lines_processed=0, bytes_processed=0, error_count=None, detail=None)
+                for f in files
+            ],
+            "version": 0,
+            "_remaining": len(files),
+            "_on_complete": on_complete,
+        }
+        with self._cond:
+            if len(self._tasks) + len(files) > self.max_queue:
+                raise QueueFullError(f"Job queue is full ({len(self._tasks)}/{self.max_queue} files waiting)")
+            self._jobs[job_id] = job
+            self._forget_finished()
+            for file_status in job["files"]:
+                self._tasks.append((job, file_status, task))
+            self._start()
+            self._cond.notify_all()
+            return self._snapshot(job)
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] in ("completed", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.keep_finished)]:
+            del self._jobs[job_id]
+
+    def _snapshot(self, job: Dict) -> Dict:
+        return {key: copy.deepcopy(value) for key, value in job.items() if not key.startswith("_")}
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job is not None else None
+
+    def update(self, job: Dict, file_status: Dict, **changes):
+        """Records progress for one file; used by tasks from worker threads."""
+        with self._cond:
+            file_status.update(changes)
+            job["version"] += 1
+            self._cond.notify_all()
+
+    def _work(self):
+        while True:
+            with self._cond:
+                while not self._tasks:
+                    self._cond.wait()
+                job, file_status, task = self._tasks.popleft()
+                job["status"] = "processing"
+                file_status["status"] = "processing"
+                job["version"] += 1
+                self._cond.notify_all()
+
+            try:
+                task(job, file_status)
+                changes = {"status": "completed"}
+            except Exception as e:
+                changes = {"status": "failed", "detail": str(e)}
+
+            with self._cond:
+                file_status.update(changes)
+                job["_remaining"] -= 1
+                finished = job["_remaining"] == 0
+                job["version"] += 1
+                self._cond.notify_all()
+
+            if finished:
+                self._finish(job)
+
+    def _finish(self, job: Dict):
+        status = "failed" if all(f["status"] == "failed" for f in job["files"]) else "completed"
+        # Run the callback (e.g. recording the submission) before clients can see the job as done
+        on_complete = job["_on_complete"]
+        if on_complete is not None:
+            try:
+                on_complete(dict(self.get(job["id"]), status=status))
+            except Exception as e:
+                status = "failed"
+                job["detail"] = str(e)
+
+        with self._cond:
+            job["status"] = status
+            job["finished_at"] = time.time()
+            job["version"] += 1
+            self._cond.notify_all()
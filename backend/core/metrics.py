@@ -0,0 +1,226 @@
+"""
+Processing metrics and profiling.
+
+Counters and histograms live in a process-wide registry and are rendered in
+the Prometheus text format for GET /metrics. Processing a file fills in a
+FileMetrics with the time spent in each stage and records it once the file is
+done. Decode, render and persist are timed around whole chunks or files; the
+per-line stages (parse, totals, aggregate) are timed on one line in
+LINE_SAMPLE_EVERY and scaled up, so the per-line cost stays a single integer
+comparison. Files handed to the process pool are counted but not timed, since
+their work happens in another process.
+
+profiled() runs one call under cProfile and dumps the stats where
+ORDER_PROFILE_DIR points, for pstats, snakeviz or flameprof.
+"""
+import bisect
+import cProfile
+import io
+import logging
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Stages a file goes through, in order
+STAGES = ("upload_write", "decode", "parse", "totals", "aggregate", "render", "persist")
+
+# One line in this many has its parse/totals/aggregate steps timed
+LINE_SAMPLE_EVERY = 64
+
+_SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+_registry: List["_Metric"] = []
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _label_text(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)) + "}"
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels[name]) for name in self.labels)
+
+    def samples(self) -> Iterator[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels: str):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield f"{self.name}{_label_text(self.labels, key)} {_number(value)}"
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = _SECONDS_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+        # labels -> (count per bucket, with one more for +Inf; sum)
+        self._values: Dict[Tuple[str, ...], Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels: str):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    def count(self, **labels: str) -> int:
+        counts, _ = self._values.get(self._key(labels)) or ([0], 0.0)
+        return sum(counts)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        for key, (counts, total) in values:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                labels = _label_text((*self.labels, "le"), (*key, _number(bound)))
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            yield f"{self.name}_sum{_label_text(self.labels, key)} {_number(total)}"
+            yield f"{self.name}_count{_label_text(self.labels, key)} {cumulative}"
+
+
+STAGE_SECONDS = Histogram("order_stage_seconds", "Time spent on one file in each processing stage.", ("stage",))
+FILE_SECONDS = Histogram("order_file_seconds", "Time to store and process one uploaded file, end to end.")
+FILES = Counter("order_files_total", "Files processed, by how: inline, pool, append or cache.", ("mode",))
+LINES = Counter("order_lines_total", "Order file lines read.")
+ERRORS = Counter("order_errors_total", "Order lines rejected, by error category.", ("category",))
+BYTES = Counter("order_bytes_total", "Upload bytes processed.")
+CACHE_LOOKUPS = Counter("order_cache_lookups_total", "Result cache lookups, by result.", ("result",))
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format."""
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+class FileMetrics:
+    """Stage times for one file, recorded into the registry by finish()."""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = dict.fromkeys(STAGES, 0.0)
+        self.lines = 0
+        self.errors: Dict[str, int] = {}
+        self._sampled_lines = 0
+        self._sampled: Dict[str, float] = {"parse": 0.0, "totals": 0.0, "aggregate": 0.0}
+
+    def add(self, stage: str, seconds: float):
+        self.seconds[stage] += seconds
+
+    @contextmanager
+    def stage(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[stage] += time.perf_counter() - start
+
+    def sample_line(self, parse: float, totals: float, aggregate: float):
+        """Adds the step times of one sampled line."""
+        self._sampled_lines += 1
+        self._sampled["parse"] += parse
+        self._sampled["totals"] += totals
+        self._sampled["aggregate"] += aggregate
+
+    def estimate_lines(self, lines: int):
+        """Scales the sampled step times up to `lines` lines."""
+        if self._sampled_lines:
+            scale = lines / self._sampled_lines
+            for stage, seconds in self._sampled.items():
+                self.seconds[stage] += seconds * scale
+        self._sampled_lines = 0
+        self._sampled = dict.fromkeys(self._sampled, 0.0)
+
+    def count(self, lines: int, errors: Dict[str, int]):
+        """Adds lines read and errors per category."""
+        self.lines += lines
+        for category, count in errors.items():
+            self.errors[category] = self.errors.get(category, 0) + count
+
+    def finish(self, mode: str, bytes_read: int, elapsed: float):
+        """Records this file (processed inline, on the pool, or appended to): stage times, end-to-end time and counts."""
+        for stage, seconds in self.seconds.items():
+            if seconds:
+                STAGE_SECONDS.observe(seconds, stage=stage)
+        FILE_SECONDS.observe(elapsed)
+        FILES.inc(mode=mode)
+        LINES.inc(self.lines)
+        BYTES.inc(bytes_read)
+        for category, count in self.errors.items():
+            ERRORS.inc(count, category=category)
+        logger.info(
+            "Processed %d lines (%d bytes, %d errors, %s) in %.3fs: %s",
+            self.lines, bytes_read, sum(self.errors.values()), mode, elapsed,
+            ", ".join(f"{stage} {seconds:.3f}s" for stage, seconds in self.seconds.items() if seconds) or "not timed",
+        )
+
+
+def profiled(directory: str, name: str, fn: Callable, *args, **kwargs):
+    """
+    Calls fn under cProfile and writes the stats to {directory}/{name}.prof
+    (binary pstats) and {name}.txt (the top functions by cumulative time).
+    Returns fn's result.
+    """
+    profile = cProfile.Profile()
+    try:
+        return profile.runcall(fn, *args, **kwargs)
+    finally:
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, name)
+        profile.dump_stats(f"{path}.prof")
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).sort_stats("cumulative").print_stats(40)
+        with open(f"{path}.txt", "w") as f:
+            f.write(summary.getvalue())
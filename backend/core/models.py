@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from datetime import date
+from datetime import date, datetime
 from typing import List, Optional
 
 class Order(BaseModel):
@@ -28,3 +28,10 @@ class ProcessingResult(BaseModel):
     grand_total_gross: float
     grand_total_discount: float
     grand_total_net: float
+
+class SubmissionSelection(BaseModel):
+    """Submissions picked for a bulk operation: the given ids, narrowed by time range and filename if set."""
+    ids: Optional[List[str]] = None
+    since: Optional[datetime] = None
+    until: Optional[datetime] = None
+    filename: Optional[str] = None
@@ -0,0 +1,131 @@
+"""
+Multi-core processing on a process pool.
+
+Small files are processed whole by a pool worker. In cents mode, large files
+are cut into line-aligned byte ranges that are aggregated in parallel and
+merged back in range order, so customer first-appearance order and error-log
+line order are the same as a serial run. Error-log limits and sampling are
+applied at the merge too, over the errors in file order. Float totals are only
+the same as a serial run's when they are summed in the same order, which
+adding partial sums at a merge doesn't do, so in float mode every file is
+processed whole.
+"""
+import os
+import shutil
+from concurrent.futures import Executor, ProcessPoolExecutor, wait
+from typing import List, Optional, Tuple
+
+from . import config
+from .ingest import file_encoding, mapped_chunks, splits_on_bytes
+from .processor import (
+    Aggregator, ErrorCounts, ErrorLog, aggregate_stream, money_mode, new_aggregator, process_file, save_results,
+)
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def get_executor() -> Optional[ProcessPoolExecutor]:
+    """Returns the shared process pool, or None when ORDER_PROCESS_WORKERS is 0."""
+    global _executor
+    if config.PROCESS_WORKERS <= 0:
+        return None
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=config.PROCESS_WORKERS)
+    return _executor
+
+
+def shutdown_executor():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown()
+        _executor = None
+
+
+def split_ranges(path: str, parts: int) -> List[Tuple[int, int]]:
+    """Splits a file into at most `parts` (start, end) byte ranges that begin at line starts."""
+    size = os.path.getsize(path)
+    if parts <= 1 or size == 0:
+        return [(0, size)]
+
+    bounds = [0]
+    with open(path, "rb") as f:
+        for i in range(1, parts):
+            target = size * i // parts
+            if target <= bounds[-1]:
+                continue
+            # Finish the line that straddles the target; ranges split after \n so \r\n pairs stay whole
+            f.seek(target - 1)
+            f.readline()
+            boundary = f.tell()
+            if boundary >= size:
+                break
+            if boundary > bounds[-1]:
+                bounds.append(boundary)
+    bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def process_range(path: str, start: int, end: int, error_path: str,
+                  encoding: Optional[str] = None) -> Tuple[Aggregator, ErrorCounts]:
+    """Pool worker: aggregates one byte range, writing all of its errors to error_path."""
+    with ErrorLog(error_path) as error_log:
+        return aggregate_stream(mapped_chunks(path, start, end), error_log, encoding, errors=ErrorCounts())
+
+
+def process_file_parallel(executor: Executor, workers: int, upload_path: str, output_path: str,
+                          error_path: str, encoding: Optional[str] = None,
+                          split_bytes: Optional[int] = None) -> int:
+    """
+    Processes a stored upload on the pool. Files smaller than split_bytes
+    (ORDER_PARALLEL_SPLIT_BYTES by default) go to a single worker, bigger ones
+    are split across `workers` ranges in cents mode. Returns the error count.
+    """
+    if split_bytes is None:
+        split_bytes = config.PARALLEL_SPLIT_BYTES
+
+    # Ranges past the first don't see the byte order mark, and are cut on \n bytes
+    encoding = file_encoding(upload_path, encoding)
+    if workers <= 1 or os.path.getsize(upload_path) < split_bytes or not splits_on_bytes(encoding) \
+            or money_mode() != "cents":
+        return executor.submit(process_file, upload_path, output_path, error_path, encoding).result()
+
+    ranges = split_ranges(upload_path, workers)
+    part_paths = [f"{error_path}.part{i}" for i in range(len(ranges))]
+    futures = [
+        executor.submit(process_range, upload_path, start, end, part_path, encoding)
+        for (start, end), part_path in zip(ranges, part_paths)
+    ]
+
+    aggregator = new_aggregator()
+    errors = ErrorCounts.configured()
+    try:
+        with ErrorLog(error_path) as error_log:
+            for future, part_path in zip(futures, part_paths):
+                partial, partial_errors = future.result()
+                aggregator.merge(partial)
+                first = errors.total
+                errors.merge(partial_errors)
+                if not partial_errors.total:
+                    continue
+                with open(part_path, "r") as part:
+                    if errors.complete:
+                        if errors.logged:
+                            error_log.write("\n")
+                        shutil.copyfileobj(part, error_log)
+                        errors.logged += partial_errors.total
+                        continue
+                    for index, message in enumerate(part, first):
+                        if errors.admit(index):
+                            if errors.logged > 1:
+                                error_log.write("\n")
+                            error_log.write(message.rstrip("\n"))
+    finally:
+        for future in futures:
+            future.cancel()
+        wait(futures)
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    save_results(aggregator, errors, upload_path, output_path)
+    return errors.total
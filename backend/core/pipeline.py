@@ -0,0 +1,212 @@
+"""
+Per-file upload pipeline.
+
+Everything here is blocking and meant to run on a worker thread. The uploaded
+bytes are read once: every chunk is written to disk, hashed and fed to the
+processor in the same pass, so nothing is read back from the stored file.
+With the result cache enabled the upload is written and hashed in one pass
+first, and only processed (from the stored file, still in the page cache) when
+the hash misses the cache, so a cache hit skips the processing.
+Background jobs save the upload first and process the stored file later,
+reading it through a memory map, with progress reported as they go. Appends fold only the new lines into the saved
+state of an earlier report.
+"""
+import hashlib
+import io
+import os
+import shutil
+import time
+from concurrent.futures import Executor
+from typing import BinaryIO, Callable, Dict, Iterator, Optional, Tuple
+
+from . import config
+from .cache import ResultCache, detach_file, save_and_hash
+from .ingest import CHUNK_SIZE, file_encoding, mapped_chunks
+from .metrics import FILES, FileMetrics
+from .parallel import process_file_parallel
+from .processor import (
+    ErrorCounts, ErrorLog, aggregator_from_state, aggregate_stream, error_counts_path, load_error_counts, load_state,
+    process_file, save_results, state_path,
+)
+
+
+def _file_metrics() -> Optional[FileMetrics]:
+    return FileMetrics() if config.METRICS_ENABLED else None
+
+
+def _count_saved(metrics: Optional[FileMetrics], output_path: str):
+    # Files processed on the pool report their counts through the saved error counts
+    counts = load_error_counts(output_path)
+    if metrics is not None and counts is not None:
+        metrics.count(counts["lines"], {category: c["count"] for category, c in counts["categories"].items()})
+
+
+def save_and_process(source: BinaryIO, upload_path: str, output_path: str, error_path: str,
+                     encoding: Optional[str] = None, metrics: Optional[FileMetrics] = None) -> Tuple[str, int]:
+    """
+    Streams source to upload_path while hashing it and processing it in the same pass.
+    Returns (content_hash, error_count).
+    """
+    digest = hashlib.sha256()
+    with open(upload_path, "wb") as upload, ErrorLog(error_path) as error_log:
+        def tee() -> Iterator[bytes]:
+            for chunk in iter(lambda: source.read(CHUNK_SIZE), b""):
+                start = time.perf_counter()
+                digest.update(chunk)
+                upload.write(chunk)
+                if metrics is not None:
+                    metrics.add("upload_write", time.perf_counter() - start)
+                yield chunk
+
+        aggregator, errors = aggregate_stream(tee(), error_log, encoding, metrics=metrics)
+
+    save_results(aggregator, errors, upload_path, output_path, metrics)
+    return digest.hexdigest(), errors.total
+
+
+def ingest_upload(source: BinaryIO, upload_path: str, output_path: str, error_path: str,
+                  cache: Optional[ResultCache] = None, executor: Optional[Executor] = None,
+                  workers: int = 0):
+    """
+    Stores and processes one uploaded file, reusing a cached result when there
+    is one. The upload is read and hashed once, as it is written.
+    """
+    metrics = _file_metrics()
+    start = time.perf_counter()
+    if cache is None and executor is None:
+        content_hash, _ = save_and_process(source, upload_path, output_path, error_path, metrics=metrics)
+    else:
+        # Saved first: the hash taken on the way looks the result up, and pool workers read the stored file
+        write_start = time.perf_counter()
+        content_hash = save_and_hash(source, upload_path)
+        if cache is not None and cache.fetch(content_hash, upload_path, output_path, error_path):
+            FILES.inc(mode="cache")
+            return
+        if metrics is not None:
+            metrics.add("upload_write", time.perf_counter() - write_start)
+        if executor is None:
+            process_file(upload_path, output_path, error_path, metrics=metrics)
+        else:
+            process_file_parallel(executor, workers, upload_path, output_path, error_path)
+            _count_saved(metrics, output_path)
+
+    if cache is not None:
+        cache.add(content_hash, upload_path, output_path, error_path)
+    if metrics is not None:
+        metrics.finish("inline" if executor is None else "pool", os.path.getsize(upload_path),
+                       time.perf_counter() - start)
+
+
+def process_upload(upload_path: str, output_path: str, error_path: str, content_hash: str,
+                   cache: Optional[ResultCache] = None, executor: Optional[Executor] = None,
+                   workers: int = 0, progress: Optional[Callable[[int, int], None]] = None) -> Optional[int]:
+    """
+    Processes an upload already saved to upload_path, reusing a cached result when there is one.
+    progress, if given, is called with (lines_processed, bytes_processed) as the file is read;
+    files handed to the process pool only report once they are done.
+    Returns the error count, or None for a cache hit.
+    """
+    if cache is not None and cache.fetch(content_hash, upload_path, output_path, error_path):
+        FILES.inc(mode="cache")
+        return None
+
+    metrics = _file_metrics()
+    start = time.perf_counter()
+    if executor is None:
+        bytes_read = 0
+
+        def chunks() -> Iterator[bytes]:
+            nonlocal bytes_read
+            for chunk in mapped_chunks(upload_path):
+                bytes_read += len(chunk)
+                yield chunk
+
+        def report(lines: int):
+            if progress is not None:
+                progress(lines, bytes_read)
+
+        with ErrorLog(error_path) as error_log:
+            aggregator, errors = aggregate_stream(chunks(), error_log, progress=report, metrics=metrics)
+        save_results(aggregator, errors, upload_path, output_path, metrics)
+        error_count = errors.total
+    else:
+        error_count = process_file_parallel(executor, workers, upload_path, output_path, error_path)
+        _count_saved(metrics, output_path)
+
+    if cache is not None:
+        cache.add(content_hash, upload_path, output_path, error_path)
+    if metrics is not None:
+        metrics.finish("inline" if executor is None else "pool", os.path.getsize(upload_path),
+                       time.perf_counter() - start)
+    return error_count
+
+
+def append_upload(source: BinaryIO, upload_path: str, output_path: str, error_path: str,
+                  encoding: Optional[str] = None) -> Dict:
+    """
+    Appends order lines to a stored upload and updates its report and error log
+    from the saved state, reading only the new lines. If the earlier content
+    didn't end with a line break one is added first, so the result is what
+    processing the whole appended file gives. Files shared with the result cache
+    are copied before being extended. Without a current state (an older report,
+    or an interrupted append) the whole file is reprocessed instead.
+    Returns {"lines_processed", "error_count", "reprocessed"}.
+    """
+    metrics = _file_metrics()
+    start = time.perf_counter()
+    state = load_state(output_path)
+    error_counts = load_error_counts(output_path)
+    if state is not None and (error_counts is None or state["upload_bytes"] != os.path.getsize(upload_path)):
+        state = None
+
+    write_start = time.perf_counter()
+    detach_file(upload_path)
+    with open(upload_path, "rb+") as upload:
+        upload.seek(0, os.SEEK_END)
+        if upload.tell():
+            upload.seek(-1, os.SEEK_END)
+            if upload.read(1) not in (b"\n", b"\r"):
+                upload.write(b"\n")
+        delta_start = upload.tell()
+        shutil.copyfileobj(source, upload, CHUNK_SIZE)
+        delta_bytes = upload.tell() - delta_start
+    if metrics is not None:
+        metrics.add("upload_write", time.perf_counter() - write_start)
+
+    lines = 0
+
+    def count(n: int):
+        nonlocal lines
+        lines = n
+
+    if state is None:
+        # Replace rather than rewrite: the old artifacts may be linked from the cache
+        for path in (output_path, error_path, state_path(output_path), error_counts_path(output_path)):
+            if os.path.exists(path):
+                os.remove(path)
+        error_count = process_file(upload_path, output_path, error_path, encoding, count, metrics)
+        if metrics is not None:
+            metrics.finish("inline", os.path.getsize(upload_path), time.perf_counter() - start)
+        return {"lines_processed": lines, "error_count": error_count, "reprocessed": True}
+
+    aggregator = aggregator_from_state(state)
+    errors = ErrorCounts.from_state(error_counts)
+    logged = errors.logged
+    new_errors = io.StringIO()
+
+    # The new lines are read in the encoding the file starts with
+    aggregator, errors = aggregate_stream(mapped_chunks(upload_path, delta_start), new_errors,
+                                          file_encoding(upload_path, encoding), count, aggregator, errors, metrics)
+
+    if errors.logged > logged:
+        if os.path.exists(error_path):
+            detach_file(error_path)
+        with open(error_path, "a") as error_log:
+            if logged:
+                error_log.write("\n")
+            error_log.write(new_errors.getvalue())
+
+    save_results(aggregator, errors, upload_path, output_path, metrics)
+    if metrics is not None:
+        metrics.finish("append", delta_bytes, time.perf_counter() - start)
+    return {"lines_processed": lines, "error_count": errors.total, "reprocessed": False}
@@ -1,60 +1,268 @@
 import csv
+import hashlib
+import io
+import json
 import logging
-from datetime import datetime
-from typing import List, Tuple, Dict, Optional
+import os
+import time
+from array import array
+from contextlib import nullcontext
+from datetime import date, datetime
+from decimal import ROUND_HALF_UP, Decimal
+from typing import Callable, Iterable, List, NamedTuple, Tuple, Dict, Optional, TextIO, Union
+from . import config
+from .ingest import configured_encoding, iter_lines, mapped_chunks
+from .metrics import LINE_SAMPLE_EVERY, FileMetrics
 from .models import Order, ProcessedOrder, CustomerSummary, ProcessingResult
+from .report import column_range, plain_name, render_report, write_totals
+from .rules import RuleSet, active_rules, cents_rate
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def parse_order_line(line: str) -> Tuple[Optional[Order], Optional[str]]:
-    """Parses a single line of the order file. Returns (Order, error_message)."""
-    parts = line.strip().split('|')
+# Lines between progress callbacks
+PROGRESS_INTERVAL = 10_000
+
+# Bump whenever a change to parsing or rendering changes the output for the same input,
+# cached results are keyed on it
+PROCESSOR_VERSION = "2"
+
+# How money is added up: "float" sums dollars as floats, "cents" in exact integer cents
+MONEY_MODES = ("float", "cents")
+
+# Unit prices in cents mode are counted in millionths of a dollar
+PRICE_SCALE = 1_000_000
+_CENT = PRICE_SCALE // 100
+
+def money_mode() -> str:
+    """The configured money mode (ORDER_MONEY_MODE)."""
+    if config.MONEY_MODE not in MONEY_MODES:
+        raise ValueError(f"Unknown money mode: {config.MONEY_MODE}. Expected one of {', '.join(MONEY_MODES)}")
+    return config.MONEY_MODE
+
+def processing_fingerprint() -> str:
+    """Identifies everything besides the input bytes that decides the report and error log."""
+    settings = (f"{PROCESSOR_VERSION}|{active_rules().fingerprint}"
+                f"|{config.ERROR_LOG_LIMIT}|{config.ERROR_LOG_SAMPLE}|{money_mode()}|{configured_encoding()}")
+    return hashlib.sha256(settings.encode()).hexdigest()[:16]
+
+def warm_up() -> str:
+    """
+    Does once what the first file would otherwise pay for: reads and compiles the
+    discount rules and builds the pricing functions. Settings that are wrong fail
+    here rather than on the first upload. Returns the processing fingerprint.
+    """
+    pricing()
+    return processing_fingerprint()
+
+class OrderRecord(NamedTuple):
+    """
+    A parsed order line, without the validation cost of the Order model.
+    unit_price is whatever the price parser returned: a float, or an int count
+    of millionths for price_micros.
+    """
+    order_id: str
+    customer_name: str
+    product_name: str
+    quantity: int
+    unit_price: float
+    order_date: date
+
+# Why a line was rejected -> the message written to the error log for it
+ERROR_MESSAGES = {
+    "field_count": "Invalid format: Expected 6 fields, got {value}. Line: {line}",
+    "quantity_format": "Invalid quantity format: {value}. Line: {line}",
+    "negative_quantity": "Invalid quantity: {value}. Must be non-negative. Line: {line}",
+    "price_format": "Invalid unit price format: {value}. Line: {line}",
+    "negative_price": "Invalid unit price: {value}. Must be non-negative. Line: {line}",
+    "date_format": "Invalid date format: {value}. Expected YYYY-MM-DD. Line: {line}",
+}
+ERROR_CATEGORIES = tuple(ERROR_MESSAGES)
+
+class OrderError(NamedTuple):
+    """
+    A rejected order line: the category of the problem, the offending value as it
+    appears in the message (the field count for field_count), the stripped line
+    and, when known, its 1-based line number. str() gives the error log message.
+    """
+    category: str
+    value: str
+    line: str
+    line_number: Optional[int] = None
+
+    @property
+    def message(self) -> str:
+        return ERROR_MESSAGES[self.category].format(value=self.value, line=self.line)
+
+    def __str__(self) -> str:
+        return self.message
+
+# Order files repeat a handful of dates, so parsed dates (and invalid ones, as None) are remembered
+_DATE_CACHE: Dict[str, Optional[date]] = {}
+_DATE_CACHE_SIZE = 4096
+_MISSING = object()
+
+def parse_date(value: str) -> Optional[date]:
+    """Parses a date the way datetime.strptime(value, '%Y-%m-%d') does. Returns None if it doesn't parse."""
+    parsed = _DATE_CACHE.get(value, _MISSING)
+    if parsed is not _MISSING:
+        return parsed
+
+    if len(value) == 10 and value[4] == '-' and value[7] == '-' and value.isascii() \
+            and value[:4].isdigit() and value[5:7].isdigit() and value[8:].isdigit():
+        # Plain zero-padded YYYY-MM-DD, only the calendar check is left
+        try:
+            parsed = date(int(value[:4]), int(value[5:7]), int(value[8:]))
+        except ValueError:
+            parsed = None
+    else:
+        # Everything else strptime accepts (single-digit months, non-ASCII digits, ...)
+        try:
+            parsed = datetime.strptime(value, '%Y-%m-%d').date()
+        except ValueError:
+            parsed = None
+
+    if len(_DATE_CACHE) >= _DATE_CACHE_SIZE:
+        _DATE_CACHE.clear()
+    _DATE_CACHE[value] = parsed
+    return parsed
+
+def price_micros(value: str) -> int:
+    """
+    Parses a unit price as an exact int number of millionths of a dollar, rounding
+    half up past six places. Accepts what float() accepts except nan and infinities,
+    raising ValueError for those and for anything float() rejects.
+    """
+    whole, _, fraction = value.partition('.')
+    if whole.isdigit() and whole.isascii() and len(fraction) <= 6 and (fraction.isdigit() or not fraction) \
+            and fraction.isascii():
+        # Plain digits with at most six decimals
+        return int(whole) * PRICE_SCALE + int(fraction.ljust(6, '0'))
+    float(value)
+    exact = Decimal(value)
+    if not exact.is_finite():
+        raise ValueError(f"Not a finite price: {value}")
+    return int((exact * PRICE_SCALE).to_integral_value(ROUND_HALF_UP))
+
+def parse_order_fields(line: str, line_number: Optional[int] = None,
+                       parse_price: Callable[[str], Union[float, int]] = float
+                       ) -> Tuple[Optional[OrderRecord], Optional[OrderError]]:
+    """
+    Parses a single line of the order file into an OrderRecord. Returns (record, error).
+    Accepts and rejects exactly what parse_order_line does, with the same errors.
+    parse_price turns the unit price field into the record's unit_price, raising
+    ValueError if it isn't a price (price_micros for cents mode).
+    """
+    stripped = line.strip()
+    parts = stripped.split('|')
     if len(parts) != 6:
-        return None, f"Invalid format: Expected 6 fields, got {len(parts)}. Line: {line.strip()}"
+        return None, OrderError("field_count", str(len(parts)), stripped, line_number)
     
     order_id, customer_name, product_name, quantity_str, unit_price_str, order_date_str = parts
     
-    try:
+    if quantity_str.isdecimal():
         quantity = int(quantity_str)
+    else:
+        # Signs, surrounding spaces and underscores are left to int()
+        try:
+            quantity = int(quantity_str)
+        except ValueError:
+            return None, OrderError("quantity_format", quantity_str, stripped, line_number)
         if quantity < 0:
-             return None, f"Invalid quantity: {quantity}. Must be non-negative. Line: {line.strip()}"
-    except ValueError:
-        return None, f"Invalid quantity format: {quantity_str}. Line: {line.strip()}"
+            return None, OrderError("negative_quantity", str(quantity), stripped, line_number)
 
     try:
-        unit_price = float(unit_price_str)
-        if unit_price < 0:
-             return None, f"Invalid unit price: {unit_price}. Must be non-negative. Line: {line.strip()}"
+        unit_price = parse_price(unit_price_str)
     except ValueError:
-        return None, f"Invalid unit price format: {unit_price_str}. Line: {line.strip()}"
+        return None, OrderError("price_format", unit_price_str, stripped, line_number)
+    if unit_price < 0:
+        # The message shows the price as a float whatever the parser
+        return None, OrderError("negative_price", str(float(unit_price_str)), stripped, line_number)
 
-    try:
-        # diverse date formats could be supported, but strict adherence to YYYY-MM-DD as per example for now
-        # Handling potential different separators could be an enhancement
-        order_date = datetime.strptime(order_date_str, '%Y-%m-%d').date()
-    except ValueError:
-        return None, f"Invalid date format: {order_date_str}. Expected YYYY-MM-DD. Line: {line.strip()}"
-
-    return Order(
-        order_id=order_id.strip(),
-        customer_name=customer_name.strip(),
-        product_name=product_name.strip(),
-        quantity=quantity,
-        unit_price=unit_price,
-        order_date=order_date
+    # Strict adherence to YYYY-MM-DD as per example for now
+    order_date = parse_date(order_date_str)
+    if order_date is None:
+        return None, OrderError("date_format", order_date_str, stripped, line_number)
+
+    return OrderRecord(
+        order_id.strip(),
+        customer_name.strip(),
+        product_name.strip(),
+        quantity,
+        unit_price,
+        order_date
     ), None
 
+def parse_order_line(line: str, line_number: Optional[int] = None) -> Tuple[Optional[Order], Optional[OrderError]]:
+    """Parses a single line of the order file. Returns (Order, error); str(error) is the log message."""
+    record, error = parse_order_fields(line, line_number)
+    if error:
+        return None, error
+    return Order(**record._asdict()), None
+
+def order_totals(quantity: int, unit_price: float, customer_name: Optional[str] = None,
+                 product_name: Optional[str] = None, order_date: Optional[date] = None) -> Tuple[float, float, float]:
+    """
+    Returns (line_total, discount, net_total) for one order line under the configured
+    discount rules. The customer, product and date only matter to rules scoped to them.
+    """
+    rules = active_rules()
+    line_total = quantity * unit_price
+    if rules.scoped:
+        rate = rules.rate_function()(line_total, customer_name, product_name, order_date)
+    else:
+        rate = rules.rate_function()(line_total)
+    discount = line_total * rate if rate else 0.0
+    return line_total, discount, line_total - discount
+
+def totals_function(rules: RuleSet, cents: bool = False) -> Callable[[OrderRecord], Tuple]:
+    """
+    order_totals for a parsed record, with the rule lookup compiled once: returns
+    totals(record) -> (line_total, discount, net_total). In cents mode unit prices
+    are in millionths (price_micros) and the totals in whole cents: the line total
+    is rounded half up to the cent, and the discount is taken off the rounded total,
+    also rounded half up.
+    """
+    rate_of = rules.rate_function(cents)
+    scoped = rules.scoped
+
+    if not cents:
+        def totals(record: OrderRecord) -> Tuple[float, float, float]:
+            line_total = record.quantity * record.unit_price
+            if scoped:
+                rate = rate_of(line_total, record.customer_name, record.product_name, record.order_date)
+            else:
+                rate = rate_of(line_total)
+            discount = line_total * rate if rate else 0.0
+            return line_total, discount, line_total - discount
+
+        return totals
+
+    fractions = {rate: cents_rate(rate) for rate in rules.rates}
+
+    def totals(record: OrderRecord) -> Tuple[int, int, int]:
+        line_total = (record.quantity * record.unit_price + _CENT // 2) // _CENT
+        if scoped:
+            rate = rate_of(line_total, record.customer_name, record.product_name, record.order_date)
+        else:
+            rate = rate_of(line_total)
+        discount = 0
+        if rate:
+            numerator, denominator, double = fractions[rate]
+            discount = (line_total * numerator + denominator) // double
+        return line_total, discount, line_total - discount
+
+    return totals
+
+def pricing() -> Tuple[Callable[[str], Union[float, int]], Callable[[OrderRecord], Tuple]]:
+    """The (price parser, totals function) pair for the configured money mode and discount rules."""
+    if money_mode() == "cents":
+        return price_micros, totals_function(active_rules(), cents=True)
+    return float, totals_function(active_rules())
+
 def calculate_totals(order: Order) -> ProcessedOrder:
     """Calculates totals and discounts for a valid order."""
-    line_total = order.quantity * order.unit_price
-    discount = 0.0
-    
-    if line_total > 500:
-        discount = line_total * 0.10
-        
-    net_total = line_total - discount
+    line_total, discount, net_total = order_totals(order.quantity, order.unit_price, order.customer_name,
+                                                   order.product_name, order.order_date)
     
     return ProcessedOrder(
         **order.model_dump(),
@@ -63,98 +271,514 @@ def calculate_totals(order: Order) -> ProcessedOrder:
         net_total=net_total
     )
 
-def generate_report(orders: List[ProcessedOrder]) -> ProcessingResult:
+class CustomerAggregator:
+    """
+    Folds processed orders into per-customer totals as they arrive.
+
+    Customer names are interned to row ids (in order of first appearance) and
+    the totals are kept column by column in typed arrays that grow by
+    appending, so a customer costs its name, one dict slot and a few machine
+    words rather than a CustomerSummary model. Models are only built by
+    result(); write_report() renders from the columns directly, sized by the
+    name lengths tracked as customers are added. An integer column that
+    outgrows 64 bits becomes a list of Python ints, so no total is ever cut short.
+    """
+    money = "float"
+    # array type code of the money columns
+    money_type = "d"
+
+    def __init__(self):
+        self.ids: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.order_count = array("q")
+        self.total_items = array("q")
+        self.gross_total = array(self.money_type)
+        self.total_discount = array(self.money_type)
+        self.net_total = array(self.money_type)
+        self.grand_total_gross = self.grand_total_discount = self.grand_total_net = self._zero()
+        # For sizing the report's name column
+        self.name_width = 0
+        self.plain_names = True
+
+    @staticmethod
+    def _zero():
+        return 0.0
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def _add_customer(self, customer_name: str) -> int:
+        row = self.ids[customer_name] = len(self.names)
+        self.names.append(customer_name)
+        if len(customer_name) > self.name_width:
+            self.name_width = len(customer_name)
+        if self.plain_names and not plain_name(customer_name):
+            self.plain_names = False
+        for column in (self.order_count, self.total_items, self.gross_total, self.total_discount, self.net_total):
+            column.append(0)
+        return row
+
+    def _widen(self):
+        """Turns the 64-bit integer columns into lists of Python ints."""
+        for name in ("order_count", "total_items", "gross_total", "total_discount", "net_total"):
+            column = getattr(self, name)
+            if isinstance(column, array) and column.typecode == "q":
+                setattr(self, name, list(column))
+
+    def add(self, order: ProcessedOrder):
+        self.add_totals(order.customer_name, order.quantity, order.line_total, order.discount_amount, order.net_total)
+
+    def add_totals(self, customer_name: str, quantity: int, line_total, discount, net_total):
+        """Adds one order's totals without going through a ProcessedOrder."""
+        row = self.ids.get(customer_name)
+        if row is None:
+            row = self._add_customer(customer_name)
+        # _add_row, inlined: this runs for every order
+        order_count = self.order_count[row] + 1
+        total_items = self.total_items[row] + quantity
+        gross = self.gross_total[row] + line_total
+        total_discount = self.total_discount[row] + discount
+        net = self.net_total[row] + net_total
+        try:
+            self.order_count[row] = order_count
+            self.total_items[row] = total_items
+            self.gross_total[row] = gross
+            self.total_discount[row] = total_discount
+            self.net_total[row] = net
+        except OverflowError:
+            self._widen()
+            self._store(row, order_count, total_items, gross, total_discount, net)
+
+        self.grand_total_gross += line_total
+        self.grand_total_discount += discount
+        self.grand_total_net += net_total
+
+    def _store(self, row: int, order_count: int, total_items: int, gross, discount, net):
+        self.order_count[row] = order_count
+        self.total_items[row] = total_items
+        self.gross_total[row] = gross
+        self.total_discount[row] = discount
+        self.net_total[row] = net
+
+    def _add_row(self, row: int, order_count: int, total_items: int, gross, discount, net):
+        # The new values are worked out first, so storing them can be repeated after widening
+        totals = (
+            self.order_count[row] + order_count,
+            self.total_items[row] + total_items,
+            self.gross_total[row] + gross,
+            self.total_discount[row] + discount,
+            self.net_total[row] + net,
+        )
+        try:
+            self._store(row, *totals)
+        except OverflowError:
+            self._widen()
+            self._store(row, *totals)
+
+    def rows(self) -> Iterable[Tuple]:
+        """(name, order_count, total_items, gross, discount, net) per customer, in first-appearance order."""
+        return zip(self.names, self.order_count, self.total_items, self.gross_total, self.total_discount,
+                   self.net_total)
+
+    def merge(self, other: "CustomerAggregator"):
+        """
+        Adds another aggregator's totals into this one. Customers new to this
+        aggregator are appended in the other's first-appearance order.
+        """
+        for name, *totals in other.rows():
+            row = self.ids.get(name)
+            if row is None:
+                row = self._add_customer(name)
+            self._add_row(row, *totals)
+
+        self.grand_total_gross += other.grand_total_gross
+        self.grand_total_discount += other.grand_total_discount
+        self.grand_total_net += other.grand_total_net
+
+    def to_state(self) -> Dict:
+        """JSON-ready snapshot of the totals; floats survive the round trip exactly."""
+        return {
+            "customers": [list(row) for row in self.rows()],
+            "grand_total": [self.grand_total_gross, self.grand_total_discount, self.grand_total_net],
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict):
+        aggregator = cls()
+        for name, *totals in state["customers"]:
+            aggregator._add_row(aggregator._add_customer(name), *totals)
+        aggregator.grand_total_gross, aggregator.grand_total_discount, aggregator.grand_total_net = state["grand_total"]
+        return aggregator
+
+    @staticmethod
+    def _dollars(value) -> float:
+        return value
+
+    def result(self) -> ProcessingResult:
+        dollars = self._dollars
+        return ProcessingResult(
+            summary_report=[
+                CustomerSummary(
+                    customer_name=name,
+                    order_count=order_count,
+                    total_items=total_items,
+                    gross_total=dollars(gross),
+                    total_discount=dollars(discount),
+                    net_total=dollars(net)
+                )
+                for name, order_count, total_items, gross, discount, net in self.rows()
+            ],
+            grand_total_gross=dollars(self.grand_total_gross),
+            grand_total_discount=dollars(self.grand_total_discount),
+            grand_total_net=dollars(self.grand_total_net)
+        )
+
+    def write_report(self, out: TextIO):
+        """write_report(self.result(), out), without building a CustomerSummary per customer."""
+        dollars = self._dollars
+        rows = (
+            (name, order_count, total_items, dollars(gross), dollars(discount), dollars(net))
+            for name, order_count, total_items, gross, discount, net in self.rows()
+        )
+        ranges = [column_range(self.order_count), column_range(self.total_items)]
+        for column in (self.gross_total, self.total_discount, self.net_total):
+            low, high = column_range(column)
+            ranges.append((dollars(low), dollars(high)))
+        grand_total = (dollars(self.grand_total_gross), dollars(self.grand_total_discount),
+                       dollars(self.grand_total_net))
+        write_totals(rows, ranges, grand_total, self.name_width, self.plain_names, out)
+
+class CentsAggregator(CustomerAggregator):
+    """
+    CustomerAggregator for cents mode: money columns hold int cents, so sums
+    are exact however partial aggregates are merged. result() converts to
+    dollars only for display.
+    """
+    money = "cents"
+    money_type = "q"
+
+    @staticmethod
+    def _zero():
+        return 0
+
+    def to_state(self) -> Dict:
+        return {"money": self.money, **super().to_state()}
+
+    @staticmethod
+    def _dollars(value) -> float:
+        return value / 100
+
+Aggregator = Union[CustomerAggregator, CentsAggregator]
+
+def new_aggregator() -> Aggregator:
+    """An empty aggregator for the configured money mode."""
+    return CentsAggregator() if money_mode() == "cents" else CustomerAggregator()
+
+def aggregator_from_state(state: Dict) -> Aggregator:
+    """The aggregator a saved state was written by, restored."""
+    if state.get("money") == "cents":
+        return CentsAggregator.from_state(state)
+    return CustomerAggregator.from_state(state)
+
+class ErrorCounts:
+    """
+    Error bookkeeping for one file: how many lines were rejected per category
+    (with the line number and value of the first of each), how many lines were
+    read, and how many errors made it into the error log. With a limit only the
+    first `limit` errors are logged, with sample_every=n only every n-th one;
+    the counts always cover all of them.
+    """
+
+    def __init__(self, limit: Optional[int] = None, sample_every: int = 1):
+        self.limit = limit
+        self.sample_every = sample_every
+        self.categories: Dict[str, int] = {}
+        self.first: Dict[str, list] = {}
+        self.total = 0
+        self.logged = 0
+        self.lines = 0
+
+    @classmethod
+    def configured(cls) -> "ErrorCounts":
+        """Empty counts with the error log limit and sampling from the settings."""
+        return cls(config.ERROR_LOG_LIMIT or None, max(1, config.ERROR_LOG_SAMPLE))
+
+    @property
+    def complete(self) -> bool:
+        """Whether every error is logged."""
+        return self.limit is None and self.sample_every == 1
+
+    def add(self, error: OrderError) -> bool:
+        """Counts one error. Returns whether it should be written to the error log."""
+        count = self.categories.get(error.category)
+        if count is None:
+            self.categories[error.category] = 1
+            self.first[error.category] = [error.line_number, error.value]
+        else:
+            self.categories[error.category] = count + 1
+        self.total += 1
+        return self.admit(self.total - 1)
+
+    def admit(self, index: int) -> bool:
+        """Whether the error at 0-based position index in the file is logged; counts it as logged if so."""
+        if index % self.sample_every or (self.limit is not None and self.logged >= self.limit):
+            return False
+        self.logged += 1
+        return True
+
+    def merge(self, other: "ErrorCounts"):
+        """
+        Adds the counts of the lines that follow this file's (a later byte range)
+        to this one, shifting their line numbers. Logging is left to the caller.
+        """
+        for category, count in other.categories.items():
+            if category not in self.categories:
+                line_number, value = other.first[category]
+                self.first[category] = [line_number + self.lines, value]
+            self.categories[category] = self.categories.get(category, 0) + count
+        self.total += other.total
+        self.lines += other.lines
+
+    def to_state(self) -> Dict:
+        return {
+            "error_count": self.total,
+            "logged": self.logged,
+            "lines": self.lines,
+            "categories": {
+                category: {"count": count, "first_line": self.first[category][0], "first_value": self.first[category][1]}
+                for category, count in self.categories.items()
+            },
+        }
+
+    @classmethod
+    def from_state(cls, state: Dict) -> "ErrorCounts":
+        """Counts saved by to_state, continued under the current log settings."""
+        errors = cls.configured()
+        for category, counts in state["categories"].items():
+            errors.categories[category] = counts["count"]
+            errors.first[category] = [counts["first_line"], counts["first_value"]]
+        errors.total = state["error_count"]
+        errors.logged = state["logged"]
+        errors.lines = state["lines"]
+        return errors
+
+def generate_report(orders: Iterable[ProcessedOrder]) -> ProcessingResult:
     """Generates the summary report grouped by customer."""
-    customer_data: Dict[str, CustomerSummary] = {}
-    
-    grand_total_gross = 0.0
-    grand_total_discount = 0.0
-    grand_total_net = 0.0
-    
+    aggregator = CustomerAggregator()
     for order in orders:
-        if order.customer_name not in customer_data:
-            customer_data[order.customer_name] = CustomerSummary(
-                customer_name=order.customer_name,
-                order_count=0,
-                total_items=0,
-                gross_total=0.0,
-                total_discount=0.0,
-                net_total=0.0
-            )
-        
-        summary = customer_data[order.customer_name]
-        summary.order_count += 1
-        summary.total_items += order.quantity
-        summary.gross_total += order.line_total
-        summary.total_discount += order.discount_amount
-        summary.net_total += order.net_total
-        
-        grand_total_gross += order.line_total
-        grand_total_discount += order.discount_amount
-        grand_total_net += order.net_total
-        
-    return ProcessingResult(
-        summary_report=list(customer_data.values()),
-        grand_total_gross=grand_total_gross,
-        grand_total_discount=grand_total_discount,
-        grand_total_net=grand_total_net
-    )
+        aggregator.add(order)
+    return aggregator.result()
 
-def process_file_content(content: str) -> Tuple[str, str]:
+def _timed_line(line: str, line_number: int, aggregator: Aggregator, parse_price, totals_of,
+                metrics: FileMetrics) -> Optional[OrderError]:
+    """What aggregate_stream does with a valid line, plus parsing, with each step timed for metrics."""
+    start = time.perf_counter()
+    record, error = parse_order_fields(line, line_number, parse_price)
+    parsed = time.perf_counter()
+    if error:
+        metrics.sample_line(parsed - start, 0.0, 0.0)
+        return error
+    totals = totals_of(record)
+    priced = time.perf_counter()
+    aggregator.add_totals(record.customer_name, record.quantity, *totals)
+    metrics.sample_line(parsed - start, priced - parsed, time.perf_counter() - priced)
+    return None
+
+def aggregate_stream(source, error_log: TextIO, encoding: Optional[str] = None,
+                     progress: Optional[Callable[[int], None]] = None,
+                     aggregator: Optional[Aggregator] = None,
+                     errors: Optional[ErrorCounts] = None,
+                     metrics: Optional[FileMetrics] = None) -> Tuple[Aggregator, ErrorCounts]:
     """
-    Processes the raw file content. 
-    Returns (output_report_string, error_log_string).
+    Folds orders from a file object or an iterable of chunks into an aggregator for
+    the configured money mode (a new one, or `aggregator` to continue earlier totals), counting rejected lines
+    in an ErrorCounts (a new one with the configured log settings, or `errors`, whose
+    line numbers and log limit carry on) and writing the logged ones straight to
+    error_log. progress, if given, is called with the number of lines processed so
+    far every PROGRESS_INTERVAL lines and once at the end. metrics, if given, gets
+    the stage times and counts for what this call reads.
+    Returns (aggregator, errors).
     """
-    valid_orders: List[ProcessedOrder] = []
-    errors: List[str] = []
-    
-    lines = content.strip().split('\n')
-    if not lines:
-        return "No data processed.", "File is empty."
+    if aggregator is None:
+        aggregator = new_aggregator()
+    if errors is None:
+        errors = ErrorCounts.configured()
+    parse_price, totals_of = pricing()
+    line_number = errors.lines
+    lines_processed = 0
+    written = False
+    # Timing every line would cost more than the steps themselves, so only every LINE_SAMPLE_EVERY-th is
+    next_sample = 0 if metrics is not None else -1
+    counted = dict(errors.categories) if metrics is not None else None
 
-    for line in lines:
+    for line in iter_lines(source, encoding, metrics):
+        line_number += 1
         if not line.strip():
             continue
-            
-        order, error = parse_order_line(line)
-        if error:
-            errors.append(error)
+
+        if lines_processed == next_sample:
+            next_sample += LINE_SAMPLE_EVERY
+            error = _timed_line(line, line_number, aggregator, parse_price, totals_of, metrics)
         else:
-            processed_order = calculate_totals(order)
-            valid_orders.append(processed_order)
-            
-    result = generate_report(valid_orders)
-    
-    # Generate Output String Table
-    from tabulate import tabulate
+            record, error = parse_order_fields(line, line_number, parse_price)
+            if not error:
+                aggregator.add_totals(record.customer_name, record.quantity, *totals_of(record))
+        if error and errors.add(error):
+            if written:
+                error_log.write("\n")
+            error_log.write(error.message)
+            written = True
 
-    # Generate Output String Table
-    headers = ["Customer Name", "Orders", "Items", "Gross Total", "Discount", "Net Total"]
-    table_data = []
-    
-    for summary in result.summary_report:
-        table_data.append([
-            summary.customer_name,
-            summary.order_count,
-            summary.total_items,
-            f"${summary.gross_total:,.2f}",
-            f"${summary.total_discount:,.2f}",
-            f"${summary.net_total:,.2f}"
-        ])
-    
+        lines_processed += 1
+        if progress is not None and lines_processed % PROGRESS_INTERVAL == 0:
+            progress(lines_processed)
 
-    table_data.append([
-        "GRAND TOTAL",
-        "",
-        "",
-        f"${result.grand_total_gross:,.2f}",
-        f"${result.grand_total_discount:,.2f}",
-        f"${result.grand_total_net:,.2f}"
-    ])
-    
-    output_string = tabulate(table_data, headers=headers, tablefmt="grid", stralign="right", numalign="right")
-    
-    # Custom adjustments if tabulate grid isn't exactly what we want, but "grid" is usually very clean.
-    # The user wanted "cleaner and uniform". Grid handles borders well.
-    
-    return output_string, "\n".join(errors)
+    # The empty string after a final line break isn't a line of its own
+    lines_read = line_number - (line == "") - errors.lines
+    errors.lines += lines_read
+    if metrics is not None:
+        metrics.estimate_lines(lines_processed)
+        metrics.count(lines_read, {
+            category: count - counted.get(category, 0)
+            for category, count in errors.categories.items() if count != counted.get(category, 0)
+        })
+    if progress is not None:
+        progress(lines_processed)
+    return aggregator, errors
+
+def process_stream(source, error_log: TextIO, encoding: Optional[str] = None,
+                   progress: Optional[Callable[[int], None]] = None) -> Tuple[str, int]:
+    """
+    Processes orders line by line from a file object or an iterable of chunks.
+    Orders are folded into the customer aggregates as they are parsed and error
+    messages are written straight to error_log, so memory stays bounded by the
+    number of customers rather than the size of the file.
+    Returns (output_report_string, error_count).
+    """
+    aggregator, errors = aggregate_stream(source, error_log, encoding, progress)
+    output = io.StringIO()
+    aggregator.write_report(output)
+    return output.getvalue(), errors.total
+
+def state_path(output_path: str) -> str:
+    """Where the mergeable totals behind a report are kept: next to it, as {name}.state.json."""
+    return f"{os.path.splitext(output_path)[0]}.state.json"
+
+def error_counts_path(output_path: str) -> str:
+    """Where a report's error counts are kept: next to it, as {name}.errors.json."""
+    return f"{os.path.splitext(output_path)[0]}.errors.json"
+
+def write_replacing(path: str, text: str):
+    """Writes text to a temp file and moves it over path, so other links to the old file are left alone."""
+    temp = f"{path}.tmp"
+    with open(temp, "w") as f:
+        f.write(text)
+    os.replace(temp, path)
+
+class ErrorLog:
+    """
+    A text file that is only created on the first write, so files without
+    rejected lines leave no empty error log behind. Like open(path, "w") it
+    replaces whatever was at path: closing it unwritten removes an old file.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: Optional[TextIO] = None
+
+    def write(self, text: str) -> int:
+        if self._file is None:
+            self._file = open(self.path, "w")
+        return self._file.write(text)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+
+    def __enter__(self) -> "ErrorLog":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def _stage(metrics: Optional[FileMetrics], stage: str):
+    return metrics.stage(stage) if metrics is not None else nullcontext()
+
+def save_results(aggregator: Aggregator, errors: ErrorCounts, upload_path: str, output_path: str,
+                 metrics: Optional[FileMetrics] = None):
+    """
+    Writes the report for aggregator to output_path, with its state and error
+    counts next to it. The state records how many upload bytes it covers, so
+    appends can tell it (and the error counts written before it) is current.
+    """
+    with _stage(metrics, "persist"):
+        write_replacing(error_counts_path(output_path), json.dumps(errors.to_state()))
+        state = aggregator.to_state()
+        state.update(
+            fingerprint=processing_fingerprint(),
+            upload_bytes=os.path.getsize(upload_path),
+        )
+        write_replacing(state_path(output_path), json.dumps(state))
+    with _stage(metrics, "render"):
+        # Streamed into the file rather than rendered as one string
+        temp = f"{output_path}.tmp"
+        with open(temp, "w") as f:
+            aggregator.write_report(f)
+        os.replace(temp, output_path)
+
+def load_state(output_path: str) -> Optional[Dict]:
+    """The saved state for a report, or None if it is missing or was built under other rules."""
+    try:
+        with open(state_path(output_path)) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if state.get("fingerprint") != processing_fingerprint():
+        return None
+    return state
+
+def load_error_counts(output_path: str) -> Optional[Dict]:
+    """The saved error counts for a report (ErrorCounts.to_state), or None if there are none."""
+    try:
+        with open(error_counts_path(output_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def process_file(upload_path: str, output_path: str, error_path: str, encoding: Optional[str] = None,
+                 progress: Optional[Callable[[int], None]] = None, metrics: Optional[FileMetrics] = None) -> int:
+    """
+    Processes a stored upload into its report and error log files (no error log
+    without errors), saving the report's state and error counts alongside for
+    appends. Returns the error count.
+    """
+    with ErrorLog(error_path) as error_log:
+        aggregator, errors = aggregate_stream(mapped_chunks(upload_path), error_log, encoding, progress, metrics=metrics)
+    save_results(aggregator, errors, upload_path, output_path, metrics)
+    return errors.total
+
+# Engines accepted by process_file_content
+ENGINES = ("python", "columnar")
+
+def process_file_content(content: str, engine: str = "python") -> Tuple[str, str]:
+    """
+    Processes the raw file content. 
+    engine="columnar" parses the whole file into NumPy/pandas columns instead of
+    validating row by row; both engines produce identical output. The columnar
+    engine only sums floats, so in cents mode the python engine runs either way.
+    Returns (output_report_string, error_log_string).
+    """
+    if engine not in ENGINES:
+        raise ValueError(f"Unknown engine: {engine}. Expected one of {', '.join(ENGINES)}")
+
+    if engine == "columnar" and money_mode() == "float":
+        from .columnar import process_columnar
+        errors = io.StringIO()
+        result, _ = process_columnar(content, errors)
+        return render_report(result), errors.getvalue()
+
+    errors = io.StringIO()
+    output_string, _ = process_stream([content], errors)
+    return output_string, errors.getvalue()
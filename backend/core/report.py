@@ -0,0 +1,155 @@
+"""
+Customer summary report rendering.
+
+The report is the grid table tabulate produced for us before (right-aligned,
+headers padded by two), written row by row instead of being assembled as one
+string. Column widths come from a single pass over the formatted rows, so the
+cost is linear in the number of customers and nothing is re-scanned. Names
+that tabulate would measure differently (wide or non-printable characters) are
+still handed to tabulate, so the output is the same either way.
+
+write_totals renders straight from raw totals, such as an aggregator's rows,
+without a ProcessingResult. Its column widths come from the widest name and
+the smallest and largest value of each column, since a number's width only
+grows with its magnitude. Rows are then formatted and written one at a time,
+so memory doesn't grow with the number of customers.
+
+Reports can also be cut down to the top N customers by net total, or to one
+page of rows; the GRAND TOTAL row always covers the whole file.
+"""
+import io
+import itertools
+from typing import Iterable, List, Optional, Sequence, TextIO, Tuple
+
+from .models import CustomerSummary, ProcessingResult
+
+HEADERS = ("Customer Name", "Orders", "Items", "Gross Total", "Discount", "Net Total")
+
+# tabulate pads every header by this much before sizing a column
+_HEADER_PADDING = 2
+
+
+def _money(value: float) -> str:
+    return f"${value:,.2f}"
+
+
+def select_customers(result: ProcessingResult, top: Optional[int] = None, offset: int = 0,
+                     limit: Optional[int] = None) -> List[CustomerSummary]:
+    """
+    The customers a report shows: all of them in first-appearance order, or the
+    `top` largest by net total (ties in appearance order), then the page
+    starting at `offset` of at most `limit` rows.
+    """
+    customers = result.summary_report
+    if top is not None:
+        customers = sorted(customers, key=lambda s: s.net_total, reverse=True)[:top]
+    end = None if limit is None else offset + limit
+    return customers[offset:end]
+
+
+def _cells(name: str, order_count: int, total_items: int, gross: float, discount: float,
+           net: float) -> Tuple[str, ...]:
+    return name, str(order_count), str(total_items), _money(gross), _money(discount), _money(net)
+
+
+def _grand_total_cells(gross: float, discount: float, net: float) -> Tuple[str, ...]:
+    return "GRAND TOTAL", "", "", _money(gross), _money(discount), _money(net)
+
+
+def _rows(customers: Sequence[CustomerSummary], result: ProcessingResult) -> List[Tuple[str, ...]]:
+    rows = [
+        _cells(s.customer_name, s.order_count, s.total_items, s.gross_total, s.total_discount, s.net_total)
+        for s in customers
+    ]
+    rows.append(_grand_total_cells(result.grand_total_gross, result.grand_total_discount, result.grand_total_net))
+    return rows
+
+
+def plain_name(name: str) -> bool:
+    """Whether the grid is sized by len(name): one character per column, nothing tabulate treats specially."""
+    return name.isascii() and name.isprintable() and name == name.strip()
+
+
+_INF = float("inf")
+
+
+def _finite(value) -> bool:
+    # Works for ints too big to convert to float
+    return value == value and -_INF < value < _INF
+
+
+def column_range(values: Sequence) -> Tuple:
+    """(smallest, largest) finite value in values, (0, 0) if there are none."""
+    low, high = min(values, default=0), max(values, default=0)
+    # A nan compares false with everything: min/max skip it unless it comes first
+    if not (_finite(low) and _finite(high)):
+        low = min((value for value in values if _finite(value)), default=0)
+        high = max((value for value in values if _finite(value)), default=0)
+    return low, high
+
+
+def _write_tabulate(rows: List[Tuple[str, ...]], out: TextIO):
+    from tabulate import tabulate
+
+    out.write(tabulate(rows, headers=HEADERS, tablefmt="grid", stralign="right", numalign="right"))
+
+
+def _write_grid(rows: Iterable[Tuple[str, ...]], widths: List[int], out: TextIO):
+    border = "+" + "+".join("-" * (width + 2) for width in widths) + "+"
+    line = "| " + " | ".join(f"{{:>{width}}}" for width in widths) + " |"
+
+    out.write(border)
+    out.write("\n")
+    out.write(line.format(*HEADERS))
+    out.write("\n")
+    out.write("+" + "+".join("=" * (width + 2) for width in widths) + "+")
+    for row in rows:
+        out.write("\n")
+        out.write(line.format(*row))
+        out.write("\n")
+        out.write(border)
+
+
+def write_report(result: ProcessingResult, out: TextIO, top: Optional[int] = None, offset: int = 0,
+                 limit: Optional[int] = None):
+    """Writes the customer summary grid table to out, without a trailing newline."""
+    rows = _rows(select_customers(result, top, offset, limit), result)
+    if not all(plain_name(row[0]) for row in rows):
+        _write_tabulate(rows, out)
+        return
+
+    widths = [len(header) + _HEADER_PADDING for header in HEADERS]
+    for row in rows:
+        for i, cell in enumerate(row):
+            if len(cell) > widths[i]:
+                widths[i] = len(cell)
+    _write_grid(rows, widths, out)
+
+
+def write_totals(rows: Iterable[Tuple], ranges: Sequence[Tuple], grand_total: Tuple[float, float, float],
+                 name_width: int, plain_names: bool, out: TextIO):
+    """
+    write_report for a whole file from raw totals: rows of (name, order_count,
+    total_items, gross, discount, net) in dollars, the column_range of each
+    number column in dollars, the grand totals, and the length of the longest
+    name and whether every name is a plain_name. rows is only iterated once.
+    """
+    grand_total_row = _grand_total_cells(*grand_total)
+    if not plain_names:
+        _write_tabulate([*(_cells(*row) for row in rows), grand_total_row], out)
+        return
+
+    widths = [max(len(HEADERS[0]) + _HEADER_PADDING, name_width, len(grand_total_row[0]))]
+    for i, (low, high) in enumerate(ranges, 1):
+        format_cell = str if i < 3 else _money
+        widths.append(max(len(HEADERS[i]) + _HEADER_PADDING, len(format_cell(low)), len(format_cell(high)),
+                          len(grand_total_row[i])))
+    _write_grid(itertools.chain((_cells(*row) for row in rows), [grand_total_row]), widths, out)
+
+
+def render_report(result: ProcessingResult, top: Optional[int] = None, offset: int = 0,
+                  limit: Optional[int] = None) -> str:
+    """Renders the customer summary as a grid table."""
+    out = io.StringIO()
+    write_report(result, out, top, offset, limit)
+    return out.getvalue()
@@ -0,0 +1,312 @@
+"""
+Retention and compaction of stored artifacts.
+
+Every processed file leaves an upload in uploads/, a report in outputs/ and,
+when lines were rejected, an error log in errors/, plus files derived from
+them (report state, error counts, exports, compressed copies). All of them are
+named {file_id}_..., so one listing of each directory, grouped by file id,
+finds every artifact of any number of files. Removals work from such a
+listing instead of globbing per file.
+
+A sweep (apply_retention) enforces a RetentionPolicy:
+
+- submissions older than max_age_days are deleted;
+- the artifacts of submissions older than archive_after_days are packed into
+  one compressed archive per submission (archives/{submission_id}.zip) and the
+  loose files removed; they are unpacked again the first time they are needed;
+- while the artifacts take more than max_bytes, the oldest submissions are
+  deleted.
+
+0 turns a policy off. Files that don't belong to a stored submission (uploads
+of a job still running, say) are left alone.
+"""
+import json
+import os
+import shutil
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from . import config
+from .ingest import CHUNK_SIZE
+from .storage import SubmissionStore
+
+ARTIFACT_DIRS = ("uploads", "outputs", "errors")
+ARCHIVE_DIR = "archives"
+
+# Threads removing the files of many submissions at once; removal waits on the
+# filesystem, not the interpreter
+REMOVE_WORKERS = 8
+
+# Modification times of the packed files, restored on unpacking so exports and
+# compressed copies are still seen as current
+_MANIFEST = "manifest.json"
+
+
+class RetentionPolicy(NamedTuple):
+    max_age_days: int = 0
+    max_bytes: int = 0
+    archive_after_days: int = 0
+
+    @classmethod
+    def configured(cls) -> "RetentionPolicy":
+        return cls(config.RETENTION_DAYS, config.RETENTION_MAX_BYTES, config.ARCHIVE_AFTER_DAYS)
+
+
+class StoredFile(NamedTuple):
+    path: str
+    size: int
+    links: int
+    mtime_ns: int
+
+
+class ArtifactFiles:
+    """The artifact directories under a data directory, and the archives packed from them."""
+
+    def __init__(self, data_dir: str):
+        self.data_dir = data_dir
+        self.archive_dir = os.path.join(data_dir, ARCHIVE_DIR)
+        self._lock = threading.Lock()
+
+    def scan(self, file_ids: Optional[Iterable[str]] = None) -> Dict[str, List[StoredFile]]:
+        """Every artifact on disk by file id, from one listing per directory; only file_ids' if given."""
+        wanted = set(file_ids) if file_ids is not None else None
+        found: Dict[str, List[StoredFile]] = {}
+        for name in ARTIFACT_DIRS:
+            try:
+                entries = os.scandir(os.path.join(self.data_dir, name))
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    file_id, separator, _ = entry.name.partition("_")
+                    if not separator or (wanted is not None and file_id not in wanted):
+                        continue
+                    try:
+                        stat = entry.stat(follow_symlinks=False)
+                    except FileNotFoundError:
+                        continue
+                    found.setdefault(file_id, []).append(
+                        StoredFile(entry.path, stat.st_size, stat.st_nlink, stat.st_mtime_ns)
+                    )
+        return found
+
+    def archive_path(self, submission_id: str) -> str:
+        return os.path.join(self.archive_dir, f"{submission_id}.zip")
+
+    def archive_sizes(self) -> Dict[str, int]:
+        """Size of every archive by submission id."""
+        try:
+            entries = os.scandir(self.archive_dir)
+        except FileNotFoundError:
+            return {}
+        with entries:
+            return {
+                entry.name[:-len(".zip")]: entry.stat().st_size
+                for entry in entries if entry.name.endswith(".zip")
+            }
+
+    def remove(self, files: Iterable[StoredFile]) -> Tuple[int, int]:
+        """Removes files. Returns (files removed, bytes freed); files still linked elsewhere free nothing."""
+        removed = freed = 0
+        for stored in files:
+            try:
+                os.remove(stored.path)
+            except FileNotFoundError:
+                continue
+            removed += 1
+            if stored.links <= 1:
+                freed += stored.size
+        return removed, freed
+
+    def remove_submission(self, submission: Dict, files: Optional[Dict[str, List[StoredFile]]] = None
+                          ) -> Tuple[int, int]:
+        """
+        Removes the artifacts of a deleted submission, loose and archived. files is
+        a scan() to take them from, scanned for just this submission if not given.
+        Returns (files removed, bytes freed).
+        """
+        file_ids = [entry["id"] for entry in submission["files"]]
+        if files is None:
+            files = self.scan(file_ids)
+        removed, freed = self.remove(stored for file_id in file_ids for stored in files.get(file_id, ()))
+        archive = self.archive_path(submission["id"])
+        try:
+            size = os.path.getsize(archive)
+            os.remove(archive)
+        except FileNotFoundError:
+            pass
+        else:
+            removed += 1
+            freed += size
+        return removed, freed
+
+    def remove_submissions(self, submissions: List[Dict]) -> Tuple[int, int]:
+        """
+        remove_submission for many deleted submissions, from one scan, spread over
+        REMOVE_WORKERS threads. Returns (files removed, bytes freed).
+        """
+        if len(submissions) <= 1:
+            return self.remove_submission(submissions[0]) if submissions else (0, 0)
+        files = self.scan(entry["id"] for submission in submissions for entry in submission["files"])
+        with ThreadPoolExecutor(max_workers=min(REMOVE_WORKERS, len(submissions))) as pool:
+            results = list(pool.map(lambda submission: self.remove_submission(submission, files), submissions))
+        return sum(removed for removed, _ in results), sum(freed for _, freed in results)
+
+    def pack(self, submission: Dict, files: Dict[str, List[StoredFile]]) -> Tuple[int, int]:
+        """
+        Packs the loose artifacts of a submission (taken from a scan()) into its
+        archive and removes them. A submission whose files change while it is
+        being packed is left as it was. Returns (files packed, bytes freed).
+        """
+        stored = [item for entry in submission["files"] for item in files.get(entry["id"], ())]
+        if not stored:
+            return 0, 0
+        archive = self.archive_path(submission["id"])
+        temp = f"{archive}.tmp"
+        os.makedirs(self.archive_dir, exist_ok=True)
+        with self._lock:
+            if os.path.exists(archive):
+                # Unpacked files are only left loose after the archive is gone
+                return 0, 0
+            with zipfile.ZipFile(temp, "w", zipfile.ZIP_DEFLATED) as packed:
+                manifest = {}
+                for item in stored:
+                    name = os.path.relpath(item.path, self.data_dir)
+                    packed.write(item.path, name)
+                    manifest[name] = item.mtime_ns
+                packed.writestr(_MANIFEST, json.dumps(manifest))
+            for item in stored:
+                stat = os.stat(item.path)
+                if (stat.st_size, stat.st_mtime_ns) != (item.size, item.mtime_ns):
+                    os.remove(temp)
+                    return 0, 0
+            os.replace(temp, archive)
+            removed, freed = self.remove(stored)
+        return removed, freed - os.path.getsize(archive)
+
+    def unpack(self, submission_id: str) -> bool:
+        """Puts a packed submission's artifacts back in place and drops the archive. False if it isn't packed."""
+        archive = self.archive_path(submission_id)
+        if not os.path.exists(archive):
+            return False
+        with self._lock:
+            if not os.path.exists(archive):
+                # Unpacked by another request meanwhile
+                return False
+            with zipfile.ZipFile(archive) as packed:
+                manifest = json.loads(packed.read(_MANIFEST))
+                for name, mtime_ns in manifest.items():
+                    path = os.path.join(self.data_dir, name)
+                    temp = f"{path}.unpack"
+                    with packed.open(name) as source, open(temp, "wb") as target:
+                        shutil.copyfileobj(source, target, CHUNK_SIZE)
+                    os.utime(temp, ns=(mtime_ns, mtime_ns))
+                    os.replace(temp, path)
+            os.remove(archive)
+        return True
+
+
+def _cutoff(now: datetime, days: int) -> Optional[str]:
+    # Submissions are stamped with naive local ISO timestamps, which sort as strings
+    return (now - timedelta(days=days)).isoformat() if days > 0 else None
+
+
+def apply_retention(store: SubmissionStore, files: ArtifactFiles, policy: RetentionPolicy,
+                    on_delete: Optional[Callable[[List[str]], None]] = None, dry_run: bool = False,
+                    now: Optional[datetime] = None) -> Dict:
+    """
+    Runs one sweep of policy over every stored submission. Deletions are made
+    in one store write at the end, and on_delete is called with the ids of the
+    submissions deleted. With dry_run nothing is changed and the report says
+    what would be deleted and packed. What packing saves depends on how well the
+    files compress, so a dry run checks the size limit as if it saved nothing
+    and may list more deletions than a real sweep makes.
+    Returns the counts and bytes: before, after and reclaimed.
+    """
+    now = now or datetime.now()
+    expire_before = _cutoff(now, policy.max_age_days)
+    pack_before = _cutoff(now, policy.archive_after_days)
+
+    stored = files.scan()
+    archives = files.archive_sizes()
+    # Oldest first: that is the order the size limit deletes in
+    submissions = sorted(store.list_submissions(), key=lambda submission: submission["timestamp"])
+
+    def size_of(submission: Dict) -> int:
+        loose = sum(item.size for entry in submission["files"] for item in stored.get(entry["id"], ()))
+        return loose + archives.get(submission["id"], 0)
+
+    bytes_before = sum(item.size for items in stored.values() for item in items) + sum(archives.values())
+    report = {
+        "dry_run": dry_run,
+        "submissions_deleted": 0,
+        "files_deleted": 0,
+        "submissions_packed": 0,
+        "files_packed": 0,
+        "bytes_before": bytes_before,
+        "bytes_reclaimed": 0,
+    }
+    usage = bytes_before
+    doomed: Dict[str, int] = {}
+
+    def delete(submission: Dict):
+        nonlocal usage
+        doomed[submission["id"]] = size_of(submission)
+        usage -= doomed[submission["id"]]
+
+    kept = []
+    for submission in submissions:
+        if expire_before is not None and submission["timestamp"] < expire_before:
+            delete(submission)
+        else:
+            kept.append(submission)
+
+    if pack_before is not None:
+        for submission in kept:
+            if submission["timestamp"] >= pack_before:
+                break
+            if submission["id"] in archives:
+                continue
+            if dry_run:
+                count = sum(len(stored.get(entry["id"], ())) for entry in submission["files"])
+                report["submissions_packed"] += bool(count)
+                report["files_packed"] += count
+                continue
+            loose = size_of(submission)
+            packed, freed = files.pack(submission, stored)
+            if packed:
+                report["submissions_packed"] += 1
+                report["files_packed"] += packed
+                report["bytes_reclaimed"] += freed
+                for entry in submission["files"]:
+                    stored.pop(entry["id"], None)
+                archives[submission["id"]] = os.path.getsize(files.archive_path(submission["id"]))
+                usage -= loose - archives[submission["id"]]
+
+    if policy.max_bytes > 0:
+        for submission in kept:
+            if usage <= policy.max_bytes:
+                break
+            delete(submission)
+
+    if dry_run:
+        deleted = [submission for submission in submissions if submission["id"] in doomed]
+        report["files_deleted"] = sum(len(stored.get(entry["id"], ())) for submission in deleted
+                                      for entry in submission["files"])
+        report["bytes_reclaimed"] += sum(doomed.values())
+    elif doomed:
+        deleted = store.delete_submissions(doomed)
+        # Whatever someone else deleted meanwhile wasn't reclaimed by this sweep
+        usage += sum(doomed.values()) - sum(doomed[submission["id"]] for submission in deleted)
+        if deleted and on_delete is not None:
+            on_delete([submission["id"] for submission in deleted])
+        report["files_deleted"], freed = files.remove_submissions(deleted)
+        report["bytes_reclaimed"] += freed
+    else:
+        deleted = []
+    report["submissions_deleted"] = len(deleted)
+    report["bytes_after"] = usage
+    return report
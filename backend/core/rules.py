@@ -0,0 +1,297 @@
+"""
+Discount rules.
+
+A rule gives `rate` off an order line, optionally only above a line total
+(`min_total`, exclusive) and only for one customer, one product or a date
+window (`start`/`end`, inclusive, either may be left open). When several rules
+match a line the highest rate wins; discounts don't stack.
+
+ORDER_DISCOUNT_RULES points at a JSON file holding a list of rules, e.g.
+
+    [{"min_total": 500, "rate": 0.10},
+     {"min_total": 2000, "rate": 0.15},
+     {"customer": "Acme Corp", "rate": 0.05},
+     {"product": "Laptop", "min_total": 1000, "rate": 0.12},
+     {"start": "2024-11-29", "end": "2024-12-02", "rate": 0.20}]
+
+Without it the built-in policy applies: 10% off line totals above $500.
+
+Rules are compiled once into lookup tables instead of being tried one by one:
+each scope (all lines, a customer, a product, a stretch of days) gets its
+thresholds sorted with the best rate reached at each, customers and products
+are hash maps of those, and date windows are cut into non-overlapping day
+ranges found by bisection. A line costs at most four lookups however many
+rules there are. bulk_rates() does the same with NumPy over whole columns.
+"""
+import bisect
+import hashlib
+import json
+from datetime import date
+from decimal import ROUND_FLOOR, Decimal
+from fractions import Fraction
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from . import config
+
+# The built-in policy: orders with a line total above the threshold get the rate off
+DISCOUNT_THRESHOLD = 500
+DISCOUNT_RATE = 0.10
+
+_FIELDS = ("rate", "min_total", "customer", "product", "start", "end")
+
+
+class DiscountRule(NamedTuple):
+    rate: float
+    min_total: Optional[float] = None
+    customer: Optional[str] = None
+    product: Optional[str] = None
+    start: Optional[date] = None
+    end: Optional[date] = None
+
+    def to_dict(self) -> Dict:
+        rule = {name: value for name, value in self._asdict().items() if value is not None}
+        for name in ("start", "end"):
+            if name in rule:
+                rule[name] = rule[name].isoformat()
+        return rule
+
+
+DEFAULT_RULES = (DiscountRule(DISCOUNT_RATE, min_total=DISCOUNT_THRESHOLD),)
+
+
+def _number(rule: Dict, name: str) -> Optional[float]:
+    value = rule.get(name)
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value != value:
+        raise ValueError(f"Discount rule {rule}: {name} must be a number")
+    return value
+
+
+def _day(rule: Dict, name: str) -> Optional[date]:
+    value = rule.get(name)
+    if value is None:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Discount rule {rule}: {name} must be a YYYY-MM-DD date") from None
+
+
+def parse_rules(data) -> List[DiscountRule]:
+    """Validates a JSON list of rules. Raises ValueError naming the first bad rule."""
+    if not isinstance(data, list):
+        raise ValueError("Discount rules must be a JSON list")
+    rules = []
+    for rule in data:
+        if not isinstance(rule, dict):
+            raise ValueError(f"Discount rule {rule!r} must be an object")
+        unknown = set(rule) - set(_FIELDS)
+        if unknown:
+            raise ValueError(f"Discount rule {rule}: unknown field(s) {', '.join(sorted(unknown))}")
+        rate = _number(rule, "rate")
+        if rate is None or not 0 <= rate <= 1:
+            raise ValueError(f"Discount rule {rule}: rate must be between 0 and 1")
+        for name in ("customer", "product"):
+            if name in rule and not isinstance(rule[name], str):
+                raise ValueError(f"Discount rule {rule}: {name} must be a string")
+        start, end = _day(rule, "start"), _day(rule, "end")
+        if start and end and start > end:
+            raise ValueError(f"Discount rule {rule}: start is after end")
+        scopes = ("customer" in rule) + ("product" in rule) + (start is not None or end is not None)
+        if scopes > 1:
+            raise ValueError(f"Discount rule {rule}: a rule applies to one customer, one product or one date window")
+        rules.append(DiscountRule(rate, _number(rule, "min_total"), rule.get("customer"), rule.get("product"),
+                                  start, end))
+    return rules
+
+
+def load_rules(path: str) -> List[DiscountRule]:
+    with open(path) as f:
+        try:
+            data = json.load(f)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Discount rules in {path} aren't valid JSON: {e}") from None
+    return parse_rules(data)
+
+
+def _cents_threshold(min_total: float) -> int:
+    # A cent total is above min_total exactly when it is above min_total's cents rounded down
+    return int((Decimal(str(min_total)) * 100).to_integral_value(ROUND_FLOOR))
+
+
+class _Tiers:
+    """The rules of one scope: thresholds in ascending order and the best rate once each is passed."""
+
+    def __init__(self, pairs: Iterable[Tuple[float, float]]):
+        pairs = sorted(pairs)
+        self.thresholds = [threshold for threshold, _ in pairs]
+        self.best = [0]
+        for _, rate in pairs:
+            self.best.append(max(self.best[-1], rate))
+
+    def lookup(self) -> Callable[[float], float]:
+        """rate(line_total): the best rate of the thresholds line_total is above, 0 for none (or nan)."""
+        thresholds, best = self.thresholds, self.best
+        if not thresholds:
+            return lambda total: 0
+        if len(thresholds) == 1:
+            threshold, top = thresholds[0], best[1]
+            # No nan check needed: nan > threshold is False, so nan gets 0
+            return lambda total: top if total > threshold else 0
+
+        def rate(total):
+            if total != total:
+                return 0
+            return best[bisect.bisect_left(thresholds, total)]
+
+        return rate
+
+
+class RuleSet:
+    """A list of discount rules compiled for lookup."""
+
+    def __init__(self, rules: Iterable[DiscountRule]):
+        self.rules = tuple(rules)
+        self.rates = frozenset(rule.rate for rule in self.rules)
+        self.scoped = any(rule.customer is not None or rule.product is not None
+                          or rule.start is not None or rule.end is not None for rule in self.rules)
+        canonical = json.dumps([rule.to_dict() for rule in self.rules], sort_keys=True)
+        self.fingerprint = hashlib.sha256(canonical.encode()).hexdigest()[:16]
+        self._lookups: Dict[bool, Callable] = {}
+
+    def _compile(self, cents: bool):
+        """(all lines, by customer, by product, day range starts, day range tiers), thresholds in dollars or cents."""
+        def pair(rule):
+            if rule.min_total is None:
+                return float("-inf"), rule.rate
+            return (_cents_threshold(rule.min_total) if cents else rule.min_total), rule.rate
+
+        everywhere, customers, products, windows = [], {}, {}, []
+        for rule in self.rules:
+            if rule.customer is not None:
+                customers.setdefault(rule.customer, []).append(pair(rule))
+            elif rule.product is not None:
+                products.setdefault(rule.product, []).append(pair(rule))
+            elif rule.start is not None or rule.end is not None:
+                start = rule.start.toordinal() if rule.start else date.min.toordinal()
+                end = rule.end.toordinal() + 1 if rule.end else date.max.toordinal() + 1
+                windows.append((start, end, pair(rule)))
+            else:
+                everywhere.append(pair(rule))
+
+        # Day ranges between consecutive window edges, each with the windows covering all of it
+        bounds = sorted({edge for start, end, _ in windows for edge in (start, end)})
+        segments = [_Tiers(())]
+        for low, high in zip(bounds, bounds[1:]):
+            segments.append(_Tiers(p for start, end, p in windows if start <= low and high <= end))
+        segments.append(_Tiers(()))
+
+        return (
+            _Tiers(everywhere),
+            {name: _Tiers(pairs) for name, pairs in customers.items()},
+            {name: _Tiers(pairs) for name, pairs in products.items()},
+            bounds,
+            segments,
+        )
+
+    def rate_function(self, cents: bool = False) -> Callable:
+        """
+        The rate lookup for one line. Without customer, product or date rules it is
+        rate(line_total); otherwise rate(line_total, customer_name, product_name, order_date).
+        Thresholds are compared with line totals in dollars, or in whole cents if cents.
+        """
+        if cents not in self._lookups:
+            self._lookups[cents] = self._rate_function(cents)
+        return self._lookups[cents]
+
+    def _rate_function(self, cents: bool) -> Callable:
+        everywhere, customers, products, bounds, segments = self._compile(cents)
+        everywhere = everywhere.lookup()
+        if not self.scoped:
+            return everywhere
+
+        customers = {name: tiers.lookup() for name, tiers in customers.items()}
+        products = {name: tiers.lookup() for name, tiers in products.items()}
+        segments = [tiers.lookup() if tiers.thresholds else None for tiers in segments]
+        # Order files repeat a handful of dates, so each day's range is found once
+        by_day: Dict[date, Optional[Callable]] = {}
+
+        def rate(total, customer_name, product_name, order_date):
+            best = everywhere(total)
+            if customers:
+                lookup = customers.get(customer_name)
+                if lookup is not None:
+                    best = max(best, lookup(total))
+            if products:
+                lookup = products.get(product_name)
+                if lookup is not None:
+                    best = max(best, lookup(total))
+            if bounds:
+                lookup = by_day.get(order_date, by_day)
+                if lookup is by_day:
+                    lookup = by_day[order_date] = segments[bisect.bisect_right(bounds, order_date.toordinal())]
+                if lookup is not None:
+                    best = max(best, lookup(total))
+            return best
+
+        return rate
+
+    def bulk_rates(self, totals, customer_names=None, product_names=None, order_days=None):
+        """
+        rate_function() over whole NumPy columns: line totals in dollars, and for
+        scoped rules the customer names, product names and order dates as day
+        ordinals (date.toordinal()). Returns an array of rates.
+        """
+        import numpy as np
+        import pandas as pd
+
+        everywhere, customers, products, bounds, segments = self._compile(False)
+        totals = np.asarray(totals, dtype=np.float64)
+
+        def apply(tiers: _Tiers, values):
+            return np.asarray(tiers.best, dtype=np.float64)[np.searchsorted(tiers.thresholds, values, side="left")]
+
+        rates = apply(everywhere, totals)
+
+        def apply_groups(codes, tiers_by_code):
+            # Rows sorted by group, so every group's tiers are applied to its rows in one call
+            order = np.argsort(codes, kind="stable")
+            starts = np.searchsorted(codes[order], np.arange(len(tiers_by_code) + 1))
+            for code, tiers in enumerate(tiers_by_code):
+                if tiers is not None and tiers.thresholds and starts[code] < starts[code + 1]:
+                    rows = order[starts[code]:starts[code + 1]]
+                    rates[rows] = np.maximum(rates[rows], apply(tiers, totals[rows]))
+
+        for names, tables in ((customer_names, customers), (product_names, products)):
+            if tables and len(totals):
+                codes, uniques = pd.factorize(np.asarray(names, dtype=object), sort=False)
+                apply_groups(codes, [tables.get(name) for name in uniques])
+        if bounds and len(totals):
+            codes = np.searchsorted(np.asarray(bounds), np.asarray(order_days, dtype=np.int64), side="right")
+            apply_groups(codes, segments)
+
+        rates[np.isnan(totals)] = 0
+        return rates
+
+
+_active: Dict[str, RuleSet] = {}
+
+
+def active_rules() -> RuleSet:
+    """
+    The configured rules (ORDER_DISCOUNT_RULES), compiled once per setting. The
+    file is read on first use; a change takes effect after a restart, like any
+    other setting that feeds the processing fingerprint.
+    """
+    source = config.DISCOUNT_RULES
+    rules = _active.get(source)
+    if rules is None:
+        rules = _active[source] = RuleSet(load_rules(source) if source else DEFAULT_RULES)
+    return rules
+
+
+def cents_rate(rate: float) -> Tuple[int, int, int]:
+    """(2 * numerator, denominator, 2 * denominator) of rate as an exact fraction, for half-up rounding in ints."""
+    exact = Fraction(str(rate))
+    return exact.numerator * 2, exact.denominator, exact.denominator * 2
@@ -0,0 +1,402 @@
+"""
+Submission storage.
+
+Submissions and their files live in a SubmissionStore. The default backend is
+an embedded SQLite database indexed by submission id, file id and timestamp,
+so appends and lookups don't depend on how much history has piled up. The
+legacy history.json format is kept as a second backend and as the source for
+a one-time import into SQLite.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+class SubmissionStore:
+    """Interface for persisting submissions. Submissions are dicts shaped like the /history entries."""
+
+    def add_submission(self, submission: Dict):
+        raise NotImplementedError
+
+    def query_submissions(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+                          since: Optional[str] = None, until: Optional[str] = None,
+                          filename: Optional[str] = None,
+                          summary: bool = False) -> Tuple[List[Dict], Optional[str]]:
+        """
+        Returns a page of submissions, newest first, and the cursor for the next page
+        (None on the last page). since/until bound the ISO timestamp (until is exclusive),
+        filename keeps submissions with a file whose name contains it (case-insensitive),
+        and summary=True returns only id, timestamp and file_count per submission.
+        Raises ValueError for a malformed cursor.
+        """
+        raise NotImplementedError
+
+    def list_submissions(self) -> List[Dict]:
+        """Returns all submissions, newest first."""
+        return self.query_submissions()[0]
+
+    def get_version(self) -> Tuple[int, float]:
+        """Returns (change counter, last-modified epoch seconds); the counter moves on every write."""
+        raise NotImplementedError
+
+    def get_submission(self, submission_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    def delete_submission(self, submission_id: str) -> Optional[Dict]:
+        """Removes a submission and returns it, or None if it doesn't exist."""
+        raise NotImplementedError
+
+    def delete_submissions(self, submission_ids: Iterable[str]) -> List[Dict]:
+        """
+        Removes many submissions in one write and returns the ones that existed,
+        in the order given. Backends that can't batch remove them one by one.
+        """
+        deleted = (self.delete_submission(submission_id) for submission_id in dict.fromkeys(submission_ids))
+        return [submission for submission in deleted if submission is not None]
+
+    def get_file(self, file_id: str) -> Optional[Dict]:
+        """Returns a file entry (with its submission_id), or None if it doesn't exist."""
+        raise NotImplementedError
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS submissions (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    timestamp TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_submissions_timestamp ON submissions(timestamp);
+
+CREATE TABLE IF NOT EXISTS files (
+    id TEXT PRIMARY KEY,
+    submission_id TEXT NOT NULL REFERENCES submissions(id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    filename TEXT NOT NULL,
+    upload_file TEXT,
+    output_file TEXT NOT NULL,
+    error_file TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_submission ON files(submission_id, position);
+
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Ids per IN (...) clause, well under SQLite's bound-parameter limit
+_BATCH = 500
+
+
+def _batches(ids: List[str]):
+    for start in range(0, len(ids), _BATCH):
+        yield ids[start:start + _BATCH]
+
+
+def _file_entry(row) -> Dict:
+    entry = {
+        "id": row["file_id"],
+        "filename": row["filename"],
+        "output_file": row["output_file"],
+        "error_file": row["error_file"],
+    }
+    if row["upload_file"]:
+        entry["upload_file"] = row["upload_file"]
+    return entry
+
+
+class SQLiteSubmissionStore(SubmissionStore):
+    """SQLite backend. Each thread gets its own connection; every write is one transaction."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _insert(self, conn: sqlite3.Connection, submission: Dict):
+        conn.execute(
+            "INSERT INTO submissions (id, timestamp) VALUES (?, ?)",
+            (submission["id"], submission["timestamp"]),
+        )
+        conn.executemany(
+            "INSERT INTO files (id, submission_id, position, filename, upload_file, output_file, error_file)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (f["id"], submission["id"], position, f["filename"], f.get("upload_file"),
+                 f["output_file"], f["error_file"])
+                for position, f in enumerate(submission["files"])
+            ],
+        )
+
+    def _touch(self, conn: sqlite3.Connection):
+        """Bumps the change counter and last-modified time inside the caller's transaction."""
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('modified', ?)"
+            " ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (repr(time.time()),),
+        )
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('version', '1')"
+            " ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def add_submission(self, submission: Dict):
+        with self._connect() as conn:
+            self._insert(conn, submission)
+            self._touch(conn)
+
+    def get_version(self) -> Tuple[int, float]:
+        rows = dict(self._connect().execute("SELECT key, value FROM meta WHERE key IN ('version', 'modified')"))
+        return int(rows.get("version", 0)), float(rows.get("modified", 0.0))
+
+    def _files_for(self, submission_ids: List[str]) -> Dict[str, List[Dict]]:
+        files: Dict[str, List[Dict]] = {submission_id: [] for submission_id in submission_ids}
+        conn = self._connect()
+        for batch in _batches(submission_ids):
+            rows = conn.execute(
+                "SELECT id AS file_id, submission_id, filename, upload_file, output_file, error_file"
+                f" FROM files WHERE submission_id IN ({', '.join('?' * len(batch))})"
+                " ORDER BY submission_id, position",
+                batch,
+            )
+            for row in rows:
+                files[row["submission_id"]].append(_file_entry(row))
+        return files
+
+    def query_submissions(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+                          since: Optional[str] = None, until: Optional[str] = None,
+                          filename: Optional[str] = None,
+                          summary: bool = False) -> Tuple[List[Dict], Optional[str]]:
+        clauses, params = [], []
+        if cursor is not None:
+            clauses.append("s.seq < ?")
+            params.append(int(cursor))
+        if since is not None:
+            clauses.append("s.timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("s.timestamp < ?")
+            params.append(until)
+        if filename:
+            escaped = filename.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+            clauses.append(
+                "EXISTS (SELECT 1 FROM files f WHERE f.submission_id = s.id AND f.filename LIKE ? ESCAPE '\\')"
+            )
+            params.append(f"%{escaped}%")
+
+        sql = (
+            "SELECT s.seq, s.id, s.timestamp,"
+            " (SELECT COUNT(*) FROM files f WHERE f.submission_id = s.id) AS file_count"
+            " FROM submissions s"
+        )
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY s.seq DESC"
+        if limit is not None:
+            # One extra row tells us whether there is a next page
+            sql += " LIMIT ?"
+            params.append(limit + 1)
+
+        rows = self._connect().execute(sql, params).fetchall()
+        next_cursor = None
+        if limit is not None and len(rows) > limit:
+            rows = rows[:limit]
+            next_cursor = str(rows[-1]["seq"])
+
+        if summary:
+            return [
+                {"id": row["id"], "timestamp": row["timestamp"], "file_count": row["file_count"]}
+                for row in rows
+            ], next_cursor
+
+        files = self._files_for([row["id"] for row in rows])
+        return [
+            {"id": row["id"], "timestamp": row["timestamp"], "files": files[row["id"]]}
+            for row in rows
+        ], next_cursor
+
+    def get_submission(self, submission_id: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT id, timestamp FROM submissions WHERE id = ?", (submission_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"id": row["id"], "timestamp": row["timestamp"], "files": self._files_for([row["id"]])[row["id"]]}
+
+    def delete_submission(self, submission_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            submission = self.get_submission(submission_id)
+            if submission is not None:
+                deleted = conn.execute("DELETE FROM submissions WHERE id = ?", (submission_id,)).rowcount
+                if not deleted:
+                    # Someone else got there first
+                    return None
+                self._touch(conn)
+        return submission
+
+    def delete_submissions(self, submission_ids: Iterable[str]) -> List[Dict]:
+        ids = list(dict.fromkeys(submission_ids))
+        conn = self._connect()
+        with conn:
+            # Holding the write lock from the start, nobody can delete what is read here before it goes
+            conn.execute("BEGIN IMMEDIATE")
+            timestamps = {}
+            for batch in _batches(ids):
+                timestamps.update(conn.execute(
+                    f"SELECT id, timestamp FROM submissions WHERE id IN ({', '.join('?' * len(batch))})", batch
+                ).fetchall())
+            found = [submission_id for submission_id in ids if submission_id in timestamps]
+            files = self._files_for(found)
+            for batch in _batches(found):
+                conn.execute(f"DELETE FROM submissions WHERE id IN ({', '.join('?' * len(batch))})", batch)
+            if found:
+                self._touch(conn)
+        return [
+            {"id": submission_id, "timestamp": timestamps[submission_id], "files": files[submission_id]}
+            for submission_id in found
+        ]
+
+    def get_file(self, file_id: str) -> Optional[Dict]:
+        row = self._connect().execute(
+            "SELECT id AS file_id, submission_id, filename, upload_file, output_file, error_file"
+            " FROM files WHERE id = ?",
+            (file_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        entry = _file_entry(row)
+        entry["submission_id"] = row["submission_id"]
+        return entry
+
+    def import_history_json(self, history_path: str) -> int:
+        """
+        One-time import of a legacy history.json. Later calls are no-ops.
+        Returns the number of submissions imported.
+        """
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'history_json_imported'").fetchone():
+                return 0
+            imported = 0
+            for submission in reversed(load_history_json(history_path)):
+                # Entries from before multi-file submissions have no 'files' key
+                if "files" not in submission:
+                    continue
+                if conn.execute("SELECT 1 FROM submissions WHERE id = ?", (submission["id"],)).fetchone():
+                    continue
+                self._insert(conn, submission)
+                imported += 1
+            if imported:
+                self._touch(conn)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('history_json_imported', ?)", (history_path,))
+        return imported
+
+
+def load_history_json(path: str) -> List[Dict]:
+    try:
+        with open(path, "r") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+class JsonSubmissionStore(SubmissionStore):
+    """Legacy backend that rewrites a whole history.json on every change."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        if not os.path.exists(path):
+            self._save([])
+
+    def _save(self, history: List[Dict]):
+        with open(self.path, "w") as f:
+            json.dump(history, f, indent=4)
+
+    def add_submission(self, submission: Dict):
+        with self._lock:
+            history = [item for item in load_history_json(self.path) if "files" in item]
+            history.insert(0, submission)
+            self._save(history)
+
+    def query_submissions(self, limit: Optional[int] = None, cursor: Optional[str] = None,
+                          since: Optional[str] = None, until: Optional[str] = None,
+                          filename: Optional[str] = None,
+                          summary: bool = False) -> Tuple[List[Dict], Optional[str]]:
+        # The cursor is an offset into the filtered history
+        offset = int(cursor) if cursor is not None else 0
+        needle = filename.lower() if filename else None
+        matches = [
+            item for item in load_history_json(self.path)
+            if "files" in item
+            and (since is None or item["timestamp"] >= since)
+            and (until is None or item["timestamp"] < until)
+            and (needle is None or any(needle in f["filename"].lower() for f in item["files"]))
+        ]
+        end = len(matches) if limit is None else offset + limit
+        page = matches[offset:end]
+        next_cursor = str(end) if end < len(matches) else None
+        if summary:
+            page = [{"id": item["id"], "timestamp": item["timestamp"], "file_count": len(item["files"])} for item in page]
+        return page, next_cursor
+
+    def get_version(self) -> Tuple[int, float]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return 0, 0.0
+        return stat.st_mtime_ns, stat.st_mtime
+
+    def get_submission(self, submission_id: str) -> Optional[Dict]:
+        return next((item for item in self.list_submissions() if item["id"] == submission_id), None)
+
+    def delete_submission(self, submission_id: str) -> Optional[Dict]:
+        with self._lock:
+            history = load_history_json(self.path)
+            submission = next((item for item in history if item["id"] == submission_id), None)
+            if submission is not None:
+                self._save([item for item in history if item["id"] != submission_id])
+        return submission
+
+    def delete_submissions(self, submission_ids: Iterable[str]) -> List[Dict]:
+        wanted = list(dict.fromkeys(submission_ids))
+        ids = set(wanted)
+        with self._lock:
+            history = load_history_json(self.path)
+            found = {item["id"]: item for item in history if item["id"] in ids}
+            if found:
+                self._save([item for item in history if item["id"] not in found])
+        return [found[submission_id] for submission_id in wanted if submission_id in found]
+
+    def get_file(self, file_id: str) -> Optional[Dict]:
+        for submission in self.list_submissions():
+            for entry in submission["files"]:
+                if entry["id"] == file_id:
+                    return dict(entry, submission_id=submission["id"])
+        return None
+
+
+def open_store(backend: str, data_dir: str) -> SubmissionStore:
+    """Opens the configured backend under data_dir, importing history.json into SQLite once."""
+    history_path = os.path.join(data_dir, "history.json")
+    if backend == "json":
+        return JsonSubmissionStore(history_path)
+    if backend == "sqlite":
+        store = SQLiteSubmissionStore(os.path.join(data_dir, "submissions.db"))
+        store.import_history_json(history_path)
+        return store
+    raise ValueError(f"Unknown store backend: {backend}. Expected 'sqlite' or 'json'")
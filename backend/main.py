@@ -1,8 +1,22 @@
+import logging
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
 from .api import routes
+from .core import metrics
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Sets up each worker before it serves requests, and shuts its process pool down after."""
+    logging.basicConfig(level=logging.INFO)
+    await run_in_threadpool(routes.startup)
+    yield
+    routes.shutdown()
 
-app = FastAPI(title="Order Processing API")
+app = FastAPI(title="Order Processing API", lifespan=lifespan)
 
 # Configure CORS
 app.add_middleware(
@@ -11,6 +25,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["ETag", "Last-Modified", "X-Next-Cursor"],
 )
 
 app.include_router(routes.router, prefix="/api")
@@ -18,3 +33,8 @@ app.include_router(routes.router, prefix="/api")
 @app.get("/")
 async def root():
     return {"message": "Order Processing API is running"}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    """Processing counters and stage timings in the Prometheus text format."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
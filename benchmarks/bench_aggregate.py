@@ -0,0 +1,136 @@
+"""
+Memory per customer and updates/sec of the customer aggregators.
+
+    python -m benchmarks.bench_aggregate --customers 10000 1000000 --updates 2000000
+
+Feeds the same order totals (drawn uniformly over the given number of customer
+names) into the aggregators as they were before, a dict of CustomerSummary
+models in float mode and a dict of lists in cents mode, and into the current
+array-backed ones. Memory is what tracemalloc sees held by the aggregator once
+every customer has been added, divided by the number of customers.
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from backend.core.models import CustomerSummary, ProcessingResult
+from backend.core.processor import CentsAggregator, CustomerAggregator
+
+
+class ModelAggregator:
+    """CustomerAggregator as it was before: one CustomerSummary per customer, updated field by field."""
+
+    def __init__(self):
+        self.customers = {}
+        self.grand_total_gross = self.grand_total_discount = self.grand_total_net = 0.0
+
+    def add_totals(self, customer_name, quantity, line_total, discount, net_total):
+        summary = self.customers.get(customer_name)
+        if summary is None:
+            summary = CustomerSummary(customer_name=customer_name, order_count=0, total_items=0,
+                                      gross_total=0.0, total_discount=0.0, net_total=0.0)
+            self.customers[customer_name] = summary
+        summary.order_count += 1
+        summary.total_items += quantity
+        summary.gross_total += line_total
+        summary.total_discount += discount
+        summary.net_total += net_total
+        self.grand_total_gross += line_total
+        self.grand_total_discount += discount
+        self.grand_total_net += net_total
+
+    def result(self):
+        return ProcessingResult(summary_report=list(self.customers.values()), grand_total_gross=self.grand_total_gross,
+                                grand_total_discount=self.grand_total_discount,
+                                grand_total_net=self.grand_total_net)
+
+
+class ListAggregator:
+    """CentsAggregator as it was before: a list of five ints per customer."""
+
+    def __init__(self):
+        self.customers = {}
+        self.grand_total_gross = self.grand_total_discount = self.grand_total_net = 0
+
+    def add_totals(self, customer_name, quantity, line_total, discount, net_total):
+        summary = self.customers.get(customer_name)
+        if summary is None:
+            self.customers[customer_name] = [1, quantity, line_total, discount, net_total]
+        else:
+            summary[0] += 1
+            summary[1] += quantity
+            summary[2] += line_total
+            summary[3] += discount
+            summary[4] += net_total
+        self.grand_total_gross += line_total
+        self.grand_total_discount += discount
+        self.grand_total_net += net_total
+
+
+def order_totals(rng, customers, count, cents):
+    names = [f"Customer {i:07d}" for i in range(customers)]
+    orders = []
+    for _ in range(count):
+        quantity = rng.randint(1, 10)
+        gross = quantity * rng.randrange(100, 100_000) if cents else quantity * rng.uniform(1, 1000)
+        discount = gross // 10 if cents else gross * 0.1
+        orders.append((rng.choice(names), quantity, gross, discount, gross - discount))
+    return names, orders
+
+
+def bytes_per_customer(make, names, orders):
+    """Memory held by an aggregator holding every name, per customer."""
+    # Names are copied so the aggregator owns them, as it does names split from lines
+    owned = [name.encode().decode() for name in names]
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    aggregator = make()
+    zero = type(orders[0][2])()
+    for name, (_, quantity, gross, discount, net) in zip(owned, orders):
+        # Fresh values too, as each line computes its own
+        aggregator.add_totals(name, quantity, gross + zero, discount + zero, net + zero)
+    del owned
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return held / len(names), aggregator
+
+
+def updates_per_second(make, orders, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        aggregator = make()
+        add = aggregator.add_totals
+        start = time.perf_counter()
+        for order in orders:
+            add(*order)
+        best = min(best, time.perf_counter() - start)
+    return len(orders) / best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--customers", type=int, nargs="+", default=[10_000, 200_000])
+    parser.add_argument("--updates", type=int, default=1_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=24)
+    args = parser.parse_args()
+
+    print(f"{args.updates:,} updates per run, best of {args.repeat}")
+    print(f"{'mode':<6} {'customers':>10} {'aggregator':<20} {'bytes/customer':>15} {'updates/sec':>13}")
+    for cents, modes in ((False, (("models", ModelAggregator), ("arrays", CustomerAggregator))),
+                         (True, (("lists", ListAggregator), ("arrays", CentsAggregator)))):
+        for customers in args.customers:
+            rng = random.Random(args.seed)
+            names, orders = order_totals(rng, customers, args.updates, cents)
+            # One order per customer first, so every name is there for the memory count
+            first = [(name, *order[1:]) for name, order in zip(names, orders * (customers // len(orders) + 1))]
+            for label, make in modes:
+                size, _ = bytes_per_customer(make, names, first)
+                rate = updates_per_second(make, orders, args.repeat)
+                mode = "cents" if cents else "float"
+                print(f"{mode:<6} {customers:>10,} {label:<20} {size:>15,.0f} {rate:>11,.0f}/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Load test: /api/history latency while large uploads are being processed.
+
+    python -m benchmarks.bench_history_latency --uploads 4 --lines 300000
+
+Runs the app in-process over ASGI, starts the uploads concurrently and polls
+GET /api/history until they finish, then prints latency percentiles. If the
+upload route blocked the event loop, the history p99 would be about as long as
+a whole upload.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import tempfile
+import time
+
+from benchmarks.generate import iter_order_lines
+
+
+def make_orders(lines: int, seed: int) -> bytes:
+    return "".join(f"{line}\n" for line in iter_order_lines(lines, customers=5000, seed=seed)).encode()
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def run(uploads: int, lines: int, interval: float):
+    import httpx
+    from backend.main import app
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+    # Distinct seeds so the result cache can't short-circuit the work
+    bodies = [make_orders(lines, seed) for seed in range(uploads)]
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport doesn't send lifespan events, so the app's setup is run here
+    async with app.router.lifespan_context(app), \
+            httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+        await client.get("/api/history")
+
+        async def upload(body):
+            start = time.perf_counter()
+            response = await client.post("/api/upload", files=[("files", ("orders.txt", body, "text/plain"))])
+            response.raise_for_status()
+            return time.perf_counter() - start
+
+        tasks = [asyncio.create_task(upload(body)) for body in bodies]
+        latencies = []
+        while not all(task.done() for task in tasks):
+            start = time.perf_counter()
+            response = await client.get("/api/history", params={"view": "summary", "limit": 50})
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+            await asyncio.sleep(interval)
+        upload_times = await asyncio.gather(*tasks)
+
+    print(f"{uploads} uploads x {lines:,} lines, slowest upload {max(upload_times):.2f}s")
+    print(f"/api/history: {len(latencies)} requests")
+    for label, value in (
+        ("p50", statistics.median(latencies)),
+        ("p95", percentile(latencies, 0.95)),
+        ("p99", percentile(latencies, 0.99)),
+        ("max", max(latencies)),
+    ):
+        print(f"  {label}: {value * 1000:8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uploads", type=int, default=4)
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--interval", type=float, default=0.01, help="pause between history polls (seconds)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["ORDER_DATA_DIR"] = data_dir
+        asyncio.run(run(args.uploads, args.lines, args.interval))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Measures how process-pool processing scales with the number of workers.
+
+    python -m benchmarks.bench_parallel --lines 2000000 --workers 1 2 4 8
+
+Each run processes the same generated file, serial first, then split across
+the given worker counts, and prints the wall time and speedup. Files are only
+split in cents money mode, so the benchmark runs in that mode.
+"""
+import argparse
+import os
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.core import config
+from backend.core.parallel import process_file_parallel
+from backend.core.processor import process_file
+from benchmarks.generate import add_arguments, write_orders
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser, lines=500_000)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+    # Pool workers started by fork inherit the setting, spawned ones read the environment
+    os.environ["ORDER_MONEY_MODE"] = config.MONEY_MODE = "cents"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        upload = os.path.join(tmp, "orders.txt")
+        output = os.path.join(tmp, "output.txt")
+        error = os.path.join(tmp, "error.txt")
+        write_orders(upload, args.lines, args.customers, args.error_rate, args.discount_rate, args.seed)
+        size_mb = os.path.getsize(upload) / 1024 / 1024
+
+        start = time.perf_counter()
+        process_file(upload, output, error)
+        serial = time.perf_counter() - start
+        print(f"{args.lines:,} lines ({size_mb:.1f} MB), {os.cpu_count()} CPUs")
+        print(f"{'workers':>8} {'seconds':>9} {'lines/s':>12} {'speedup':>8}")
+        print(f"{'serial':>8} {serial:>9.2f} {args.lines / serial:>12,.0f} {1.0:>8.2f}")
+
+        for workers in sorted(set(args.workers)):
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # Warm the pool so worker start-up isn't counted
+                list(executor.map(abs, range(workers)))
+                start = time.perf_counter()
+                process_file_parallel(executor, workers, upload, output, error, split_bytes=0)
+                elapsed = time.perf_counter() - start
+            print(f"{workers:>8} {elapsed:>9.2f} {args.lines / elapsed:>12,.0f} {serial / elapsed:>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Microbenchmark for the per-line parser.
+
+    python -m benchmarks.bench_parser --lines 200000 --error-rate 0.05
+
+Compares lines/sec for the original parse path (strptime on every row, then
+Order/ProcessedOrder models for every valid line) with the fast path the
+processor uses now (parse_order_fields + the compiled totals function +
+add_totals), on the same generated lines.
+"""
+import argparse
+import time
+from datetime import datetime
+
+from backend.core.models import Order
+from backend.core.processor import (
+    CustomerAggregator, calculate_totals, parse_order_fields, pricing,
+)
+from benchmarks.generate import add_arguments, iter_order_lines
+
+
+def legacy_parse(line):
+    """
+    parse_order_line as it was before the fast path: strptime and pydantic on every
+    line. tests/test_processor.py checks the fast path against it line by line.
+    """
+    parts = line.strip().split('|')
+    if len(parts) != 6:
+        return None, f"Invalid format: Expected 6 fields, got {len(parts)}. Line: {line.strip()}"
+    order_id, customer_name, product_name, quantity_str, unit_price_str, order_date_str = parts
+    try:
+        quantity = int(quantity_str)
+        if quantity < 0:
+            return None, f"Invalid quantity: {quantity}. Must be non-negative. Line: {line.strip()}"
+    except ValueError:
+        return None, f"Invalid quantity format: {quantity_str}. Line: {line.strip()}"
+    try:
+        unit_price = float(unit_price_str)
+        if unit_price < 0:
+            return None, f"Invalid unit price: {unit_price}. Must be non-negative. Line: {line.strip()}"
+    except ValueError:
+        return None, f"Invalid unit price format: {unit_price_str}. Line: {line.strip()}"
+    try:
+        order_date = datetime.strptime(order_date_str, '%Y-%m-%d').date()
+    except ValueError:
+        return None, f"Invalid date format: {order_date_str}. Expected YYYY-MM-DD. Line: {line.strip()}"
+    return Order(
+        order_id=order_id.strip(),
+        customer_name=customer_name.strip(),
+        product_name=product_name.strip(),
+        quantity=quantity,
+        unit_price=unit_price,
+        order_date=order_date
+    ), None
+
+
+def run_legacy(lines):
+    aggregator = CustomerAggregator()
+    for line in lines:
+        order, error = legacy_parse(line)
+        if not error:
+            aggregator.add(calculate_totals(order))
+    return aggregator
+
+
+def run_fast(lines):
+    aggregator = CustomerAggregator()
+    _, totals_of = pricing()
+    for line in lines:
+        record, error = parse_order_fields(line)
+        if not error:
+            aggregator.add_totals(record.customer_name, record.quantity, *totals_of(record))
+    return aggregator
+
+
+def parse_only_legacy(lines):
+    for line in lines:
+        legacy_parse(line)
+
+
+def parse_only_fast(lines):
+    for line in lines:
+        parse_order_fields(line)
+
+
+def best_of(repeat, fn, lines):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn(lines)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser, lines=200_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    lines = list(iter_order_lines(args.lines, args.customers, args.error_rate, args.discount_rate, args.seed))
+    assert run_legacy(lines).result() == run_fast(lines).result()
+
+    print(f"{args.lines:,} lines, {args.error_rate:.0%} errors, best of {args.repeat}")
+    print(f"{'stage':<24} {'before':>12} {'after':>12} {'speedup':>8}")
+    for label, before, after in (
+        ("parse", parse_only_legacy, parse_only_fast),
+        ("parse + aggregate", run_legacy, run_fast),
+    ):
+        old = best_of(args.repeat, before, lines)
+        new = best_of(args.repeat, after, lines)
+        print(f"{label:<24} {args.lines / old:>10,.0f}/s {args.lines / new:>10,.0f}/s {old / new:>7.2f}x")
+
+
+if __name__ == "__main__":
+    main()
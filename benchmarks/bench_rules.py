@@ -0,0 +1,101 @@
+"""
+Discount rule cost per row as the number of rules grows.
+
+    python -m benchmarks.bench_rules --lines 200000 --rules 1 10 100 1000 10000
+
+Builds that many random rules (tiers, customer, product and date-window rules
+in equal shares) and times the compiled per-line lookup the processor uses, the
+NumPy bulk lookup the columnar engine uses and, for comparison, trying every
+rule on every row. The compiled lookups should stay nearly flat as rules are
+added (at most four lookups per row, each a hash or a bisection).
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+
+import numpy as np
+
+from backend.core.rules import RuleSet, parse_rules
+
+_FIRST_DAY = date(2024, 1, 1)
+
+
+def random_rules(rng: random.Random, count: int, customers: int, products: int):
+    rules = []
+    for i in range(count):
+        rule = {"rate": rng.choice([0.05, 0.1, 0.15, 0.2]), "min_total": rng.choice([0, 100, 500, 1000, 2500])}
+        scope = i % 4
+        if scope == 1:
+            rule["customer"] = f"Customer {rng.randrange(customers)}"
+        elif scope == 2:
+            rule["product"] = f"Product {rng.randrange(products)}"
+        elif scope == 3:
+            start = _FIRST_DAY + timedelta(days=rng.randrange(365))
+            rule["start"], rule["end"] = start.isoformat(), (start + timedelta(days=rng.randrange(14))).isoformat()
+        rules.append(rule)
+    return parse_rules(rules)
+
+
+def rule_by_rule(rules, total, customer, product, day):
+    best = 0
+    for rule in rules:
+        if (rule.min_total is None or total > rule.min_total) and rule.customer in (None, customer) \
+                and rule.product in (None, product) and (rule.start is None or rule.start <= day) \
+                and (rule.end is None or day <= rule.end):
+            best = max(best, rule.rate)
+    return best
+
+
+def best_of(repeat, fn):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--lines", type=int, default=200_000)
+    parser.add_argument("--rules", type=int, nargs="+", default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--customers", type=int, default=1_000)
+    parser.add_argument("--products", type=int, default=100)
+    parser.add_argument("--naive-lines", type=int, default=2_000,
+                        help="rows for the rule-by-rule comparison, which is too slow for the full set")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    lines = [
+        (rng.randint(1, 10) * rng.uniform(1, 999), f"Customer {rng.randrange(args.customers)}",
+         f"Product {rng.randrange(args.products)}", _FIRST_DAY + timedelta(days=rng.randrange(365)))
+        for _ in range(args.lines)
+    ]
+    totals = np.array([line[0] for line in lines])
+    customers = np.array([line[1] for line in lines], dtype=object)
+    products = np.array([line[2] for line in lines], dtype=object)
+    days = np.array([line[3].toordinal() for line in lines])
+    naive_lines = lines[:args.naive_lines]
+
+    print(f"{args.lines:,} rows, best of {args.repeat}, ns per row")
+    print(f"{'rules':>8} {'compile':>10} {'per line':>10} {'bulk':>10} {'rule by rule':>14}")
+    for count in args.rules:
+        rules = random_rules(rng, count, args.customers, args.products)
+        start = time.perf_counter()
+        ruleset = RuleSet(rules)
+        rate = ruleset.rate_function()
+        compiled = time.perf_counter() - start
+
+        per_line = best_of(args.repeat, lambda: [rate(*line) for line in lines]) if ruleset.scoped \
+            else best_of(args.repeat, lambda: [rate(line[0]) for line in lines])
+        bulk = best_of(args.repeat, lambda: ruleset.bulk_rates(totals, customers, products, days))
+        naive = best_of(1, lambda: [rule_by_rule(rules, *line) for line in naive_lines])
+        print(f"{count:>8,} {compiled * 1e3:>8.1f}ms {per_line / args.lines * 1e9:>10,.0f} "
+              f"{bulk / args.lines * 1e9:>10,.0f} {naive / len(naive_lines) * 1e9:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
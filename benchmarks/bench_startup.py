@@ -0,0 +1,120 @@
+"""
+Cold-start cost of an API worker: importing backend.main, then the lifespan setup.
+
+    python -m benchmarks.bench_startup --repeat 5 --import-budget-ms 1500 --startup-budget-ms 500
+
+Each run is a fresh interpreter started with -X importtime, so every module is
+imported from scratch (from its cached bytecode) the way a newly started
+uvicorn worker does it. The import time of each module is reported (the
+backend's own modules and the heaviest third-party packages), along with the
+time routes.startup() takes on an empty data directory. Medians over --repeat
+runs are checked against the budgets, and optional dependencies that only some
+requests need (pandas, NumPy, pyarrow, tabulate, zstandard) must not be
+imported by startup at all. The run exits with status 1 if a check fails.
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+from typing import Dict, List, Tuple
+
+IMPORT_BUDGET_MS = 1500
+STARTUP_BUDGET_MS = 500
+
+# Loaded on first use by the requests that need them, never at startup
+LAZY_MODULES = ("pandas", "numpy", "pyarrow", "tabulate", "zstandard")
+
+_MARKER = "-- startup --"
+
+_WORKER = f"""
+import sys, time, json
+start = time.perf_counter()
+import backend.main
+imported = time.perf_counter() - start
+sys.stderr.write({_MARKER!r} + "\\n")
+eager = [name for name in {LAZY_MODULES!r} if name in sys.modules]
+from backend.api import routes
+start = time.perf_counter()
+routes.startup()
+started = time.perf_counter() - start
+routes.shutdown()
+print(json.dumps({{"import": imported, "startup": started, "eager": eager}}))
+"""
+
+
+def parse_importtime(stderr: str) -> Dict[str, Tuple[int, int, int]]:
+    """(self us, cumulative us, depth) per module from -X importtime output, up to the startup marker."""
+    modules = {}
+    for line in stderr.splitlines():
+        if line == _MARKER:
+            break
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # Nested imports are indented two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(self_us), int(cumulative_us), depth)
+    return modules
+
+
+def run_once(data_dir: str) -> Tuple[Dict, Dict[str, Tuple[int, int, int]]]:
+    env = dict(os.environ, ORDER_DATA_DIR=data_dir)
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _WORKER],
+        capture_output=True, text=True, env=env, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1]), parse_importtime(completed.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8, help="third-party packages to list")
+    parser.add_argument("--import-budget-ms", type=float, default=IMPORT_BUDGET_MS)
+    parser.add_argument("--startup-budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    args = parser.parse_args()
+
+    runs: List[Dict] = []
+    timings: Dict[str, List[Tuple[int, int, int]]] = {}
+    for _ in range(args.repeat):
+        # A fresh data directory each time: startup creates and opens everything
+        with tempfile.TemporaryDirectory() as data_dir:
+            summary, modules = run_once(data_dir)
+        runs.append(summary)
+        for name, timing in modules.items():
+            timings.setdefault(name, []).append(timing)
+
+    def median(name: str, field: int) -> float:
+        return statistics.median(timing[field] for timing in timings[name]) / 1000
+
+    backend = sorted((name for name in timings if name.split(".")[0] == "backend"), key=lambda n: -median(n, 1))
+    # Top-level packages outside the standard library, timed where they were first imported
+    third_party = sorted(
+        (name for name in timings if "." not in name and name != "backend"
+         and name.lstrip("_") not in sys.stdlib_module_names),
+        key=lambda n: -median(n, 1),
+    )[:args.top]
+    print(f"{'module':<36} {'self ms':>9} {'cumulative ms':>14}")
+    for name in backend + third_party:
+        print(f"{name:<36} {median(name, 0):>9.1f} {median(name, 1):>14.1f}")
+
+    failures = []
+    for label, key, budget in (("import backend.main", "import", args.import_budget_ms),
+                               ("routes.startup()", "startup", args.startup_budget_ms)):
+        value = statistics.median(run[key] for run in runs) * 1000
+        verdict = "ok" if value <= budget else "OVER BUDGET"
+        print(f"{label:<24} {value:8.1f} ms (median of {args.repeat}), budget {budget:.0f} ms: {verdict}")
+        if value > budget:
+            failures.append(label)
+    eager = sorted({name for run in runs for name in run["eager"]})
+    if eager:
+        print(f"imported at startup but meant to load lazily: {', '.join(eager)}")
+        failures.append("lazy imports")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
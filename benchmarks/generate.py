@@ -0,0 +1,93 @@
+"""
+Seeded generator for synthetic order files.
+
+    python -m benchmarks.generate orders.txt --lines 10000000 --customers 50000 \
+        --error-rate 0.02 --discount-rate 0.1 --seed 42
+
+The same arguments always produce the same bytes. Lines are written as they are
+generated, so file size is limited only by disk. Invalid lines cycle through the
+kinds of errors the processor reports (field count, quantity, price, date).
+--discount-rate is the share of valid lines whose total is over the discount
+threshold.
+"""
+import argparse
+import random
+from typing import Iterator
+
+from backend.core.rules import DISCOUNT_THRESHOLD
+
+_PRODUCTS = 100
+
+
+def _invalid_line(rng: random.Random, i: int, customer: str) -> str:
+    kind = rng.randrange(5)
+    if kind == 0:
+        return f"ORD{i}|{customer}|Product {rng.randrange(_PRODUCTS)}|{rng.randint(1, 10)}"
+    if kind == 1:
+        return f"ORD{i}|{customer}|Product 1|{rng.choice(['x', '1.5', ''])}|10.00|2024-03-01"
+    if kind == 2:
+        return f"ORD{i}|{customer}|Product 1|-{rng.randint(1, 10)}|10.00|2024-03-01"
+    if kind == 3:
+        return f"ORD{i}|{customer}|Product 1|1|{rng.choice(['abc', '-5.00'])}|2024-03-01"
+    return f"ORD{i}|{customer}|Product 1|1|10.00|{rng.choice(['2024-02-30', '03/15/2024', '2024-13-01'])}"
+
+
+def iter_order_lines(lines: int, customers: int = 1_000, error_rate: float = 0.0,
+                     discount_rate: float = 0.1, seed: int = 42) -> Iterator[str]:
+    """Yields `lines` order lines (without newlines)."""
+    rng = random.Random(seed)
+    for i in range(lines):
+        customer = f"Customer {rng.randrange(customers)}"
+        if rng.random() < error_rate:
+            yield _invalid_line(rng, i, customer)
+            continue
+
+        quantity = rng.randint(1, 10)
+        limit = DISCOUNT_THRESHOLD / quantity
+        if rng.random() < discount_rate:
+            unit_price = rng.uniform(limit + 0.01, limit + 200)
+        else:
+            unit_price = rng.uniform(1, min(200, limit - 0.01))
+        yield (
+            f"ORD{i}|{customer}|Product {rng.randrange(_PRODUCTS)}|{quantity}|{unit_price:.2f}|"
+            f"2024-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        )
+
+
+def write_orders(path: str, lines: int, customers: int = 1_000, error_rate: float = 0.0,
+                 discount_rate: float = 0.1, seed: int = 42) -> int:
+    """Writes a generated order file. Returns its size in bytes."""
+    size = 0
+    with open(path, "w", newline="\n") as f:
+        batch = []
+        for line in iter_order_lines(lines, customers, error_rate, discount_rate, seed):
+            batch.append(line)
+            if len(batch) == 10_000:
+                size += f.write("\n".join(batch) + "\n")
+                batch = []
+        if batch:
+            size += f.write("\n".join(batch) + "\n")
+    return size
+
+
+def add_arguments(parser: argparse.ArgumentParser, lines: int = 100_000):
+    """The generator options, shared by the benchmarks."""
+    parser.add_argument("--lines", type=int, default=lines)
+    parser.add_argument("--customers", type=int, default=1_000, help="distinct customer names")
+    parser.add_argument("--error-rate", type=float, default=0.02, help="share of invalid lines")
+    parser.add_argument("--discount-rate", type=float, default=0.1, help="share of valid lines over the discount threshold")
+    parser.add_argument("--seed", type=int, default=42)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("path")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    size = write_orders(args.path, args.lines, args.customers, args.error_rate, args.discount_rate, args.seed)
+    print(f"Wrote {args.lines:,} lines ({size / 1024 / 1024:.1f} MB) to {args.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,174 @@
+"""
+Benchmark suite for the processing pipeline.
+
+    python -m benchmarks.suite --lines 1000000 --output results.json
+    python -m benchmarks.suite --lines 1000000 --baseline results.json --threshold 0.1
+
+Generates an order file with benchmarks.generate, then times each stage:
+parse_order_line, calculate_totals, generate_report, render_report on an
+in-memory sample of --micro-lines lines; process_file on the whole file; and
+POST /api/upload end to end through the FastAPI TestClient. Each timing is the
+best of --repeat runs.
+
+Results are written as JSON (--output). With --baseline, every benchmark is
+compared to the same one in an earlier results file, and the run exits with
+status 1 if any got slower by more than --threshold.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.generate import add_arguments, iter_order_lines, write_orders
+
+
+def best_of(repeat: int, fn: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(args, only: Optional[List[str]] = None) -> Dict[str, Dict]:
+    """Runs the benchmarks and returns {name: {"seconds", "items", "per_second"}}."""
+    from backend.core.processor import (
+        calculate_totals, generate_report, parse_order_line, process_file, render_report,
+    )
+
+    results = {}
+
+    def record(name: str, items: int, fn: Callable[[], object]):
+        if only and name not in only:
+            return
+        seconds = best_of(args.repeat, fn)
+        results[name] = {"seconds": seconds, "items": items, "per_second": items / seconds if seconds else None}
+        print(f"  {name:<20} {seconds:>9.4f}s {results[name]['per_second']:>14,.0f} items/s", flush=True)
+
+    sample = list(islice(
+        iter_order_lines(args.lines, args.customers, args.error_rate, args.discount_rate, args.seed),
+        args.micro_lines,
+    ))
+    orders = [order for order, _ in map(parse_order_line, sample) if order is not None]
+    processed = [calculate_totals(order) for order in orders]
+    report = generate_report(processed)
+
+    record("parse_order_line", len(sample), lambda: [parse_order_line(line) for line in sample])
+    record("calculate_totals", len(orders), lambda: [calculate_totals(order) for order in orders])
+    record("generate_report", len(processed), lambda: generate_report(processed))
+    record("render_report", len(report.summary_report), lambda: render_report(report))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        upload = os.path.join(tmp, "orders.txt")
+        write_orders(upload, args.lines, args.customers, args.error_rate, args.discount_rate, args.seed)
+        record("process_file", args.lines, lambda: process_file(
+            upload, os.path.join(tmp, "output.txt"), os.path.join(tmp, "error.txt")
+        ))
+
+        if not only or "upload" in only:
+            _bench_upload(upload, os.path.join(tmp, "data"), args.lines, record)
+
+    return results
+
+
+def _bench_upload(upload: str, data_dir: str, lines: int, record):
+    # Keep the app's data out of the tree and skip the result cache, which would answer
+    # every repeat after the first. The settings were read when the processing benchmarks
+    # imported them, so they are set on the module, before the routes read DATA_DIR
+    from backend.core import config
+    config.DATA_DIR = data_dir
+    config.CACHE_ENABLED = False
+    from fastapi.testclient import TestClient
+    from backend.main import app
+
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    # Entering the client runs the app's lifespan, which sets up the data directory
+    with TestClient(app) as client:
+        def post():
+            with open(upload, "rb") as f:
+                response = client.post("/api/upload", files=[("files", ("orders.txt", f, "text/plain"))])
+            response.raise_for_status()
+
+        record("upload", lines, post)
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Prints the change against the baseline per benchmark. Returns the names that regressed."""
+    regressions = []
+    print(f"\n{'benchmark':<20} {'baseline':>10} {'current':>10} {'change':>8}")
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        old, new = baseline[name]["seconds"], result["seconds"]
+        change = new / old - 1 if old else 0.0
+        flag = ""
+        if change > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        print(f"{name:<20} {old:>9.4f}s {new:>9.4f}s {change:>+7.1%}{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_arguments(parser)
+    parser.add_argument("--micro-lines", type=int, default=100_000, help="lines in the in-memory sample")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", nargs="+", help="run only these benchmarks")
+    parser.add_argument("--output", help="write results to this JSON file")
+    parser.add_argument("--baseline", help="compare against an earlier results file")
+    parser.add_argument("--threshold", type=float, default=0.10, help="slowdown that counts as a regression")
+    args = parser.parse_args()
+
+    print(f"{args.lines:,} lines, {args.customers:,} customers, error rate {args.error_rate:.1%}, "
+          f"discount rate {args.discount_rate:.1%}, seed {args.seed}")
+    results = run_suite(args, args.only)
+
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {
+                key: getattr(args, key)
+                for key in ("lines", "customers", "error_rate", "discount_rate", "seed", "micro_lines", "repeat")
+            },
+        },
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"]["params"] != report["meta"]["params"]:
+            print("Warning: baseline was run with different parameters", file=sys.stderr)
+        if compare(results, baseline["results"], args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -9,24 +9,117 @@ API_URL = "http://localhost:8000/api"
 
 st.set_page_config(layout="wide", page_title="Order Processor")
 
-def fetch_history():
+# Submissions shown in the sidebar per "Show more" step
+HISTORY_PAGE_SIZE = 50
+
+# How long fetched history, submissions and file pages are reused before asking the backend again
+HISTORY_TTL = 10
+SUBMISSION_TTL = 60
+PAGE_TTL = 60
+
+# Lines per page in the file viewer
+VIEWER_PAGE_SIZES = [100, 500, 2000]
+
+@st.cache_resource
+def get_session():
+    """One pooled HTTP session for the app, so reruns reuse connections to the backend."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+@st.cache_resource
+def _history_validators():
+    # ETag and data of the last history response per limit, shared by all sessions
+    return {}
+
+@st.cache_data(ttl=HISTORY_TTL, show_spinner=False)
+def load_history(limit):
+    """
+    The newest `limit` submissions as a summary (id, timestamp, file_count), plus
+    whether there are more. Once the TTL runs out the last response is revalidated
+    with its ETag, so an unchanged history costs the backend a 304.
+    """
+    validators = _history_validators()
+    cached = validators.get(limit)
+    headers = {"If-None-Match": cached["etag"]} if cached and cached["etag"] else {}
+    response = get_session().get(
+        f"{API_URL}/history",
+        params={"view": "summary", "limit": limit},
+        headers=headers
+    )
+    if response.status_code == 304:
+        return cached["data"], cached["has_more"]
+    response.raise_for_status()
+    validators[limit] = {
+        "etag": response.headers.get("ETag"),
+        "data": response.json(),
+        "has_more": "X-Next-Cursor" in response.headers
+    }
+    return validators[limit]["data"], validators[limit]["has_more"]
+
+def fetch_history(limit=HISTORY_PAGE_SIZE):
+    """Returns (submissions, has_more), or an empty history if the backend can't be reached."""
     try:
-        response = requests.get(f"{API_URL}/history")
-        if response.status_code == 200:
-            return response.json()
-        else:
-            st.error("Failed to fetch history")
-            return []
+        return load_history(limit)
     except Exception as e:
         st.error(f"Error fetching history: {e}")
-        return []
+        return [], False
+
+@st.cache_data(ttl=SUBMISSION_TTL, show_spinner=False)
+def load_submission(submission_id):
+    response = get_session().get(f"{API_URL}/history/{submission_id}")
+    if response.status_code == 404:
+        return None
+    response.raise_for_status()
+    return response.json()
 
+def fetch_submission(submission_id):
+    """Fetches one submission with its files, or None if it no longer exists."""
+    try:
+        return load_submission(submission_id)
+    except Exception as e:
+        st.error(f"Error fetching submission: {e}")
+    return None
+
+@st.cache_data(ttl=PAGE_TTL, show_spinner=False, max_entries=200)
+def load_page(file_id, file_type, offset, limit):
+    """One page of a report or error log. Returns (text, total_lines)."""
+    response = get_session().get(
+        f"{API_URL}/file/{file_id}/{file_type}",
+        params={"offset": offset, "limit": limit}
+    )
+    response.raise_for_status()
+    return response.text, int(response.headers.get("X-Total-Lines", 0))
 
+def forget_cached_data():
+    """Drops cached history and submissions after the backend's data changed."""
+    load_history.clear()
+    load_submission.clear()
+
+def follow_job(job_id):
+    """Shows live progress from the job's event stream. Returns the final job status, or None if it was lost."""
+    bar = st.progress(0.0, text="Queued...")
+    job = None
+    with get_session().get(f"{API_URL}/jobs/{job_id}/events", stream=True) as response:
+        if response.status_code != 200:
+            return None
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            job = json.loads(line[len("data: "):])
+            finished = sum(1 for f in job['files'] if f['status'] in ('completed', 'failed'))
+            lines = sum(f['lines_processed'] for f in job['files'])
+            bar.progress(finished / len(job['files']),
+                         text=f"{finished}/{len(job['files'])} files done, {lines:,} lines processed")
+    return job
 
 def delete_submission(submission_id):
     try:
-        response = requests.delete(f"{API_URL}/history/{submission_id}")
+        response = get_session().delete(f"{API_URL}/history/{submission_id}")
         if response.status_code == 200:
+            forget_cached_data()
             st.success("Submission deleted")
             return True
         else:
@@ -36,34 +129,100 @@ def delete_submission(submission_id):
         st.error(f"Error deleting submission: {e}")
         return False
 
+def delete_submissions(submission_ids):
+    """Deletes several submissions with one request."""
+    try:
+        response = get_session().post(f"{API_URL}/history/delete", json={"ids": submission_ids})
+        if response.status_code == 200:
+            forget_cached_data()
+            st.success(f"Deleted {len(response.json()['deleted'])} submissions")
+            return True
+        else:
+            st.error("Failed to delete submissions")
+            return False
+    except Exception as e:
+        st.error(f"Error deleting submissions: {e}")
+        return False
+
+def show_file(selected_file, file_type, view_mode):
+    """Shows one page of the file at a time; the whole file is only fetched for a download."""
+    key = f"{selected_file['id']}_{file_type}"
+    col1, col2 = st.columns(2)
+    page_size = col1.selectbox("Lines per page", VIEWER_PAGE_SIZES, key=f"size_{key}")
+    page_key = f"page_{key}"
+    page = st.session_state.setdefault(page_key, 1)
+
+    try:
+        content, total = load_page(selected_file['id'], file_type, (page - 1) * page_size, page_size)
+        pages = max(1, -(-total // page_size))
+        if page > pages:
+            # Past the end, e.g. after switching to a bigger page size
+            page = st.session_state[page_key] = pages
+            content, total = load_page(selected_file['id'], file_type, (page - 1) * page_size, page_size)
+    except Exception as e:
+        st.error(f"Failed to load content: {e}")
+        return
+
+    col2.number_input(f"Page (of {pages:,})", min_value=1, max_value=pages, step=1, key=page_key)
+
+    first = (page - 1) * page_size
+    st.caption(f"Lines {min(first + 1, total):,}-{min(first + page_size, total):,} of {total:,}")
+    st.code(content, language="text")
+
+    if st.button(f"Prepare {view_mode} download", key=f"prepare_{key}"):
+        try:
+            response = get_session().get(f"{API_URL}/download/{selected_file['id']}/{file_type}")
+            response.raise_for_status()
+            st.download_button(
+                label=f"Download {view_mode}",
+                data=response.content,
+                file_name=f"{selected_file['filename']}_{file_type}.txt",
+                mime="text/plain",
+                key=f"download_{key}",
+                on_click="ignore"
+            )
+        except Exception as e:
+            st.error(f"Connection error: {e}")
+
 def main():
     st.title("Order Processing System")
     
     # Sidebar History
     st.sidebar.header("History")
-    history = fetch_history()
+    if 'history_limit' not in st.session_state:
+        st.session_state['history_limit'] = HISTORY_PAGE_SIZE
+    history, has_more = fetch_history(st.session_state['history_limit'])
     
     # Store selected submission in session state
     if 'selected_submission_id' not in st.session_state:
         st.session_state['selected_submission_id'] = None
     
     if history:
+        labels = {
+            submission['id']: f"{submission['timestamp'][:16].replace('T', ' ')} ({submission['file_count']} files)"
+            for submission in history
+        }
         for submission in history:
-            # Check for valid submission structure (migration)
-            if 'files' not in submission:
-                continue
-                
-            timestamp = submission['timestamp'][:16].replace('T', ' ')
-            file_count = len(submission['files'])
-            label = f"{timestamp} ({file_count} files)"
-            
-            with st.sidebar.expander(label):
+            with st.sidebar.expander(labels[submission['id']]):
                 if st.button("View Files", key=f"view_{submission['id']}"):
                     st.session_state['selected_submission_id'] = submission['id']
                 
                 if st.button("Delete", key=f"del_{submission['id']}"):
                     if delete_submission(submission['id']):
                         st.rerun()
+        
+        selected = st.sidebar.multiselect("Select submissions", list(labels), format_func=labels.get,
+                                          key="bulk_selection")
+        if selected and st.sidebar.button(f"Delete {len(selected)} selected"):
+            if delete_submissions(selected):
+                if st.session_state['selected_submission_id'] in selected:
+                    st.session_state['selected_submission_id'] = None
+                del st.session_state['bulk_selection']
+                st.rerun()
+        
+        if has_more and st.sidebar.button("Show more"):
+            st.session_state['history_limit'] += HISTORY_PAGE_SIZE
+            st.rerun()
 
     # New Upload Section
     if not st.session_state['selected_submission_id']:
@@ -72,25 +231,31 @@ def main():
         
         if uploaded_files:
             if st.button("Process Files"):
-                with st.spinner("Processing..."):
-                    files_payload = [("files", (file.name, file, "text/plain")) for file in uploaded_files]
-                    try:
-                        response = requests.post(f"{API_URL}/upload", files=files_payload)
-                        if response.status_code == 200:
-                            submission = response.json()
-                            st.success(f"Processed {len(submission['files'])} files!")
+                files_payload = [("files", (file.name, file, "text/plain")) for file in uploaded_files]
+                try:
+                    with st.spinner("Uploading..."):
+                        response = get_session().post(f"{API_URL}/upload", params={"mode": "async"}, files=files_payload)
+                    if response.status_code == 202:
+                        submission = response.json()
+                        job = follow_job(submission['id'])
+                        forget_cached_data()
+                        if job and job['status'] == 'completed':
+                            done = sum(1 for f in job['files'] if f['status'] == 'completed')
+                            st.success(f"Processed {done} of {len(job['files'])} files!")
                             st.session_state['selected_submission_id'] = submission['id']
                             st.rerun()
                         else:
-                            st.error(f"Upload failed: {response.text}")
-                    except Exception as e:
-                        st.error(f"Error uploading files: {e}")
+                            st.error("Processing failed")
+                    elif response.status_code == 503:
+                        st.warning("The server is busy, please try again in a moment.")
+                    else:
+                        st.error(f"Upload failed: {response.text}")
+                except Exception as e:
+                    st.error(f"Error uploading files: {e}")
 
     # Display Section (Submission View)
     if st.session_state['selected_submission_id']:
-        # Find submission in history (in case it wasn't just uploaded)
-        history = fetch_history() # Re-fetch to be safe
-        submission = next((s for s in history if s['id'] == st.session_state['selected_submission_id']), None)
+        submission = fetch_submission(st.session_state['selected_submission_id'])
         
         if submission:
             st.button("Back to Upload", on_click=lambda: st.session_state.update({'selected_submission_id': None}))
@@ -106,24 +271,7 @@ def main():
             view_mode = st.radio("View Mode", ["Output Report", "Error Log"], horizontal=True, key=f"mode_{selected_file['id']}")
             file_type = "output" if view_mode == "Output Report" else "error"
             
-            col1, col2 = st.columns(2)
-            
-            try:
-                response = requests.get(f"{API_URL}/file/{selected_file['id']}/{file_type}")
-                if response.status_code == 200:
-                    content = response.text
-                    st.code(content, language="text")
-                    
-                    st.download_button(
-                        label=f"Download {view_mode}",
-                        data=content,
-                        file_name=f"{selected_file['filename']}_{file_type}.txt",
-                        mime="text/plain"
-                    )
-                else:
-                    st.error("Failed to load content")
-            except Exception as e:
-                st.error(f"Connection error: {e}")
+            show_file(selected_file, file_type, view_mode)
         else:
             st.warning("Submission not found (it may have been deleted).")
             st.session_state['selected_submission_id'] = None
@@ -0,0 +1,6 @@
+import os
+import tempfile
+
+# Point the API at a scratch data directory before backend.api.routes is imported,
+# so the test run never touches backend/data
+os.environ.setdefault("ORDER_DATA_DIR", tempfile.mkdtemp(prefix="order-data-"))
@@ -0,0 +1,128 @@
+import random
+from datetime import date
+
+import pytest
+
+from backend.core.analytics import AnalyticsStore
+from backend.core.models import CustomerSummary, ProcessingResult
+
+
+def _result(*customers):
+    summaries = [
+        CustomerSummary(customer_name=name, order_count=orders, total_items=orders * 2, gross_total=net * 1.25,
+                        total_discount=net * 0.25, net_total=net)
+        for name, orders, net in customers
+    ]
+    return ProcessingResult(
+        summary_report=summaries,
+        grand_total_gross=sum(s.gross_total for s in summaries),
+        grand_total_discount=sum(s.total_discount for s in summaries),
+        grand_total_net=sum(s.net_total for s in summaries),
+    )
+
+
+@pytest.fixture
+def analytics(tmp_path):
+    return AnalyticsStore(str(tmp_path / "analytics.db"))
+
+
+def test_totals_across_files_and_days(analytics):
+    analytics.record_file("f1", "s1", "a.txt", "2024-03-01T09:00:00", _result(("John", 2, 100.0), ("Jane", 1, 40.0)))
+    analytics.record_file("f2", "s1", "b.txt", "2024-03-01T09:00:00", _result(("John", 1, 10.0)))
+    analytics.record_file("f3", "s2", "c.txt", "2024-03-05T12:30:00", _result(("Jane", 3, 300.0), ("Bob", 1, 5.0)))
+
+    rows, total = analytics.customers()
+    assert total == 3
+    assert [(r["customer_name"], r["file_count"], r["order_count"], r["net_total"]) for r in rows] == [
+        ("Jane", 2, 4, 340.0), ("John", 2, 3, 110.0), ("Bob", 1, 1, 5.0),
+    ]
+
+    top, total = analytics.customers(limit=1, order_by="order_count")
+    assert ([r["customer_name"] for r in top], total) == (["Jane"], 3)
+    page, _ = analytics.customers(limit=1, offset=1)
+    assert [r["customer_name"] for r in page] == ["John"]
+
+    march_first, total = analytics.customers(since=date(2024, 3, 1), until=date(2024, 3, 2))
+    assert total == 2
+    assert {r["customer_name"]: r["net_total"] for r in march_first} == {"John": 110.0, "Jane": 40.0}
+
+    files = analytics.customer_files("Jane", since=date(2024, 3, 2))
+    assert [(f["file_id"], f["submission_id"], f["filename"], f["net_total"]) for f in files] == [
+        ("f3", "s2", "c.txt", 300.0),
+    ]
+    assert [(d["day"], d["customer_count"], d["net_total"]) for d in analytics.daily()] == [
+        ("2024-03-01", 2, 150.0), ("2024-03-05", 2, 305.0),
+    ]
+    assert [d["net_total"] for d in analytics.daily(customer="John")] == [110.0]
+
+    with pytest.raises(ValueError):
+        analytics.customers(order_by="customer_name; DROP TABLE files")
+
+
+def test_removing_and_replacing_files_keeps_the_rollup_exact(analytics):
+    rng = random.Random(20)
+    live = {}
+    for i in range(200):
+        if live and rng.random() < 0.3:
+            submission_id = rng.choice(sorted({s for s, _, _ in live.values()}))
+            assert analytics.remove_submission(submission_id) == sum(1 for s, _, _ in live.values()
+                                                                     if s == submission_id)
+            live = {f: v for f, v in live.items() if v[0] != submission_id}
+            continue
+        # Sometimes a file already recorded again, as after an append
+        file_id = rng.choice(sorted(live)) if live and rng.random() < 0.2 else f"f{i}"
+        submission_id, timestamp = live[file_id][:2] if file_id in live else (
+            f"s{i // 3}", f"2024-03-{rng.randint(1, 9):02d}T10:00:00")
+        customers = [(f"C{c}", rng.randint(1, 5), float(rng.randint(1, 1000)))
+                     for c in rng.sample(range(30), rng.randint(1, 6))]
+        analytics.record_file(file_id, submission_id, "x.txt", timestamp, _result(*customers))
+        live[file_id] = (submission_id, timestamp, customers)
+
+    expected = {}
+    for _, timestamp, customers in live.values():
+        for name, orders, net in customers:
+            totals = expected.setdefault(name, [0, 0, 0.0])
+            totals[0] += 1
+            totals[1] += orders
+            totals[2] += net
+    rows, total = analytics.customers()
+    assert total == len(expected)
+    assert {r["customer_name"]: [r["file_count"], r["order_count"], r["net_total"]] for r in rows} == expected
+    # Every rollup row still has a file behind it
+    assert sum(d["customer_count"] for d in analytics.daily()) == len({
+        (timestamp[:10], name) for _, timestamp, customers in live.values() for name, _, _ in customers
+    })
+
+
+def test_backfill_runs_once(analytics):
+    submissions = [{"id": "s1", "timestamp": "2024-03-01T09:00:00",
+                    "files": [{"id": "f1", "filename": "a.txt"}, {"id": "f2", "filename": "b.txt"}]}]
+    results = {"f1": _result(("John", 1, 10.0))}
+
+    assert analytics.backfill(lambda: submissions, lambda entry: results.get(entry["id"])) == 1
+    assert analytics.backfill(lambda: pytest.fail("listed again"), lambda entry: None) == 0
+    assert analytics.customers()[1] == 1
+
+
+def test_date_ranges_match_the_files_in_them(analytics):
+    rng = random.Random(2020)
+    files = []
+    for i in range(120):
+        day = date.fromordinal(date(2023, 11, 1).toordinal() + rng.randrange(200))
+        customers = [(f"C{c}", rng.randint(1, 5), float(rng.randint(1, 1000))) for c in rng.sample(range(10), 3)]
+        analytics.record_file(f"f{i}", f"s{i}", "x.txt", f"{day.isoformat()}T08:15:00", _result(*customers))
+        files.append((day, customers))
+
+    days = [None] + [date.fromordinal(date(2023, 10, 20).toordinal() + rng.randrange(230)) for _ in range(40)]
+    ranges = [(rng.choice(days), rng.choice(days)) for _ in range(60)] + [(date(2024, 1, 1), date(2024, 3, 1))]
+    for since, until in ranges:
+        expected = {}
+        for day, customers in files:
+            if (since is None or day >= since) and (until is None or day < until):
+                for name, orders, net in customers:
+                    totals = expected.setdefault(name, [0, 0.0])
+                    totals[0] += orders
+                    totals[1] += net
+        rows, total = analytics.customers(since, until)
+        assert total == len(expected)
+        assert {r["customer_name"]: [r["order_count"], r["net_total"]] for r in rows} == expected
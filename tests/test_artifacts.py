@@ -0,0 +1,77 @@
+import gzip
+import os
+
+import pytest
+
+from backend.core import artifacts
+from backend.core.artifacts import accepted_encodings, read_lines, select_representation
+
+
+@pytest.fixture(autouse=True)
+def small_index_step(monkeypatch):
+    # Small enough that windows cross several index entries
+    monkeypatch.setattr(artifacts, "LINE_INDEX_STEP", 3)
+
+
+@pytest.mark.parametrize("content", [b"", b"one", b"one\n", b"\n\n", "\n".join(f"line {i}" for i in range(20)).encode(),
+                                     "\n".join(f"line {i}" for i in range(21)).encode() + b"\n",
+                                     # A multiple of the index step without a final newline
+                                     "\n".join(f"line {i}" for i in range(21)).encode()])
+def test_read_lines_matches_split(tmp_path, content):
+    path = tmp_path / "log.txt"
+    path.write_bytes(content)
+    lines = content.split(b"\n")
+    if content.endswith(b"\n") or not content:
+        lines.pop()
+
+    for offset in range(len(lines) + 2):
+        for limit in (1, 2, 3, 5, 100):
+            window, first, total = read_lines(str(path), offset, limit)
+            assert total == len(lines)
+            assert first == min(offset, len(lines))
+            assert window == b"\n".join(lines[offset:offset + limit])
+
+    for tail in (1, 4, 50):
+        window, first, total = read_lines(str(path), tail=tail)
+        assert window == b"\n".join(lines[-tail:])
+        assert first == max(0, len(lines) - tail)
+
+
+def test_offset_without_limit_reads_at_most_one_window(tmp_path, monkeypatch):
+    monkeypatch.setattr(artifacts, "MAX_WINDOW_LINES", 4)
+    path = tmp_path / "log.txt"
+    path.write_bytes("\n".join(f"line {i}" for i in range(10)).encode())
+    assert read_lines(str(path), 5) == (b"line 5\nline 6\nline 7\nline 8", 5, 10)
+    assert read_lines(str(path), 8) == (b"line 8\nline 9", 8, 10)
+
+
+def test_line_index_follows_file_changes(tmp_path):
+    path = tmp_path / "log.txt"
+    path.write_bytes(b"a\nb")
+    assert read_lines(str(path), tail=1)[0] == b"b"
+    with open(path, "ab") as f:
+        f.write(b"\nc\nd")
+    assert read_lines(str(path), tail=1) == (b"d", 3, 4)
+
+
+def test_accepted_encodings():
+    assert accepted_encodings("gzip, deflate;q=0.5, zstd;q=0, br") == {"gzip": 1.0, "deflate": 0.5, "br": 1.0}
+    assert accepted_encodings(None) == {}
+
+
+def test_gzip_sidecar(tmp_path):
+    path = tmp_path / "error.txt"
+    path.write_text("Invalid format\n" * 1000)
+
+    assert select_representation(str(path), "gzip", build_min_bytes=10 ** 9) == (str(path), None)
+    assert select_representation(str(path), None, build_min_bytes=0) == (str(path), None)
+
+    served, encoding = select_representation(str(path), "gzip, identity", build_min_bytes=0)
+    assert (served, encoding) == (f"{path}.gz", "gzip")
+    assert gzip.decompress((tmp_path / "error.txt.gz").read_bytes()) == path.read_bytes()
+
+    # An existing sidecar is used whatever the size, until the file changes
+    assert select_representation(str(path), "gzip", build_min_bytes=10 ** 9) == (f"{path}.gz", "gzip")
+    path.write_text("changed")
+    os.utime(path, ns=(os.stat(f"{path}.gz").st_mtime_ns + 10 ** 9,) * 2)
+    assert select_representation(str(path), "gzip", build_min_bytes=10 ** 9) == (str(path), None)
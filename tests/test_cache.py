@@ -0,0 +1,56 @@
+import io
+
+from backend.core.cache import ResultCache, save_and_hash
+from backend.core.processor import process_file
+
+
+def _process(tmp_path, cache, name, content):
+    upload = tmp_path / f"{name}.txt"
+    output = tmp_path / f"{name}_output.txt"
+    error = tmp_path / f"{name}_error.txt"
+    content_hash = save_and_hash(io.BytesIO(content), str(upload))
+    if not cache.fetch(content_hash, str(upload), str(output), str(error)):
+        process_file(str(upload), str(output), str(error))
+        cache.add(content_hash, str(upload), str(output), str(error))
+    # Files without rejected lines get no error log
+    return output.read_text(), error.read_text() if error.exists() else None
+
+
+def test_cache_hit_and_miss(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_entries=10, max_bytes=10 ** 6, memory_entries=10)
+    content = b"ORD001|C1|P1|1|600.00|2024-01-01\nbad|line"
+
+    assert _process(tmp_path, cache, "a", content) == _process(tmp_path, cache, "b", content)
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # A new cache instance (another worker) finds the entry through the on-disk index
+    other = ResultCache(str(tmp_path / "cache"), max_entries=10, max_bytes=10 ** 6, memory_entries=10)
+    _process(tmp_path, other, "c", content)
+    assert other.hits == 1
+
+
+def test_cache_lru_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_entries=2, max_bytes=10 ** 6, memory_entries=1)
+    for name in ("a", "b", "c"):
+        _process(tmp_path, cache, name, f"ORD001|{name}|P1|1|1.00|2024-01-01".encode())
+
+    stats = cache.stats()
+    assert stats["entries"] == 2
+    assert stats["evictions"] == 1
+
+    # "a" was least recently used and is gone, "c" is still cached
+    _process(tmp_path, cache, "a2", b"ORD001|a|P1|1|1.00|2024-01-01")
+    assert _process(tmp_path, cache, "c2", b"ORD001|c|P1|1|1.00|2024-01-01")[1] is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_rule_change_invalidates(tmp_path):
+    content = b"ORD001|C1|P1|1|600.00|2024-01-01"
+    old = ResultCache(str(tmp_path / "cache"), 10, 10 ** 6, 10, fingerprint="old-rules")
+    _process(tmp_path, old, "a", content)
+
+    new = ResultCache(str(tmp_path / "cache"), 10, 10 ** 6, 10, fingerprint="new-rules")
+    assert new.purge_stale() == 1
+    _process(tmp_path, new, "b", content)
+    assert (new.hits, new.misses) == (0, 1)
+    assert new.stats()["entries"] == 1
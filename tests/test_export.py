@@ -0,0 +1,120 @@
+import csv
+import io
+import json
+import os
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from backend.core import config
+from backend.core.export import ORDER_COLUMNS, SUMMARY_COLUMNS, ensure_export, format_for_media_type
+from backend.core.pipeline import append_upload
+from backend.core.processor import load_state, process_file
+
+SAMPLE_INPUT = os.path.join(os.path.dirname(__file__), "..", "sample_input.txt")
+
+
+@pytest.fixture
+def processed(tmp_path):
+    paths = [str(tmp_path / name) for name in ("orders.txt", "orders_output.txt", "orders_error.txt")]
+    with open(SAMPLE_INPUT, "rb") as source, open(paths[0], "wb") as upload:
+        upload.write(source.read())
+    process_file(*paths)
+    return paths
+
+
+def _read_table(path, fmt):
+    return pq.read_table(path) if fmt == "parquet" else pa.ipc.open_file(path).read_all()
+
+
+def test_summary_exports_match_state(processed):
+    upload, output, error = processed
+    state = load_state(output)
+
+    with open(ensure_export(upload, output, "summary", "json")) as f:
+        data = json.load(f)
+    assert data["columns"] == list(SUMMARY_COLUMNS)
+    assert data["rows"] == state["customers"]
+    assert list(data["grand_total"].values()) == state["grand_total"]
+
+    with open(ensure_export(upload, output, "summary", "csv"), newline="") as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == list(SUMMARY_COLUMNS)
+    assert [[name, int(count), int(items), float(gross), float(discount), float(net)]
+            for name, count, items, gross, discount, net in rows[1:]] == state["customers"]
+
+    for fmt in ("parquet", "arrow"):
+        table = _read_table(ensure_export(upload, output, "summary", fmt), fmt)
+        assert table.column_names == list(SUMMARY_COLUMNS)
+        assert [list(row.values()) for row in table.to_pylist()] == state["customers"]
+        assert list(json.loads(table.schema.metadata[b"grand_total"]).values()) == state["grand_total"]
+
+
+def test_order_exports(processed):
+    upload, output, error = processed
+    for fmt in ("parquet", "arrow"):
+        table = _read_table(ensure_export(upload, output, "orders", fmt), fmt)
+        assert table.column_names == list(ORDER_COLUMNS)
+        # 18 lines, 3 of them invalid
+        assert table.num_rows == 15
+        assert sum(table.column("net_total").to_pylist()) == pytest.approx(load_state(output)["grand_total"][2])
+
+    with open(ensure_export(upload, output, "orders", "json")) as f:
+        assert json.load(f)["rows"][0][:4] == ["ORD001", "John Smith", "Laptop", 2]
+
+
+def test_exports_are_cached_until_the_file_changes(processed):
+    upload, output, error = processed
+    path = ensure_export(upload, output, "summary", "json")
+    built = os.stat(path).st_mtime_ns
+    assert ensure_export(upload, output, "summary", "json") == path
+    assert os.stat(path).st_mtime_ns == built
+
+    append_upload(io.BytesIO(b"ORD100|Newcomer|Widget|1|10.00|2024-03-20\n"), upload, output, error)
+    for rows in ("summary", "orders"):
+        with open(ensure_export(upload, output, rows, "json")) as f:
+            assert "Newcomer" in f.read()
+
+
+def test_exports_follow_the_money_mode(processed, monkeypatch):
+    upload, output, error = processed
+    with open(upload, "a") as f:
+        f.write("\nORD100|Half Cent|Widget|1|0.425|2024-03-20")
+    process_file(upload, output, error)
+    with open(ensure_export(upload, output, "orders", "json")) as f:
+        assert json.load(f)["rows"][-1][6] == 0.425
+    assert ensure_export(upload, output, "summary", "json") is not None
+
+    monkeypatch.setattr(config, "MONEY_MODE", "cents")
+    # Exports built under the float totals aren't served any more
+    with open(ensure_export(upload, output, "orders", "json")) as f:
+        assert json.load(f)["rows"][-1][6] == 0.43
+    assert ensure_export(upload, output, "summary", "json") is None
+
+
+def test_json_exports_write_non_finite_numbers_as_null(tmp_path):
+    paths = [str(tmp_path / name) for name in ("orders.txt", "orders_output.txt", "orders_error.txt")]
+    with open(paths[0], "w") as f:
+        f.write("ORD001|Nan|Widget|1|nan|2024-03-20\nORD002|Inf|Widget|1|inf|2024-03-20")
+    process_file(*paths)
+    for rows in ("orders", "summary"):
+        with open(ensure_export(paths[0], paths[1], rows, "json")) as f:
+            data = json.loads(f.read(), parse_constant=lambda name: pytest.fail(f"{name} in JSON"))
+        assert data["rows"][0][-1] is None and data["rows"][1][-1] is None
+    assert data["grand_total"]["net_total"] is None
+
+
+def test_missing_sources(tmp_path):
+    paths = [str(tmp_path / name) for name in ("a.txt", "a_output.txt")]
+    assert ensure_export(*paths, "summary", "csv") is None
+    assert ensure_export(*paths, "orders", "csv") is None
+    with pytest.raises(ValueError):
+        ensure_export(*paths, "summary", "xml")
+
+
+def test_format_for_media_type():
+    assert format_for_media_type("text/html, text/csv;q=0.9") == "csv"
+    assert format_for_media_type("application/vnd.apache.parquet") == "parquet"
+    assert format_for_media_type("*/*") is None
+    assert format_for_media_type(None) is None
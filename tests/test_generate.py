@@ -0,0 +1,25 @@
+from benchmarks.generate import iter_order_lines, write_orders
+from backend.core.processor import parse_order_line
+from backend.core.rules import DISCOUNT_THRESHOLD
+
+
+def test_generator_is_seeded(tmp_path):
+    a, b = tmp_path / "a.txt", tmp_path / "b.txt"
+    size = write_orders(str(a), 1_000, seed=7)
+    write_orders(str(b), 1_000, seed=7)
+
+    assert a.read_bytes() == b.read_bytes()
+    assert size == a.stat().st_size
+    assert a.read_text().count("\n") == 1_000
+    assert list(iter_order_lines(50, seed=8)) != list(iter_order_lines(50, seed=7))
+
+
+def test_generator_rates():
+    orders = [parse_order_line(line)[0] for line in iter_order_lines(5_000, customers=20, error_rate=0.1,
+                                                                      discount_rate=0.3, seed=1)]
+    valid = [order for order in orders if order is not None]
+    discounted = [order for order in valid if order.quantity * order.unit_price > DISCOUNT_THRESHOLD]
+
+    assert 0.08 < 1 - len(valid) / len(orders) < 0.12
+    assert 0.27 < len(discounted) / len(valid) < 0.33
+    assert len({order.customer_name for order in valid}) == 20
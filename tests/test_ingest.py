@@ -0,0 +1,123 @@
+import io
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from backend.core import config, ingest
+from backend.core.ingest import detect_encoding, iter_lines, mapped_chunks
+from backend.core.parallel import process_file_parallel
+from backend.core.pipeline import append_upload
+from backend.core.processor import process_file, process_file_content, processing_fingerprint
+
+ORDERS = [
+    "ORD001|John Smith|Laptop|2|999.99|2024-03-15",
+    "ORD002|Zoë Müller|Café au lait|3|4.50|2024-03-15",
+    "ORD003|Jane Doe|Mouse|1|25.50|2024-03-16",
+    "Invalid|Line",
+    "ORD004|Zoë Müller|Crème brûlée|10|60.00|2024-03-17",
+    "",
+    "ORD005|Jane Doe|Keyboard|x|75.00|2024-03-17",
+]
+
+
+def _expected(lines):
+    return process_file_content("\n".join(lines))
+
+
+def _process(tmp_path, data: bytes, name="upload.txt"):
+    path = tmp_path / name
+    path.write_bytes(data)
+    process_file(str(path), str(tmp_path / "output.txt"), str(tmp_path / "error.txt"))
+    error_log = tmp_path / "error.txt"
+    return (tmp_path / "output.txt").read_text(), error_log.read_text() if error_log.exists() else ""
+
+
+def test_lines_match_universal_newlines_however_the_bytes_are_cut(monkeypatch, tmp_path):
+    rng = random.Random(21)
+    words = ["ORD1|Zoë|Café|1|5.00|2024-03-01", "", "x", "ß|€|漢字", " \t "]
+    for _ in range(200):
+        parts = [rng.choice(words) + rng.choice(["\n", "\r\n", "\r"]) for _ in range(rng.randint(0, 12))]
+        data = "".join(parts)
+        if rng.random() < 0.5:
+            data += rng.choice(words)
+        raw = data.encode("utf-8")
+        expected = io.TextIOWrapper(io.BytesIO(raw), encoding="utf-8", newline=None).read().split("\n")
+
+        size = rng.randint(1, 9)
+        assert list(iter_lines((raw[i:i + size] for i in range(0, len(raw), size)))) == expected
+
+        path = tmp_path / "lines.txt"
+        path.write_bytes(raw)
+        monkeypatch.setattr(ingest, "CHUNK_SIZE", size)
+        assert list(iter_lines(mapped_chunks(str(path)))) == expected
+
+
+def test_mapped_chunks_end_on_line_breaks(monkeypatch, tmp_path):
+    path = tmp_path / "orders.txt"
+    data = "\r\n".join(ORDERS * 50).encode("utf-8")
+    path.write_bytes(data)
+    monkeypatch.setattr(ingest, "CHUNK_SIZE", 100)
+
+    chunks = list(mapped_chunks(str(path)))
+    assert b"".join(chunks) == data
+    assert all(chunk.endswith(b"\n") for chunk in chunks[:-1])
+    assert b"".join(mapped_chunks(str(path), 77, 1234)) == data[77:1234]
+    assert list(mapped_chunks(str(path), len(data))) == []
+    (tmp_path / "empty.txt").write_bytes(b"")
+    assert list(mapped_chunks(str(tmp_path / "empty.txt"))) == []
+
+
+@pytest.mark.parametrize("encode", [
+    lambda text: b"\xef\xbb\xbf" + text.encode("utf-8"),
+    lambda text: text.encode("utf-16"),
+    lambda text: b"\xfe\xff" + text.encode("utf-16-be"),
+    lambda text: text.encode("latin-1"),
+])
+def test_auto_encoding_reads_boms_and_latin1(tmp_path, encode):
+    assert _process(tmp_path, encode("\r\n".join(ORDERS))) == _expected(ORDERS)
+
+
+def test_lines_that_arent_utf8_fall_back_one_at_a_time(tmp_path):
+    data = b"\n".join(
+        line.encode("latin-1" if i % 2 else "utf-8") for i, line in enumerate(ORDERS)
+    )
+    assert _process(tmp_path, data) == _expected(ORDERS)
+
+
+def test_configured_encoding(monkeypatch, tmp_path):
+    default_fingerprint = processing_fingerprint()
+    monkeypatch.setattr(config, "INPUT_ENCODING", "cp1252")
+    assert processing_fingerprint() != default_fingerprint
+
+    lines = ["ORD001|Smart “Quotes” Ltd|Widget|1|5.00|2024-03-15", "ORD002|Jane|Widget|1|5.00|2024-03-15"]
+    assert _process(tmp_path, "\n".join(lines).encode("cp1252")) == _expected(lines)
+    # Bytes cp1252 doesn't map are replaced rather than failing the upload
+    assert "�" in _process(tmp_path, b"ORD001|Bad \x81 Byte|Widget|1|5.00|2024-03-15")[0]
+
+    assert detect_encoding(b"\xef\xbb\xbfORD", "utf-8") == ("utf-8", 3)
+    assert detect_encoding(b"\xef\xbb\xbfORD", "cp1252") == ("cp1252", 0)
+    monkeypatch.setattr(config, "INPUT_ENCODING", "no-such-codec")
+    with pytest.raises(LookupError):
+        processing_fingerprint()
+
+
+def test_appends_and_parallel_ranges_use_the_file_encoding(tmp_path):
+    first, second = ORDERS[:4], ORDERS[4:]
+    upload = tmp_path / "upload.txt"
+    upload.write_bytes(b"\xef\xbb\xbf" + "\n".join(first).encode("utf-8"))
+    process_file(str(upload), str(tmp_path / "output.txt"), str(tmp_path / "error.txt"))
+    result = append_upload(io.BytesIO("\n".join(second).encode("latin-1")), str(upload),
+                           str(tmp_path / "output.txt"), str(tmp_path / "error.txt"))
+    assert not result["reprocessed"]
+    assert ((tmp_path / "output.txt").read_text(), (tmp_path / "error.txt").read_text()) == _expected(ORDERS)
+
+    for encoding, data in (("utf-8", b"\xef\xbb\xbf" + "\n".join(ORDERS * 40).encode("utf-8")),
+                           ("utf-16", "\n".join(ORDERS * 40).encode("utf-16"))):
+        path = tmp_path / f"{encoding}.txt"
+        path.write_bytes(data)
+        with ThreadPoolExecutor(max_workers=3) as executor:
+            process_file_parallel(executor, 3, str(path), str(tmp_path / "parallel.txt"),
+                                  str(tmp_path / "parallel_error.txt"), split_bytes=0)
+        assert ((tmp_path / "parallel.txt").read_text(), (tmp_path / "parallel_error.txt").read_text()) == \
+            _expected(ORDERS * 40)
@@ -0,0 +1,70 @@
+import threading
+import time
+
+import pytest
+
+from backend.core.jobs import JobManager, QueueFullError
+
+
+def _wait(manager, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        job = manager.get(job_id)
+        if job["status"] in ("completed", "failed"):
+            return job
+        time.sleep(0.01)
+    raise AssertionError("job did not finish")
+
+
+def test_job_reports_progress_and_completes():
+    manager = JobManager(workers=2, max_queue=10)
+    completed = []
+
+    def task(job, file_status):
+        if file_status["filename"] == "bad.txt":
+            raise ValueError("unreadable")
+        manager.update(job, file_status, lines_processed=42, error_count=1)
+
+    manager.submit("job", "2024-03-15T10:00:00", [{"id": "a", "filename": "a.txt"}, {"id": "b", "filename": "bad.txt"}],
+                   task, on_complete=completed.append)
+    job = _wait(manager, "job")
+
+    assert job["status"] == "completed"
+    assert [(f["status"], f["lines_processed"]) for f in job["files"]] == [("completed", 42), ("failed", 0)]
+    assert job["files"][1]["detail"] == "unreadable"
+    # The callback ran before the job was reported done
+    assert completed[0]["status"] == "completed"
+    assert completed[0]["files"] == job["files"]
+
+
+def test_all_files_failing_fails_the_job():
+    manager = JobManager(workers=1, max_queue=10)
+
+    def task(job, file_status):
+        raise OSError("disk full")
+
+    manager.submit("job", "2024-03-15T10:00:00", [{"id": "a", "filename": "a.txt"}], task)
+    assert _wait(manager, "job")["status"] == "failed"
+
+
+def test_queue_limit():
+    manager = JobManager(workers=1, max_queue=2)
+    release = threading.Event()
+
+    def task(job, file_status):
+        release.wait(5)
+
+    manager.submit("first", "t", [{"id": "a", "filename": "a.txt"}], task)
+    # Wait until the worker has picked up the first file so the queue holds only what follows
+    while manager.queue_depth():
+        time.sleep(0.01)
+    manager.submit("second", "t", [{"id": "b", "filename": "b.txt"}, {"id": "c", "filename": "c.txt"}], task)
+
+    assert not manager.can_accept(1)
+    with pytest.raises(QueueFullError):
+        manager.submit("third", "t", [{"id": "d", "filename": "d.txt"}], task)
+    assert manager.get("third") is None
+
+    release.set()
+    assert _wait(manager, "second")["status"] == "completed"
+    assert manager.can_accept(2)
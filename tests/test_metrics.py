@@ -0,0 +1,55 @@
+import io
+
+import pytest
+
+from backend.core import metrics
+from backend.core.metrics import Counter, FileMetrics, Histogram, LINE_SAMPLE_EVERY, STAGES
+from backend.core.processor import aggregate_stream
+
+
+@pytest.fixture
+def scratch_registry(monkeypatch):
+    # Metrics made by a test register here, so they never show up in /metrics
+    monkeypatch.setattr(metrics, "_registry", [])
+
+
+def test_counter_and_histogram_render(scratch_registry):
+    counter = Counter("test_things_total", "Things.", ("kind",))
+    counter.inc(kind="a")
+    counter.inc(2, kind='b"')
+    histogram = Histogram("test_seconds", "Seconds.", buckets=(0.1, 1.0))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+
+    assert counter.render().splitlines() == [
+        "# HELP test_things_total Things.",
+        "# TYPE test_things_total counter",
+        'test_things_total{kind="a"} 1',
+        'test_things_total{kind="b\\""} 2',
+    ]
+    assert histogram.render().splitlines()[2:] == [
+        'test_seconds_bucket{le="0.1"} 1',
+        'test_seconds_bucket{le="1.0"} 2',
+        'test_seconds_bucket{le="+Inf"} 3',
+        "test_seconds_sum 5.55",
+        "test_seconds_count 3",
+    ]
+    assert metrics.render() == counter.render() + "\n" + histogram.render() + "\n"
+
+
+def test_aggregate_stream_fills_file_metrics():
+    lines = [f"ORD{i}|C{i % 3}|P|1|10.00|2024-01-01" for i in range(LINE_SAMPLE_EVERY * 3)] + ["bad", "x|y"]
+    metrics = FileMetrics()
+    _, errors = aggregate_stream(["\n".join(lines) + "\n"], io.StringIO(), metrics=metrics)
+
+    assert metrics.lines == len(lines)
+    assert metrics.errors == {"field_count": 2}
+    for stage in ("decode", "parse", "totals", "aggregate"):
+        assert metrics.seconds[stage] > 0
+    assert set(metrics.seconds) == set(STAGES)
+
+    # Counts continue from earlier errors without counting them twice
+    more = FileMetrics()
+    aggregate_stream(["bad\n"], io.StringIO(), errors=errors, metrics=more)
+    assert (more.lines, more.errors) == (1, {"field_count": 1})
@@ -0,0 +1,93 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from backend.core import config
+from backend.core.parallel import process_file_parallel, split_ranges
+from backend.core.processor import load_error_counts, load_state, process_file
+
+
+@pytest.fixture(scope="module")
+def executor():
+    with ProcessPoolExecutor(max_workers=2) as pool:
+        yield pool
+
+
+def _write_orders(path, line_count=400):
+    lines = []
+    for i in range(line_count):
+        if i % 37 == 0:
+            lines.append(f"ORD{i}|Broken|Line")
+        elif i % 53 == 0:
+            lines.append(f"ORD{i}|Customer {i % 7}|Thing|-1|10.00|2024-03-15")
+        else:
+            # Quarter-dollar prices under the discount threshold keep every partial sum exact,
+            # so merged totals match serial ones to the bit
+            lines.append(f"ORD{i}|Customer {(i * 3) % 11}|Thing|{i % 5}|{(i % 8) * 12.25:.2f}|2024-03-15")
+    with open(path, "wb") as f:
+        f.write("\r\n".join(lines).encode("utf-8"))
+
+
+def test_split_ranges_are_line_aligned(tmp_path):
+    path = str(tmp_path / "orders.txt")
+    _write_orders(path)
+
+    ranges = split_ranges(path, 5)
+    with open(path, "rb") as f:
+        data = f.read()
+
+    assert ranges[0][0] == 0
+    assert ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+        assert data[start - 1:start] == b"\n"
+
+
+def test_split_ranges_small_file(tmp_path):
+    path = tmp_path / "orders.txt"
+    path.write_bytes(b"ORD001|C1|P1|1|600.00|2024-01-01")
+
+    assert split_ranges(str(path), 4) == [(0, path.stat().st_size)]
+
+
+@pytest.mark.parametrize("limit,sample,money", [(0, 1, "cents"), (5, 1, "cents"), (0, 3, "cents"), (4, 2, "cents"),
+                                               (0, 1, "float")])
+def test_process_file_parallel_matches_serial(tmp_path, executor, monkeypatch, request, limit, sample, money):
+    monkeypatch.setattr(config, "ERROR_LOG_LIMIT", limit)
+    monkeypatch.setattr(config, "ERROR_LOG_SAMPLE", sample)
+    monkeypatch.setattr(config, "MONEY_MODE", money)
+    if money != "float":
+        # Pool workers read the money mode from their own copy of the settings
+        executor = ProcessPoolExecutor(max_workers=2)
+        request.addfinalizer(executor.shutdown)
+    upload = str(tmp_path / "orders.txt")
+    _write_orders(upload)
+
+    process_file(upload, str(tmp_path / "serial_output.txt"), str(tmp_path / "serial_error.txt"), "utf-8")
+    error_count = process_file_parallel(
+        executor, 4, upload, str(tmp_path / "output.txt"), str(tmp_path / "error.txt"), "utf-8", split_bytes=0
+    )
+
+    assert (tmp_path / "output.txt").read_text() == (tmp_path / "serial_output.txt").read_text()
+    assert (tmp_path / "error.txt").read_text() == (tmp_path / "serial_error.txt").read_text()
+    assert load_error_counts(str(tmp_path / "output.txt")) == load_error_counts(str(tmp_path / "serial_output.txt"))
+    assert error_count == load_error_counts(str(tmp_path / "output.txt"))["error_count"]
+    assert not [name for name in os.listdir(tmp_path) if ".part" in name]
+
+
+@pytest.mark.parametrize("money", ["cents", "float"])
+def test_parallel_totals_are_exact(tmp_path, monkeypatch, money):
+    monkeypatch.setattr(config, "MONEY_MODE", money)
+    upload = tmp_path / "orders.txt"
+    # Prices whose float sums depend on the order they are added in
+    upload.write_text("\n".join(f"ORD{i}|Customer {i % 3}|Thing|{i % 7 + 1}|{(i * 7919) % 100000 / 1000}|2024-03-15"
+                                for i in range(3000)))
+
+    process_file(str(upload), str(tmp_path / "serial_output.txt"), str(tmp_path / "serial_error.txt"))
+    with ProcessPoolExecutor(max_workers=2) as executor:
+        process_file_parallel(executor, 4, str(upload), str(tmp_path / "output.txt"), str(tmp_path / "error.txt"),
+                              split_bytes=0)
+
+    assert (tmp_path / "output.txt").read_text() == (tmp_path / "serial_output.txt").read_text()
+    assert load_state(str(tmp_path / "output.txt"))["customers"] == load_state(str(tmp_path / "serial_output.txt"))["customers"]
@@ -0,0 +1,150 @@
+import io
+import os
+import random
+
+import pytest
+
+from backend.core.cache import ResultCache
+from backend.core.pipeline import append_upload, ingest_upload, save_and_process
+from backend.core import config
+from backend.core.processor import load_error_counts, load_state, process_file, state_path
+
+SAMPLE_INPUT = os.path.join(os.path.dirname(__file__), "..", "sample_input.txt")
+
+
+def _sample():
+    with open(SAMPLE_INPUT, "rb") as f:
+        return f.read()
+
+
+def test_save_and_process_matches_process_file(tmp_path):
+    content = _sample()
+    content_hash, error_count = save_and_process(
+        io.BytesIO(content), str(tmp_path / "upload.txt"), str(tmp_path / "output.txt"), str(tmp_path / "error.txt")
+    )
+
+    (tmp_path / "expected.txt").write_bytes(content)
+    process_file(str(tmp_path / "expected.txt"), str(tmp_path / "expected_output.txt"), str(tmp_path / "expected_error.txt"))
+
+    assert (tmp_path / "upload.txt").read_bytes() == content
+    assert (tmp_path / "output.txt").read_text() == (tmp_path / "expected_output.txt").read_text()
+    assert (tmp_path / "error.txt").read_text() == (tmp_path / "expected_error.txt").read_text()
+    assert error_count == 3
+    assert len(content_hash) == 64
+
+
+def test_ingest_upload_cache_hit_skips_processing(tmp_path, monkeypatch):
+    cache = ResultCache(str(tmp_path / "cache"), max_entries=10, max_bytes=10 ** 6, memory_entries=10)
+    paths = [str(tmp_path / name) for name in ("a.txt", "a_output.txt", "a_error.txt")]
+    ingest_upload(io.BytesIO(_sample()), *paths, cache=cache)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("cache hit should not reprocess")
+
+    monkeypatch.setattr("backend.core.pipeline.process_file", fail)
+    hit_paths = [str(tmp_path / name) for name in ("b.txt", "b_output.txt", "b_error.txt")]
+    ingest_upload(io.BytesIO(_sample()), *hit_paths, cache=cache)
+
+    assert cache.hits == 1
+    for original, reused in zip(paths, hit_paths):
+        assert os.path.samefile(original, reused)
+
+
+class _CountingReader(io.BytesIO):
+    def __init__(self, data):
+        super().__init__(data)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.bytes_read += len(chunk)
+        return chunk
+
+
+def test_ingest_upload_reads_a_cached_upload_once(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_entries=10, max_bytes=10 ** 6, memory_entries=10)
+    for name in ("a", "b"):
+        source = _CountingReader(_sample())
+        ingest_upload(source, *_paths(tmp_path, name), cache=cache)
+        assert source.bytes_read == len(_sample())
+    assert cache.hits == 1
+    with open(tmp_path / "a_output.txt", "rb") as first, open(tmp_path / "b_output.txt", "rb") as second:
+        assert first.read() == second.read()
+
+
+def _orders(rng, count):
+    lines = []
+    for i in range(count):
+        if rng.random() < 0.1:
+            lines.append(f"BAD{i}|broken line")
+        else:
+            lines.append(f"ORD{i}|Customer {rng.randrange(20)}|Widget|{rng.randint(1, 9)}|"
+                         f"{rng.uniform(1, 150):.2f}|2024-03-{rng.randint(1, 28):02d}")
+    return lines
+
+
+def _paths(tmp_path, name):
+    return [str(tmp_path / f"{name}{suffix}") for suffix in (".txt", "_output.txt", "_error.txt")]
+
+
+@pytest.mark.parametrize("limit,sample,money", [(0, 1, "float"), (6, 1, "float"), (0, 4, "float"), (0, 1, "cents")])
+def test_append_matches_full_reprocess(tmp_path, monkeypatch, limit, sample, money):
+    monkeypatch.setattr(config, "ERROR_LOG_LIMIT", limit)
+    monkeypatch.setattr(config, "ERROR_LOG_SAMPLE", sample)
+    monkeypatch.setattr(config, "MONEY_MODE", money)
+    rng = random.Random(7)
+    lines = _orders(rng, 300)
+    # Deltas of varying size, some without a trailing newline
+    cuts = [0, 50, 51, 120, 200, 300]
+    deltas = ["\n".join(lines[a:b]) + ("\n" if i % 2 else "") for i, (a, b) in enumerate(zip(cuts, cuts[1:]))]
+
+    upload, output, error = _paths(tmp_path, "incremental")
+    with open(upload, "wb") as f:
+        f.write(deltas[0].encode())
+    process_file(upload, output, error)
+
+    for delta in deltas[1:]:
+        result = append_upload(io.BytesIO(delta.encode()), upload, output, error)
+        assert not result["reprocessed"]
+
+    full_upload, full_output, full_error = _paths(tmp_path, "full")
+    with open(full_upload, "w") as f:
+        f.write("\n".join(lines))
+    error_count = process_file(full_upload, full_output, full_error)
+
+    assert result["error_count"] == error_count
+    assert open(output).read() == open(full_output).read()
+    assert open(error).read() == open(full_error).read()
+    assert load_error_counts(output) == load_error_counts(full_output)
+    assert load_state(output)["customers"] == load_state(full_output)["customers"]
+
+
+def test_append_detaches_cached_files(tmp_path):
+    cache = ResultCache(str(tmp_path / "cache"), max_entries=10, max_bytes=10 ** 6, memory_entries=10)
+    first = _paths(tmp_path, "a")
+    second = _paths(tmp_path, "b")
+    ingest_upload(io.BytesIO(_sample()), *first, cache=cache)
+    ingest_upload(io.BytesIO(_sample()), *second, cache=cache)
+    assert os.path.samefile(state_path(first[1]), state_path(second[1]))
+    before = [open(path, "rb").read() for path in first]
+
+    result = append_upload(io.BytesIO(b"ORD9|New Customer|Widget|1|10.00|2024-03-20\nbad\n"), *second)
+
+    assert result == {"lines_processed": 2, "error_count": 4, "reprocessed": False}
+    # The other submission and the cache entry still see the original files
+    assert [open(path, "rb").read() for path in first] == before
+    assert "New Customer" in open(second[1]).read()
+
+
+def test_append_without_state_reprocesses(tmp_path):
+    upload, output, error = _paths(tmp_path, "a")
+    with open(upload, "wb") as f:
+        f.write(_sample())
+    process_file(upload, output, error)
+    os.remove(state_path(output))
+
+    result = append_upload(io.BytesIO(b"ORD9|New Customer|Widget|1|10.00|2024-03-20\n"), upload, output, error)
+
+    assert result["reprocessed"]
+    assert result["lines_processed"] == 19
+    assert "New Customer" in open(output).read()
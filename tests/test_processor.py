@@ -1,7 +1,16 @@
+import io
+import os
+import random
 import pytest
+from decimal import ROUND_HALF_UP, Decimal
 from datetime import date
 from backend.core.models import Order, ProcessedOrder
-from backend.core.processor import parse_order_line, calculate_totals, generate_report, process_file_content
+from benchmarks.bench_parser import legacy_parse
+from backend.core import config
+from backend.core.processor import (
+    CentsAggregator, CustomerAggregator, aggregate_stream, parse_order_line, parse_order_fields, calculate_totals, generate_report, price_micros,
+    process_file_content, process_stream
+)
 
 def test_parse_order_line_valid():
     line = "ORD001|John Smith|Laptop|2|999.99|2024-03-15"
@@ -20,19 +29,24 @@ def test_parse_order_line_invalid_format():
     line = "ORD001|John Smith|Laptop|2|999.99" # Missing date
     order, error = parse_order_line(line)
     assert order is None
-    assert "Expected 6 fields" in error
+    assert error.category == "field_count"
+    assert error.value == "5"
+    assert "Expected 6 fields" in str(error)
 
 def test_parse_order_line_invalid_quantity():
     line = "ORD001|John Smith|Laptop|two|999.99|2024-03-15"
     order, error = parse_order_line(line)
     assert order is None
-    assert "Invalid quantity format" in error
+    assert error.category == "quantity_format"
+    assert error.value == "two"
+    assert "Invalid quantity format" in str(error)
 
 def test_parse_order_line_negative_quantity():
     line = "ORD001|John Smith|Laptop|-2|999.99|2024-03-15"
     order, error = parse_order_line(line)
     assert order is None
-    assert "Invalid quantity" in error
+    assert error.category == "negative_quantity"
+    assert "Invalid quantity" in str(error)
 
 def test_calculate_totals_no_discount():
     order = Order(
@@ -99,3 +113,224 @@ Invalid|Line"""
     assert "|" in output
     assert "Invalid format" in error
     assert "Invalid|Line" in error
+
+
+SAMPLE_INPUT = os.path.join(os.path.dirname(__file__), "..", "sample_input.txt")
+
+def _read_sample():
+    with open(SAMPLE_INPUT, "rb") as f:
+        return f.read()
+
+def test_process_stream_matches_process_file_content():
+    raw = _read_sample()
+    expected_output, expected_errors = process_file_content(raw.decode("utf-8"))
+
+    errors = io.StringIO()
+    output, error_count = process_stream(io.BytesIO(raw), errors, encoding="utf-8")
+
+    assert output == expected_output
+    assert errors.getvalue() == expected_errors
+    assert error_count == len(expected_errors.split("\n"))
+
+def test_process_stream_byte_chunks_split_mid_line():
+    raw = _read_sample().replace(b"\n", b"\r\n") + "ORD019|Zoë|Café|1|5.00|2024-03-27\n".encode("utf-8")
+    expected_output, expected_errors = process_file_content(raw.decode("utf-8").replace("\r\n", "\n"))
+
+    # Odd chunk size splits lines, CRLF pairs and multi-byte characters
+    chunks = (raw[i:i + 7] for i in range(0, len(raw), 7))
+    errors = io.StringIO()
+    output, _ = process_stream(chunks, errors, encoding="utf-8")
+
+    assert output == expected_output
+    assert errors.getvalue() == expected_errors
+
+def test_process_stream_empty_input():
+    errors = io.StringIO()
+    output, error_count = process_stream(io.BytesIO(b""), errors)
+
+    assert output == process_file_content("")[0]
+    assert "GRAND TOTAL" in output
+    assert error_count == 0
+    assert errors.getvalue() == ""
+
+@pytest.mark.parametrize("content", [
+    "",
+    "Invalid|Line",
+    """ORD001|C1|P1|1|600.00|2024-01-01
+ORD002|C2|P2|1|100.00|2024-01-01
+Invalid|Line""",
+    # Rows the vectorized masks hand back to the row parser
+    """ORD001| C1 |P1|+3|1e2|2024-02-29
+ORD002|C2|P2| 4|.5|2024-2-5
+ORD003|C1|P3|-1|10.00|2024-01-01
+ORD004|C2|P4|1|-10.00|2024-01-01
+ORD005|C3|P5|1|10.00|2023-02-29
+ORD006|C3|P6|x|10.00|2024-01-01
+ORD007|C3|P7|1|abc|2024-01-01
+
+ORD008|C1|P8|2|333.33|1500-06-01""",
+    # Negative zero prices pass the sign check; every sum starts from 0.0
+    "ORD676|李雷|Laptop| 4|-0.0|2024-03-15",
+    "ORD001|C1|P1|1|-0.0|2024-01-01\nORD002|C2|P2|3|-0.00|2024-01-01",
+])
+def test_columnar_engine_matches_python_engine(content):
+    assert process_file_content(content, engine="columnar") == process_file_content(content)
+
+def test_columnar_engine_matches_sample_file():
+    content = _read_sample().decode("utf-8")
+    assert process_file_content(content, engine="columnar") == process_file_content(content)
+
+def test_columnar_engine_defers_to_python_engine_in_cents_mode(monkeypatch):
+    from backend.core.columnar import process_columnar
+
+    content = "ORD001|C1|P1|1|0.425|2024-01-01\nORD002|C1|P2|3|0.105|2024-01-01\nInvalid|Line"
+    float_output = process_file_content(content)[0]
+    monkeypatch.setattr(config, "MONEY_MODE", "cents")
+    # Half-cent line totals round up in cents, which float sums don't reproduce
+    assert process_file_content(content)[0] != float_output
+    assert process_file_content(content, engine="columnar") == process_file_content(content)
+    with pytest.raises(ValueError):
+        process_columnar(content, io.StringIO())
+
+def test_process_file_content_unknown_engine():
+    with pytest.raises(ValueError):
+        process_file_content("", engine="spark")
+
+@pytest.mark.parametrize("field,values", [
+    (3, ["5", "0", "-0", "+3", " 4 ", "1_000", "-2", "x", "", "4.0", "\u0663", "\u00b2", "99999999999999999999"]),
+    (4, ["10.00", ".5", "1e2", "-1.5", "-0.0", "nan", "inf", "-inf", "abc", "", " 7 ", "1_0.5"]),
+    (5, ["2024-03-15", "2024-3-5", "2024-02-29", "2023-02-29", "2024-13-01", "2024-00-10", "0000-01-01",
+         "0001-01-01", "2024-03-15 ", " 2024-03-15", "2024/03/15", "20240315", "\uff12\uff10\uff12\uff14-03-15", ""]),
+])
+def test_parse_order_fields_matches_reference(field, values):
+    base = ["ORD001", " Alice ", "Widget ", "2", "10.50", "2024-03-15"]
+    lines = ["", "a|b", "  ORD|C|P|1|1.0|2024-01-01|extra  "]
+    for value in values:
+        parts = list(base)
+        parts[field] = value
+        lines.append("|".join(parts))
+
+    for line in lines:
+        # Twice, so the second lookup goes through the date cache
+        for _ in range(2):
+            record, error = parse_order_fields(line)
+            order, expected_error = legacy_parse(line)
+            assert (error and error.message) == expected_error
+            parsed, parse_error = parse_order_line(line)
+            # repr, so nan prices compare equal
+            assert repr(parsed) == repr(order)
+            assert parse_error == error
+            if order is not None:
+                assert repr(record._asdict()) == repr(order.model_dump())
+
+def test_error_records_carry_line_numbers_and_categories():
+    content = "ORD001|C1|P1|1|10.00|2024-01-01\n\nbad\nORD002|C1|P1|x|10.00|2024-01-01\nmore|bad\n"
+    errors = io.StringIO()
+    _, counts = aggregate_stream([content], errors)
+
+    assert counts.total == 3
+    assert counts.lines == 5
+    assert counts.categories == {"field_count": 2, "quantity_format": 1}
+    assert counts.first == {"field_count": [3, "1"], "quantity_format": [4, "x"]}
+    assert errors.getvalue() == process_file_content(content)[1]
+
+def test_error_log_limit_and_sampling(monkeypatch):
+    content = "\n".join(f"bad{i}" for i in range(10))
+
+    monkeypatch.setattr(config, "ERROR_LOG_LIMIT", 3)
+    errors = io.StringIO()
+    _, counts = aggregate_stream([content], errors)
+    assert errors.getvalue().split("\n") == [f"Invalid format: Expected 6 fields, got 1. Line: bad{i}" for i in range(3)]
+    assert (counts.total, counts.logged) == (10, 3)
+
+    monkeypatch.setattr(config, "ERROR_LOG_LIMIT", 0)
+    monkeypatch.setattr(config, "ERROR_LOG_SAMPLE", 4)
+    errors = io.StringIO()
+    _, counts = aggregate_stream([content], errors)
+    assert [line[-4:] for line in errors.getvalue().split("\n")] == ["bad0", "bad4", "bad8"]
+    assert (counts.total, counts.logged) == (10, 3)
+
+@pytest.mark.parametrize("limit, sample", [(1, 1), (2, 1), (0, 2)])
+def test_engines_apply_the_same_error_log_settings(monkeypatch, limit, sample):
+    from backend.core.columnar import process_columnar
+
+    content = "bad0\nORD001|C1|P1|1|10.00|2024-01-01\nORD002|C1|P1|x|10.00|2024-01-01\nbad3\nbad4"
+    monkeypatch.setattr(config, "ERROR_LOG_LIMIT", limit)
+    monkeypatch.setattr(config, "ERROR_LOG_SAMPLE", sample)
+    assert process_file_content(content, engine="columnar") == process_file_content(content)
+
+    _, counts = aggregate_stream([content], io.StringIO())
+    _, columnar_counts = process_columnar(content, io.StringIO())
+    assert columnar_counts.to_state() == counts.to_state()
+
+def _cents(value):
+    return int(value.quantize(Decimal("0.01"), ROUND_HALF_UP) * 100)
+
+def _decimal_reference(lines):
+    """Cents-mode totals worked out in Decimal: lines rounded half up to the cent, discount off the rounded total."""
+    customers = {}
+    for line in lines:
+        _, name, _, quantity, price, _ = line.split("|")
+        line_total = _cents(int(quantity) * Decimal(price))
+        discount = _cents(line_total * Decimal("0.001")) if line_total > 500_00 else 0
+        summary = customers.setdefault(name, [name, 0, 0, 0, 0, 0])
+        for i, value in enumerate((1, int(quantity), line_total, discount, line_total - discount), 1):
+            summary[i] += value
+    return list(customers.values())
+
+def test_price_micros_matches_decimal():
+    for value in ["0", "19.99", "5.", ".5", "1e2", " 7 ", "1_0.5", "0.1234565", "2.0000005", "\u0663.5", "-0.0"]:
+        assert price_micros(value) == int((Decimal(value.strip()) * 10 ** 6).quantize(Decimal(1), ROUND_HALF_UP))
+    for value in ["nan", "inf", "-inf", "abc", "", "1,5"]:
+        with pytest.raises(ValueError):
+            price_micros(value)
+
+def test_cents_mode_matches_decimal_reference(monkeypatch):
+    monkeypatch.setattr(config, "MONEY_MODE", "cents")
+    rng = random.Random(18)
+    lines = []
+    for i in range(20_000):
+        places = rng.randrange(5)
+        price = str(rng.randrange(2000)) + (f".{rng.randrange(10 ** places):0{places}d}" if places else "")
+        lines.append(f"ORD{i}|Customer {rng.randrange(50)}|P|{rng.randint(1, 9)}|{price}|2024-01-01")
+
+    aggregator, errors = aggregate_stream(["\n".join(lines)], io.StringIO())
+
+    state = aggregator.to_state()
+    expected = _decimal_reference(lines)
+    assert errors.total == 0
+    assert state["customers"] == expected
+    assert state["grand_total"] == [sum(c[i] for c in expected) for i in (3, 4, 5)]
+    assert aggregator.result().grand_total_net == state["grand_total"][2] / 100
+
+def test_cents_mode_keeps_error_messages(monkeypatch):
+    content = _read_sample().decode("utf-8")
+    expected_errors = process_file_content(content)[1]
+    monkeypatch.setattr(config, "MONEY_MODE", "cents")
+    output, errors = process_file_content(content)
+    assert errors == expected_errors
+    assert "GRAND TOTAL" in output
+
+@pytest.mark.parametrize("make", [CustomerAggregator, CentsAggregator])
+def test_aggregator_tables_match_plain_sums(make):
+    rng = random.Random(24)
+    money = (lambda: rng.randrange(10 ** 6)) if make is CentsAggregator else (lambda: rng.uniform(0, 1000))
+    orders = [(f"C{rng.randrange(300)}", rng.randint(0, 9), money(), money(), money()) for _ in range(5000)]
+    # Totals past 64 bits turn the integer columns into Python ints instead of failing
+    orders.insert(2500, ("C7", 2 ** 70, money(), money(), money()))
+
+    expected = {}
+    parts = [make(), make()]
+    for i, (name, *totals) in enumerate(orders):
+        sums = expected.setdefault(name, [0, 0, 0, 0, 0])
+        for column, value in enumerate([1, *totals]):
+            sums[column] += value
+        parts[i * 2 // len(orders)].add_totals(name, *totals)
+
+    merged = make.from_state(parts[0].to_state())
+    merged.merge(parts[1])
+    # Merging adds floats up in another order, so their last bits may differ
+    assert {name: pytest.approx(totals, rel=1e-12) for name, *totals in merged.rows()} == expected
+    assert merged.names == list(expected)
+    assert len(merged) == len(expected)
+    assert merged.result().summary_report[0].customer_name == next(iter(expected))
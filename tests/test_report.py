@@ -0,0 +1,137 @@
+import io
+import random
+
+import pytest
+from tabulate import tabulate
+
+from backend.core import processor
+from backend.core.models import CustomerSummary, ProcessingResult
+from backend.core.processor import CentsAggregator, CustomerAggregator
+from backend.core.report import HEADERS, render_report, select_customers, write_report
+
+
+def _tabulate_report(result):
+    """The tabulate call the report used to be rendered with."""
+    rows = [
+        [s.customer_name, s.order_count, s.total_items,
+         f"${s.gross_total:,.2f}", f"${s.total_discount:,.2f}", f"${s.net_total:,.2f}"]
+        for s in result.summary_report
+    ]
+    rows.append(["GRAND TOTAL", "", "", f"${result.grand_total_gross:,.2f}",
+                 f"${result.grand_total_discount:,.2f}", f"${result.grand_total_net:,.2f}"])
+    return tabulate(rows, headers=list(HEADERS), tablefmt="grid", stralign="right", numalign="right")
+
+
+def _result(names, seed=0):
+    rng = random.Random(seed)
+    summaries = []
+    for name in names:
+        gross = rng.choice([0.0, rng.uniform(0, 10 ** rng.randint(1, 9))])
+        discount = gross * 0.1
+        summaries.append(CustomerSummary(
+            customer_name=name, order_count=rng.randint(1, 10 ** rng.randint(1, 12)),
+            total_items=rng.randint(0, 10 ** rng.randint(1, 15)),
+            gross_total=gross, total_discount=discount, net_total=gross - discount,
+        ))
+    return ProcessingResult(
+        summary_report=summaries,
+        grand_total_gross=sum(s.gross_total for s in summaries),
+        grand_total_discount=sum(s.total_discount for s in summaries),
+        grand_total_net=sum(s.net_total for s in summaries),
+    )
+
+
+@pytest.mark.parametrize("names", [
+    [],
+    ["Alice"],
+    ["", "A", "A very long customer name that is wider than any header"],
+    # Look like numbers, but the column is still text
+    ["123", "1e5", "nan", "-5", "inf", "0x1F", "True", "1,000"],
+    # Not plain ASCII: left to tabulate
+    ["Zoë", "日本商事", "Tab\there", "\x1b[31mRed\x1b[0m"],
+])
+def test_report_matches_tabulate(names):
+    result = _result(names)
+    assert render_report(result) == _tabulate_report(result)
+
+
+def test_report_matches_tabulate_random():
+    rng = random.Random(3)
+    names = [f"Customer {rng.randrange(10 ** rng.randint(1, 6))}" for _ in range(300)]
+    result = _result(names, seed=4)
+    assert render_report(result) == _tabulate_report(result)
+
+
+def test_top_and_pages():
+    result = _result([f"C{i}" for i in range(10)], seed=5)
+    by_net = sorted(result.summary_report, key=lambda s: s.net_total, reverse=True)
+
+    assert select_customers(result, top=3) == by_net[:3]
+    assert select_customers(result, offset=4, limit=3) == result.summary_report[4:7]
+    assert select_customers(result, top=5, offset=3, limit=10) == by_net[3:5]
+
+    page = render_report(result, offset=8, limit=5)
+    assert "C8" in page and "C9" in page and "C7" not in page
+    # The grand total always covers every customer
+    cells = lambda report: [cell.strip() for cell in report.splitlines()[-2].split("|")]
+    assert cells(page) == cells(render_report(result))
+
+
+def test_write_report_streams_to_file(tmp_path):
+    result = _result(["Alice", "Bob"])
+    with open(tmp_path / "report.txt", "w") as f:
+        write_report(result, f)
+    assert (tmp_path / "report.txt").read_text() == render_report(result)
+    assert not render_report(result).endswith("\n")
+
+    out = io.StringIO()
+    write_report(result, out, top=1)
+    assert out.getvalue().count("|") == 7 * 3
+
+
+def _aggregated(aggregator, names, seed):
+    rng = random.Random(seed)
+    for name in names:
+        for _ in range(rng.randint(1, 3)):
+            quantity = rng.randint(0, 10 ** rng.randint(1, 15))
+            if isinstance(aggregator, CentsAggregator):
+                gross = rng.randint(0, 10 ** rng.randint(1, 13))
+                discount = gross // 10
+            else:
+                gross = rng.choice([0.0, rng.uniform(0, 10 ** rng.randint(1, 12))])
+                discount = gross * 0.1
+            aggregator.add_totals(name, quantity, gross, discount, gross - discount)
+    return aggregator
+
+
+@pytest.mark.parametrize("make", [CustomerAggregator, CentsAggregator])
+@pytest.mark.parametrize("names", [
+    [],
+    ["Alice"],
+    ["", "A", "A very long customer name that is wider than any header"],
+    [f"Customer {i}" for i in range(300)],
+    ["Zoë", "日本商事", "Tab\there"],
+])
+def test_aggregator_report_matches_rendered_result(monkeypatch, make, names):
+    aggregator = _aggregated(make(), names, seed=len(names))
+    expected = render_report(aggregator.result())
+
+    def no_models(**fields):
+        raise AssertionError("a CustomerSummary was built")
+
+    monkeypatch.setattr(processor, "CustomerSummary", no_models)
+    out = io.StringIO()
+    aggregator.write_report(out)
+    assert out.getvalue() == expected
+
+
+def test_aggregator_report_sizes_columns_around_nan_and_inf():
+    aggregator = CustomerAggregator()
+    # nan first, where min() and max() would stop looking at the rest of the column
+    aggregator.add_totals("Nan", 1, float("nan"), 0.0, float("nan"))
+    aggregator.add_totals("Big", 12, 123456789012.5, 0.0, 123456789012.5)
+    aggregator.add_totals("Inf", 2, float("inf"), float("inf"), float("nan"))
+    aggregator.add_totals("Big overflow", 2 ** 70, 1.0, 0.5, 0.5)
+    out = io.StringIO()
+    aggregator.write_report(out)
+    assert out.getvalue() == render_report(aggregator.result())
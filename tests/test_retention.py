@@ -0,0 +1,112 @@
+import os
+from datetime import datetime, timedelta
+
+import pytest
+
+from backend.core.retention import ArtifactFiles, RetentionPolicy, apply_retention
+from backend.core.storage import SQLiteSubmissionStore
+
+NOW = datetime(2024, 6, 1, 12, 0)
+
+
+@pytest.fixture
+def data_dir(tmp_path):
+    for name in ("uploads", "outputs", "errors"):
+        (tmp_path / name).mkdir()
+    return tmp_path
+
+
+def _submission(data_dir, store, submission_id, days_old, size=1000, with_errors=True):
+    file_id = f"{submission_id}-file"
+    artifacts = {
+        # Random bytes don't compress, so packing doesn't shrink the upload
+        ("uploads", f"{file_id}_orders.txt"): os.urandom(size),
+        ("outputs", f"{file_id}_output.txt"): b"report" * 10,
+        ("outputs", f"{file_id}_output.state.json"): b"{}",
+        ("outputs", f"{file_id}_output.orders.csv"): b"csv",
+    }
+    if with_errors:
+        artifacts["errors", f"{file_id}_error.txt"] = b"Invalid format"
+    for (directory, name), content in artifacts.items():
+        (data_dir / directory / name).write_bytes(content)
+    store.add_submission({
+        "id": submission_id,
+        "timestamp": (NOW - timedelta(days=days_old)).isoformat(),
+        "files": [{"id": file_id, "filename": "orders.txt", "upload_file": f"{file_id}_orders.txt",
+                   "output_file": f"{file_id}_output.txt", "error_file": f"{file_id}_error.txt"}],
+    })
+    return {f"{directory}/{name}": content for (directory, name), content in artifacts.items()}
+
+
+def _files(data_dir):
+    return sorted(
+        f"{directory}/{name}" for directory in ("uploads", "outputs", "errors")
+        for name in os.listdir(data_dir / directory)
+    )
+
+
+def test_sweep_deletes_packs_and_trims_to_size(data_dir):
+    store = SQLiteSubmissionStore(str(data_dir / "submissions.db"))
+    files = ArtifactFiles(str(data_dir))
+    _submission(data_dir, store, "expired", days_old=90)
+    oldest_kept = _submission(data_dir, store, "old", days_old=20)
+    _submission(data_dir, store, "older", days_old=25, size=5000)
+    recent = _submission(data_dir, store, "recent", days_old=1, with_errors=False)
+    # A job still running has its upload saved before its submission exists
+    (data_dir / "uploads" / "pending-file_orders.txt").write_bytes(b"pending")
+
+    policy = RetentionPolicy(max_age_days=30, max_bytes=4000, archive_after_days=7)
+    preview = apply_retention(store, files, policy, dry_run=True, now=NOW)
+    assert (preview["submissions_deleted"], preview["files_deleted"]) == (2, 10)
+    assert (preview["submissions_packed"], preview["files_packed"]) == (2, 10)
+    assert len(_files(data_dir)) == 20
+    assert len(store.list_submissions()) == 4
+
+    deleted = []
+    report = apply_retention(store, files, policy, on_delete=deleted.extend, now=NOW)
+
+    # "expired" by age; packed, the rest still take more than 4000 bytes, so "older" (the oldest left) goes too
+    assert deleted == ["expired", "older"]
+    assert [s["id"] for s in store.list_submissions()] == ["recent", "old"]
+    assert report["submissions_packed"] == 2 and report["files_packed"] == 10
+    assert report["bytes_after"] <= 4000 < report["bytes_before"]
+    assert report["bytes_reclaimed"] > 5000
+    assert _files(data_dir) == sorted([*recent, "uploads/pending-file_orders.txt"])
+    assert sorted(os.listdir(data_dir / "archives")) == ["old.zip"]
+
+    # Packed files come back as they were, modification times included
+    assert files.unpack("old")
+    assert not files.unpack("old")
+    for path, content in oldest_kept.items():
+        assert (data_dir / path).read_bytes() == content
+    assert os.listdir(data_dir / "archives") == []
+
+    # A second sweep has nothing left to do
+    again = apply_retention(store, files, RetentionPolicy(max_age_days=30), now=NOW)
+    assert (again["submissions_deleted"], again["bytes_reclaimed"]) == (0, 0)
+
+
+def test_unpacked_files_keep_their_modification_times(data_dir):
+    store = SQLiteSubmissionStore(str(data_dir / "submissions.db"))
+    files = ArtifactFiles(str(data_dir))
+    _submission(data_dir, store, "s1", days_old=10)
+    path = data_dir / "outputs" / "s1-file_output.orders.csv"
+    os.utime(path, ns=(1_700_000_000_123_456_789, 1_700_000_000_123_456_789))
+
+    apply_retention(store, files, RetentionPolicy(archive_after_days=7), now=NOW)
+    assert not path.exists()
+    files.unpack("s1")
+    assert path.stat().st_mtime_ns == 1_700_000_000_123_456_789
+
+
+def test_removing_a_submission_counts_only_unshared_bytes(data_dir):
+    store = SQLiteSubmissionStore(str(data_dir / "submissions.db"))
+    files = ArtifactFiles(str(data_dir))
+    _submission(data_dir, store, "s1", days_old=1)
+    # The upload is shared with a cache entry, removing this link frees nothing
+    os.link(data_dir / "uploads" / "s1-file_orders.txt", data_dir / "cached_blob")
+
+    removed, freed = files.remove_submission(store.get_submission("s1"))
+    assert removed == 5
+    assert freed == sum(len(content) for content in (b"report" * 10, b"{}", b"csv", b"Invalid format"))
+    assert _files(data_dir) == []
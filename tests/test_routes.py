@@ -0,0 +1,578 @@
+import io
+import json
+import os
+import subprocess
+import sys
+import time
+import zipfile
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+from backend.api import routes
+from backend.core import config, metrics
+from backend.core.analytics import AnalyticsStore
+from backend.core.cache import ResultCache
+from backend.core.jobs import JobManager
+from backend.core.processor import aggregate_stream
+from backend.core.retention import ArtifactFiles
+from backend.core.storage import JsonSubmissionStore, SQLiteSubmissionStore
+from backend.main import app
+
+SAMPLE_INPUT = os.path.join(os.path.dirname(__file__), "..", "sample_input.txt")
+
+
+@pytest.fixture
+def data_dir(tmp_path, monkeypatch):
+    for name in ("uploads", "outputs", "errors"):
+        (tmp_path / name).mkdir()
+    monkeypatch.setattr(routes, "DATA_DIR", str(tmp_path))
+    monkeypatch.setattr(routes, "UPLOAD_DIR", str(tmp_path / "uploads"))
+    monkeypatch.setattr(routes, "OUTPUT_DIR", str(tmp_path / "outputs"))
+    monkeypatch.setattr(routes, "ERROR_DIR", str(tmp_path / "errors"))
+    monkeypatch.setattr(routes, "store", SQLiteSubmissionStore(str(tmp_path / "submissions.db")))
+    monkeypatch.setattr(routes, "analytics", AnalyticsStore(str(tmp_path / "analytics.db")))
+    monkeypatch.setattr(routes, "artifact_files", ArtifactFiles(str(tmp_path)))
+    monkeypatch.setattr(routes, "result_cache", ResultCache(
+        str(tmp_path / "cache"), max_entries=100, max_bytes=10 ** 9, memory_entries=10
+    ))
+    monkeypatch.setattr(routes, "job_manager", JobManager(workers=2, max_queue=10))
+    monkeypatch.setattr(routes, "JOB_EVENT_INTERVAL", 0.01)
+    return tmp_path
+
+
+@pytest.fixture
+def client(data_dir):
+    return TestClient(app)
+
+
+def _upload(client, *names):
+    with open(SAMPLE_INPUT, "rb") as f:
+        content = f.read()
+    response = client.post("/api/upload", files=[("files", (name, content, "text/plain")) for name in names])
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_upload_and_fetch_artifacts(client):
+    submission = _upload(client, "orders.txt")
+    file_id = submission["files"][0]["id"]
+
+    output = client.get(f"/api/file/{file_id}/output")
+    assert output.status_code == 200
+    assert "GRAND TOTAL" in output.text
+
+    errors = client.get(f"/api/file/{file_id}/error")
+    assert errors.status_code == 200
+    assert "Invalid format" in errors.text
+
+    download = client.get(f"/api/download/{file_id}/output")
+    assert download.status_code == 200
+    assert download.text == output.text
+
+
+def test_history_newest_first(client):
+    first = _upload(client, "a.txt")
+    second = _upload(client, "b.txt", "c.txt")
+
+    history = client.get("/api/history").json()
+    assert [s["id"] for s in history] == [second["id"], first["id"]]
+    assert [f["filename"] for f in history[0]["files"]] == ["b.txt", "c.txt"]
+
+
+def test_delete_submission_removes_artifacts(client, data_dir):
+    submission = _upload(client, "orders.txt")
+    file_id = submission["files"][0]["id"]
+
+    assert client.delete(f"/api/history/{submission['id']}").status_code == 200
+    assert client.get("/api/history").json() == []
+    assert client.get(f"/api/file/{file_id}/output").status_code == 404
+    assert os.listdir(data_dir / "uploads") == []
+    assert os.listdir(data_dir / "outputs") == []
+
+    assert client.delete(f"/api/history/{submission['id']}").status_code == 404
+
+
+def test_unknown_file_is_404(client):
+    assert client.get("/api/file/missing/output").status_code == 404
+    assert client.get("/api/file/missing/error").status_code == 404
+    assert client.get("/api/download/missing/output").status_code == 404
+    assert client.get("/api/download/missing/other").status_code == 400
+
+
+def test_import_history_json_once(tmp_path):
+    history = [
+        {"id": "new", "timestamp": "2024-03-16T10:00:00", "files": [
+            {"id": "f2", "filename": "b.txt", "output_file": "f2_output.txt", "error_file": "f2_error.txt"},
+        ]},
+        {"id": "old", "timestamp": "2024-03-15T10:00:00", "files": [
+            {"id": "f1", "filename": "a.txt", "output_file": "f1_output.txt", "error_file": "f1_error.txt"},
+        ]},
+        {"id": "legacy", "timestamp": "2024-03-14T10:00:00", "filename": "z.txt"},
+    ]
+    history_path = tmp_path / "history.json"
+    history_path.write_text(json.dumps(history))
+
+    store = SQLiteSubmissionStore(str(tmp_path / "submissions.db"))
+    assert store.import_history_json(str(history_path)) == 2
+    assert store.import_history_json(str(history_path)) == 0
+
+    assert store.list_submissions() == history[:2]
+    assert store.get_file("f1")["submission_id"] == "old"
+
+
+def _sqlite_store(history_path):
+    store = SQLiteSubmissionStore(str(history_path.with_name("submissions.db")))
+    store.import_history_json(str(history_path))
+    return store
+
+
+@pytest.mark.parametrize("open_store", [_sqlite_store, lambda history_path: JsonSubmissionStore(str(history_path))])
+def test_delete_many_submissions_at_once(tmp_path, open_store):
+    history_path = tmp_path / "history.json"
+    history_path.write_text(json.dumps([
+        {"id": f"s{i}", "timestamp": f"2024-03-15T10:{i % 60:02d}:00", "files": [
+            {"id": f"f{i}", "filename": "a.txt", "output_file": f"f{i}_output.txt", "error_file": f"f{i}_error.txt"},
+        ]} for i in range(1200)
+    ]))
+    store = open_store(history_path)
+    version = store.get_version()
+
+    doomed = [f"s{i}" for i in range(1199, 0, -2)] + ["missing", "s1"]
+    deleted = store.delete_submissions(doomed)
+    assert [s["id"] for s in deleted] == doomed[:-2]
+    assert deleted[0]["files"][0]["id"] == "f1199"
+    assert len(store.list_submissions()) == 600 and store.get_file("f1") is None
+    assert store.get_version() != version
+    assert store.delete_submissions(["s1", "missing"]) == []
+
+
+def test_history_pagination_and_filters(client):
+    ids = [_upload(client, f"orders_{i}.txt", "other.txt")["id"] for i in range(5)]
+
+    first = client.get("/api/history", params={"limit": 2})
+    assert [s["id"] for s in first.json()] == ids[:-3:-1]
+    cursor = first.headers["X-Next-Cursor"]
+
+    second = client.get("/api/history", params={"limit": 2, "cursor": cursor})
+    assert [s["id"] for s in second.json()] == ids[2:0:-1]
+
+    last = client.get("/api/history", params={"limit": 2, "cursor": second.headers["X-Next-Cursor"]})
+    assert [s["id"] for s in last.json()] == ids[:1]
+    assert "X-Next-Cursor" not in last.headers
+
+    filtered = client.get("/api/history", params={"filename": "ORDERS_3"}).json()
+    assert [s["id"] for s in filtered] == [ids[3]]
+    assert len(filtered[0]["files"]) == 2
+
+    summary = client.get("/api/history", params={"view": "summary", "limit": 1}).json()
+    assert summary == [{"id": ids[-1], "timestamp": summary[0]["timestamp"], "file_count": 2}]
+
+    assert client.get("/api/history", params={"until": "2000-01-01T00:00:00"}).json() == []
+    assert len(client.get("/api/history", params={"since": "2000-01-01T00:00:00"}).json()) == 5
+    assert client.get("/api/history", params={"cursor": "nope"}).status_code == 400
+
+
+def test_history_conditional_get(client):
+    submission = _upload(client, "orders.txt")
+
+    response = client.get("/api/history")
+    etag = response.headers["ETag"]
+    assert response.headers["Last-Modified"]
+
+    cached = client.get("/api/history", headers={"If-None-Match": etag})
+    assert cached.status_code == 304
+    assert cached.content == b""
+
+    # Different queries get different validators
+    assert client.get("/api/history", params={"limit": 1}).headers["ETag"] != etag
+
+    client.delete(f"/api/history/{submission['id']}")
+    changed = client.get("/api/history", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.json() == []
+
+
+def test_append_to_file(client):
+    with open(SAMPLE_INPUT, "rb") as f:
+        content = f.read()
+    delta = b"ORD100|New Customer|Widget|2|300.00|2024-03-20\nORD101|Oops\n"
+    file_id = _upload(client, "orders.txt")["files"][0]["id"]
+
+    response = client.post(f"/api/file/{file_id}/append", files={"file": ("delta.txt", delta, "text/plain")})
+    assert response.status_code == 200
+    assert response.json() == {"id": file_id, "lines_processed": 2, "error_count": 4, "reprocessed": False}
+
+    full = client.post("/api/upload", files=[("files", ("full.txt", content + delta, "text/plain"))]).json()
+    full_id = full["files"][0]["id"]
+    for kind in ("output", "error"):
+        assert client.get(f"/api/file/{file_id}/{kind}").text == client.get(f"/api/file/{full_id}/{kind}").text
+
+    missing = client.post("/api/file/missing/append", files={"file": ("delta.txt", delta, "text/plain")})
+    assert missing.status_code == 404
+
+
+def test_error_summary(client):
+    file_id = _upload(client, "orders.txt")["files"][0]["id"]
+
+    summary = client.get(f"/api/file/{file_id}/error/summary").json()
+    assert summary["error_count"] == summary["logged"] == 3
+    assert summary["categories"] == {
+        "negative_quantity": {"count": 1, "first_line": 11, "first_value": "-5"},
+        "negative_price": {"count": 1, "first_line": 12, "first_value": "-50.0"},
+        "field_count": {"count": 1, "first_line": 13, "first_value": "4"},
+    }
+
+    client.post(f"/api/file/{file_id}/append", files={"file": ("delta.txt", b"ORD101|Oops\n", "text/plain")})
+    summary = client.get(f"/api/file/{file_id}/error/summary").json()
+    assert summary["error_count"] == 4
+    assert summary["categories"]["field_count"]["count"] == 2
+    assert client.get("/api/file/missing/error/summary").status_code == 404
+
+
+def test_metrics_endpoint(client):
+    processed = metrics.FILES.value(mode="inline")
+    cache_hits = metrics.CACHE_LOOKUPS.value(result="hit")
+    _upload(client, "a.txt")
+    _upload(client, "b.txt")
+
+    assert metrics.FILES.value(mode="inline") == processed + 1
+    assert metrics.CACHE_LOOKUPS.value(result="hit") == cache_hits + 1
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert 'order_stage_seconds_count{stage="parse"}' in response.text
+    assert 'order_errors_total{category="field_count"}' in response.text
+
+
+def test_profiled_upload(client, tmp_path, monkeypatch):
+    with open(SAMPLE_INPUT, "rb") as f:
+        files = [("files", ("orders.txt", f.read(), "text/plain"))]
+    assert client.post("/api/upload", params={"profile": "true"}, files=files).status_code == 400
+
+    monkeypatch.setattr(config, "PROFILE_DIR", str(tmp_path / "profiles"))
+    response = client.post("/api/upload", params={"profile": "true"}, files=files)
+    assert response.status_code == 200
+    [name] = response.json()["profiles"]
+    assert (tmp_path / "profiles" / name).exists()
+    assert "ingest_upload" in (tmp_path / "profiles" / name.replace(".prof", ".txt")).read_text()
+
+
+def test_report_view(client):
+    file_id = _upload(client, "orders.txt")["files"][0]["id"]
+    full = client.get(f"/api/file/{file_id}/output").text
+
+    assert client.get(f"/api/file/{file_id}/report").text == full
+
+    top = client.get(f"/api/file/{file_id}/report", params={"top": 1})
+    assert top.headers["X-Total-Customers"] == "1"
+    assert len(top.text.splitlines()) == 7
+    page = client.get(f"/api/file/{file_id}/report", params={"offset": 1, "limit": 2})
+    assert len(page.text.splitlines()) == 9
+    assert client.get("/api/file/missing/report").status_code == 404
+
+
+def test_export_endpoint(client, data_dir):
+    file_id = _upload(client, "orders.txt")["files"][0]["id"]
+
+    as_json = client.get(f"/api/file/{file_id}/export")
+    assert as_json.headers["content-type"] == "application/json"
+    assert as_json.json()["rows"][0][0] == "John Smith"
+    assert 'filename="orders_summary.json"' in as_json.headers["content-disposition"]
+
+    as_csv = client.get(f"/api/file/{file_id}/export", headers={"Accept": "text/csv"})
+    assert as_csv.headers["content-type"].startswith("text/csv")
+    assert as_csv.text.startswith("customer_name,order_count")
+
+    parquet = client.get(f"/api/file/{file_id}/export", params={"format": "parquet", "rows": "orders"})
+    assert parquet.status_code == 200
+    assert parquet.content[:4] == b"PAR1"
+
+    assert client.get(f"/api/file/{file_id}/export", params={"format": "xml"}).status_code == 422
+    assert client.get("/api/file/missing/export").status_code == 404
+
+    # Exports go with the submission
+    client.delete(f"/api/history/{_history_ids(client)[0]}")
+    assert os.listdir(data_dir / "outputs") == []
+
+
+def test_artifact_ranges_windows_and_compression(client, data_dir, monkeypatch):
+    file_id = _upload(client, "orders.txt")["files"][0]["id"]
+    errors = client.get(f"/api/file/{file_id}/error").text
+    lines = errors.split("\n")
+
+    partial = client.get(f"/api/file/{file_id}/error", headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.text == errors[:10]
+
+    window = client.get(f"/api/file/{file_id}/error", params={"offset": 1, "limit": 1})
+    assert window.text == lines[1]
+    assert window.headers["X-Total-Lines"] == str(len(lines))
+    tail = client.get(f"/api/file/{file_id}/error", params={"tail": 2})
+    assert tail.text == "\n".join(lines[-2:])
+    assert tail.headers["X-Line-Offset"] == str(len(lines) - 2)
+
+    monkeypatch.setattr(routes.config, "COMPRESS_MIN_BYTES", 0)
+    compressed = client.get(f"/api/file/{file_id}/output", headers={"Accept-Encoding": "gzip"})
+    assert compressed.headers["content-encoding"] == "gzip"
+    assert compressed.text == client.get(f"/api/file/{file_id}/output", headers={"Accept-Encoding": "identity"}).text
+    download = client.get(f"/api/download/{file_id}/error", headers={"Accept-Encoding": "gzip"})
+    assert download.headers["content-encoding"] == "gzip"
+    assert download.text == errors
+
+    # Compressed copies go with the submission
+    client.delete(f"/api/history/{_history_ids(client)[0]}")
+    assert os.listdir(data_dir / "outputs") == []
+    assert os.listdir(data_dir / "errors") == []
+
+
+def test_get_single_submission(client):
+    submission = _upload(client, "orders.txt")
+
+    assert client.get(f"/api/history/{submission['id']}").json() == submission
+    assert client.get("/api/history/missing").status_code == 404
+
+
+def test_identical_upload_reuses_cached_result(client, data_dir):
+    first = _upload(client, "orders.txt")["files"][0]
+    second = _upload(client, "orders.txt")["files"][0]
+
+    stats = client.get("/api/cache/stats").json()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+    assert stats["entries"] == 1
+
+    for directory, name in (("outputs", "output_file"), ("errors", "error_file"), ("uploads", "upload_file")):
+        a = data_dir / directory / first[name]
+        b = data_dir / directory / second[name]
+        assert a.read_bytes() == b.read_bytes()
+        # Stored once, linked into both submissions
+        assert os.path.samefile(a, b)
+
+    # Deleting one submission leaves the other (and the cache) intact
+    client.delete(f"/api/history/{_history_ids(client)[-1]}")
+    assert "GRAND TOTAL" in client.get(f"/api/file/{second['id']}/output").text
+
+
+def _history_ids(client):
+    return [s["id"] for s in client.get("/api/history").json()]
+
+
+def _upload_async(client, *names):
+    with open(SAMPLE_INPUT, "rb") as f:
+        content = f.read()
+    return client.post(
+        "/api/upload", params={"mode": "async"}, files=[("files", (name, content, "text/plain")) for name in names]
+    )
+
+
+def test_async_upload_job(client):
+    response = _upload_async(client, "a.txt", "b.txt")
+    assert response.status_code == 202
+    submission = response.json()
+    assert submission["job"]["status"] in ("queued", "processing", "completed")
+
+    deadline = time.monotonic() + 10
+    job = submission["job"]
+    while job["status"] not in ("completed", "failed") and time.monotonic() < deadline:
+        time.sleep(0.01)
+        job = client.get(f"/api/jobs/{submission['id']}").json()
+
+    assert job["status"] == "completed"
+    assert [f["status"] for f in job["files"]] == ["completed", "completed"]
+    # Identical files, so one of them may be served from the cache without reporting lines or errors
+    processed = [f for f in job["files"] if f["error_count"] is not None]
+    assert processed
+    for f in processed:
+        assert (f["lines_processed"], f["error_count"]) == (18, 3)
+    assert all(f["bytes_processed"] == os.path.getsize(SAMPLE_INPUT) for f in job["files"])
+
+    stored = client.get(f"/api/history/{submission['id']}").json()
+    assert stored["files"] == submission["files"]
+    assert "GRAND TOTAL" in client.get(f"/api/file/{submission['files'][1]['id']}/output").text
+
+
+def test_job_event_stream(client):
+    submission = _upload_async(client, "orders.txt").json()
+
+    with client.stream("GET", f"/api/jobs/{submission['id']}/events") as response:
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = [json.loads(line[len("data: "):]) for line in response.iter_lines() if line.startswith("data: ")]
+
+    assert events[-1]["status"] == "completed"
+    assert [e["version"] for e in events] == sorted(set(e["version"] for e in events))
+    assert client.get("/api/jobs/missing").status_code == 404
+    assert client.get("/api/jobs/missing/events").status_code == 404
+
+
+def test_async_upload_rejected_when_queue_full(client, data_dir, monkeypatch):
+    monkeypatch.setattr(routes, "job_manager", JobManager(workers=1, max_queue=1))
+
+    response = _upload_async(client, "a.txt", "b.txt")
+    assert response.status_code == 503
+    assert os.listdir(data_dir / "uploads") == []
+
+
+def test_analytics_across_submissions(client):
+    first = _upload(client, "a.txt", "b.txt")
+    second = _upload(client, "c.txt")
+
+    customers = client.get("/api/analytics/customers", params={"limit": 2})
+    assert customers.status_code == 200
+    assert customers.headers["X-Total-Customers"] == "6"
+    assert [row["customer_name"] for row in customers.json()] == ["John Smith", "Jane Doe"]
+
+    john = client.get("/api/analytics/customers/John Smith").json()
+    assert (john["file_count"], john["order_count"]) == (3, 9)
+    assert [f["submission_id"] for f in john["files"]] == [first["id"]] * 2 + [second["id"]]
+    assert john["net_total"] == pytest.approx(3 * john["files"][0]["net_total"])
+
+    today = client.get("/api/analytics/daily").json()
+    assert len(today) == 1 and today[0]["customer_count"] == 6
+    assert client.get("/api/analytics/customers", params={"until": today[0]["day"]}).json() == []
+
+    client.delete(f"/api/history/{first['id']}")
+    john = client.get("/api/analytics/customers/John Smith").json()
+    assert (john["file_count"], john["order_count"]) == (1, 3)
+
+    file_id = second["files"][0]["id"]
+    delta = b"ORD100|New Customer|Widget|2|300.00|2024-03-20\n"
+    client.post(f"/api/file/{file_id}/append", files={"file": ("delta.txt", delta, "text/plain")})
+    newcomer = client.get("/api/analytics/customers/New Customer").json()
+    assert (newcomer["order_count"], newcomer["net_total"]) == (1, pytest.approx(540.0))
+    assert client.get("/api/analytics/customers/Nobody").status_code == 404
+
+
+def test_clean_file_has_no_error_log_on_disk(client, data_dir):
+    content = b"ORD001|John Smith|Laptop|1|999.99|2024-03-15\n"
+    response = client.post("/api/upload", files=[("files", ("clean.txt", content, "text/plain"))])
+    file_id = response.json()["files"][0]["id"]
+
+    assert os.listdir(data_dir / "errors") == []
+    error = client.get(f"/api/file/{file_id}/error")
+    assert (error.status_code, error.content) == (200, b"")
+    window = client.get(f"/api/file/{file_id}/error", params={"tail": 10})
+    assert (window.content, window.headers["x-total-lines"]) == (b"", "0")
+    assert client.get(f"/api/download/{file_id}/error").content == b""
+
+
+def test_retention_endpoint(client, data_dir):
+    first = _upload(client, "a.txt")
+    second = _upload(client, "b.txt")
+
+    preview = client.post("/api/admin/retention", params={"dry_run": True, "max_bytes": 1}).json()
+    assert (preview["dry_run"], preview["submissions_deleted"]) == (True, 2)
+    assert len(client.get("/api/history").json()) == 2
+
+    # Packed submissions are unpacked the first time one of their files is asked for
+    report = routes.apply_retention(routes.store, routes.artifact_files, routes.RetentionPolicy(archive_after_days=1),
+                                    now=datetime.now() + timedelta(days=2))
+    assert report["submissions_packed"] == 2
+    assert os.listdir(data_dir / "outputs") == []
+    file_id = first["files"][0]["id"]
+    assert "John Smith" in client.get(f"/api/file/{file_id}/output").text
+    assert sorted(os.listdir(data_dir / "archives")) == [f"{second['id']}.zip"]
+
+    report = client.post("/api/admin/retention", params={"max_bytes": 1}).json()
+    assert report["submissions_deleted"] == 2
+    assert report["bytes_reclaimed"] > 0 and report["bytes_after"] == 0
+    assert report["policy"] == {"max_age_days": 0, "max_bytes": 1, "archive_after_days": 0}
+    assert client.get("/api/history").json() == []
+    assert client.get("/api/analytics/customers").json() == []
+    assert os.listdir(data_dir / "archives") == [] and os.listdir(data_dir / "uploads") == []
+
+
+def test_bulk_delete_and_export(client, data_dir):
+    submissions = [_upload(client, name, "other.txt") for name in ("a.txt", "b.txt", "c.txt", "d.txt")]
+    ids = [s["id"] for s in submissions]
+
+    assert client.post("/api/history/delete", json={}).status_code == 400
+    assert client.post("/api/history/export", json={"ids": ["missing"]}).status_code == 404
+
+    export = client.post("/api/history/export", json={"ids": ids[:2] + ["missing"], "filename": "A.TXT"})
+    assert export.headers["content-type"] == "application/zip"
+    with zipfile.ZipFile(io.BytesIO(export.content)) as archive:
+        assert [s["id"] for s in json.loads(archive.read("submissions.json"))] == [ids[0]]
+        names = archive.namelist()
+        output_file = submissions[0]["files"][0]["output_file"]
+        assert f"{ids[0]}/outputs/{output_file}" in names
+        assert b"John Smith" in archive.read(f"{ids[0]}/outputs/{output_file}")
+        assert len([name for name in names if name.startswith(f"{ids[0]}/uploads/")]) == 2
+
+    response = client.post("/api/history/delete", json={"ids": ids[1:3] + ["missing"]}).json()
+    assert response["deleted"] == ids[1:3]
+    # Every upload here has the same bytes, so all of them are still linked from the result cache
+    assert response["files_removed"] > 0 and response["bytes_reclaimed"] == 0
+    assert [s["id"] for s in client.get("/api/history").json()] == [ids[3], ids[0]]
+    assert client.get("/api/analytics/customers/John Smith").json()["file_count"] == 4
+
+    response = client.post("/api/history/delete", json={"since": "2000-01-01T00:00:00"}).json()
+    assert sorted(response["deleted"]) == sorted([ids[0], ids[3]])
+    assert client.get("/api/history").json() == []
+    assert os.listdir(data_dir / "uploads") == [] and os.listdir(data_dir / "outputs") == []
+
+
+def test_lifespan_sets_up_the_data_directory(tmp_path, monkeypatch):
+    data = tmp_path / "data"
+    monkeypatch.setattr(routes, "DATA_DIR", str(data))
+    monkeypatch.setattr(routes, "UPLOAD_DIR", str(data / "uploads"))
+    monkeypatch.setattr(routes, "OUTPUT_DIR", str(data / "outputs"))
+    monkeypatch.setattr(routes, "ERROR_DIR", str(data / "errors"))
+    for name in ("store", "analytics", "artifact_files", "result_cache"):
+        monkeypatch.setattr(routes, name, None)
+    monkeypatch.setattr(routes.config, "CACHE_ENABLED", True)
+    assert not data.exists()
+
+    with TestClient(app) as client:
+        assert {"analytics.db", "cache", "errors", "outputs", "submissions.db", "uploads"} <= set(os.listdir(data))
+        submission = _upload(client, "orders.txt")
+        assert [s["id"] for s in client.get("/api/history").json()] == [submission["id"]]
+
+
+def test_history_from_before_analytics_is_backfilled(tmp_path, monkeypatch):
+    # A data directory as the first release left it: history.json and uploads, no report state
+    data = tmp_path / "data"
+    for name in ("uploads", "outputs", "errors"):
+        (data / name).mkdir(parents=True)
+    history = []
+    for i, timestamp in enumerate(("2024-03-01T09:00:00", "2024-03-02T09:00:00")):
+        file_id = f"file-{i}"
+        (data / "uploads" / f"{file_id}_orders.txt").write_bytes(open(SAMPLE_INPUT, "rb").read())
+        (data / "outputs" / f"{file_id}_output.txt").write_text("old report")
+        history.append({"id": f"submission-{i}", "timestamp": timestamp, "files": [{
+            "id": file_id, "filename": "orders.txt",
+            "output_file": f"{file_id}_output.txt", "error_file": f"{file_id}_error.txt",
+        }]})
+    (data / "history.json").write_text(json.dumps(history))
+    monkeypatch.setattr(routes, "DATA_DIR", str(data))
+    monkeypatch.setattr(routes, "UPLOAD_DIR", str(data / "uploads"))
+    monkeypatch.setattr(routes, "OUTPUT_DIR", str(data / "outputs"))
+    monkeypatch.setattr(routes, "ERROR_DIR", str(data / "errors"))
+    for name in ("store", "analytics", "artifact_files", "result_cache"):
+        monkeypatch.setattr(routes, name, None)
+    monkeypatch.setattr(routes.config, "STORE_BACKEND", "sqlite")
+
+    with open(SAMPLE_INPUT) as f:
+        aggregator, _ = aggregate_stream([f.read()], io.StringIO())
+    expected = {summary.customer_name: summary for summary in aggregator.result().summary_report}
+    with TestClient(app) as client:
+        customers = {row["customer_name"]: row for row in client.get("/api/analytics/customers").json()}
+    assert set(customers) == set(expected)
+    for name, summary in expected.items():
+        assert customers[name]["file_count"] == 2
+        assert customers[name]["order_count"] == 2 * summary.order_count
+        assert customers[name]["net_total"] == pytest.approx(2 * summary.net_total)
+    # Backfilling reads the uploads without rewriting anything
+    assert (data / "outputs" / "file-0_output.txt").read_text() == "old report"
+
+
+def test_importing_the_app_touches_no_files_and_loads_no_optional_modules(tmp_path):
+    data = tmp_path / "data"
+    code = ("import sys, backend.main; "
+            "print([m for m in ('pandas', 'numpy', 'pyarrow', 'tabulate', 'zstandard') if m in sys.modules])")
+    completed = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True,
+                               cwd=os.path.join(os.path.dirname(__file__), ".."),
+                               env=dict(os.environ, ORDER_DATA_DIR=str(data)))
+    assert completed.stdout.strip() == "[]"
+    assert not data.exists()
@@ -0,0 +1,191 @@
+import io
+import json
+import random
+from datetime import date, timedelta
+from decimal import ROUND_HALF_UP, Decimal
+
+import numpy as np
+import pytest
+
+from backend.core import config
+from backend.core.processor import aggregate_stream, process_file_content, processing_fingerprint
+from backend.core.rules import DEFAULT_RULES, DiscountRule, RuleSet, active_rules, parse_rules
+
+CUSTOMERS = [f"Customer {i}" for i in range(20)]
+PRODUCTS = [f"Product {i}" for i in range(20)]
+FIRST_DAY = date(2024, 1, 1)
+
+
+def _random_rules(rng, count):
+    rules = []
+    for _ in range(count):
+        rule = {"rate": rng.choice([0.05, 0.1, 0.125, 0.15, 0.2, 0.3])}
+        if rng.random() < 0.7:
+            rule["min_total"] = rng.choice([0, 99.99, 250, 500, 500.005, 1000, 2500])
+        scope = rng.randrange(4)
+        if scope == 1:
+            rule["customer"] = rng.choice(CUSTOMERS)
+        elif scope == 2:
+            rule["product"] = rng.choice(PRODUCTS)
+        elif scope == 3:
+            start = FIRST_DAY + timedelta(days=rng.randrange(60))
+            if rng.random() < 0.8:
+                rule["start"] = start.isoformat()
+            if rng.random() < 0.8:
+                rule["end"] = (start + timedelta(days=rng.randrange(15))).isoformat()
+            if "start" not in rule and "end" not in rule:
+                rule["end"] = start.isoformat()
+        rules.append(rule)
+    return parse_rules(rules)
+
+
+def _reference_rate(rules, total, customer, product, day):
+    """The best rate of every matching rule, checked one rule at a time."""
+    best = 0
+    for rule in rules:
+        if rule.min_total is not None and not total > rule.min_total:
+            continue
+        if rule.customer is not None and rule.customer != customer:
+            continue
+        if rule.product is not None and rule.product != product:
+            continue
+        if rule.start is not None and day < rule.start:
+            continue
+        if rule.end is not None and day > rule.end:
+            continue
+        best = max(best, rule.rate)
+    return best
+
+
+def _random_lines(rng, count):
+    return [
+        (rng.randrange(1, 10) * rng.choice([1.5, 49.99, 120.0, 333.33, 999.99]), rng.choice(CUSTOMERS),
+         rng.choice(PRODUCTS), FIRST_DAY + timedelta(days=rng.randrange(-5, 80)))
+        for _ in range(count)
+    ]
+
+
+@pytest.mark.parametrize("count", [0, 1, 5, 50, 400])
+def test_compiled_rates_match_rule_by_rule(count):
+    rng = random.Random(count)
+    rules = _random_rules(rng, count)
+    ruleset = RuleSet(rules)
+    rate = ruleset.rate_function()
+    lines = _random_lines(rng, 3000)
+
+    expected = [_reference_rate(rules, *line) for line in lines]
+    if ruleset.scoped:
+        assert [rate(*line) for line in lines] == expected
+    else:
+        assert [rate(line[0]) for line in lines] == expected
+
+    totals, customers, products, days = zip(*lines)
+    bulk = ruleset.bulk_rates(np.array(totals), np.array(customers, dtype=object),
+                              np.array(products, dtype=object), np.array([day.toordinal() for day in days]))
+    assert bulk.tolist() == expected
+
+
+def test_cents_thresholds_match_dollars():
+    rules = RuleSet(parse_rules([{"min_total": 500, "rate": 0.1}, {"min_total": 500.005, "rate": 0.2}]))
+    rate = rules.rate_function(cents=True)
+    assert [rate(cents) for cents in (50000, 50001, 50002)] == [0, 0.2, 0.2]
+    assert rules.rate_function()(500.0) == 0
+    assert rules.rate_function()(500.01) == 0.2
+
+
+def test_nan_totals_get_no_discount():
+    rules = RuleSet(parse_rules([{"rate": 0.1}, {"min_total": 5, "rate": 0.2}, {"min_total": 10, "rate": 0.3}]))
+    assert rules.rate_function()(float("nan")) == 0
+    assert rules.bulk_rates(np.array([float("nan"), 1.0, 20.0])).tolist() == [0, 0.1, 0.3]
+
+
+@pytest.mark.parametrize("data", [
+    {"rate": 0.1},
+    [{"min_total": 500}],
+    [{"rate": 1.5}],
+    [{"rate": True}],
+    [{"rate": 0.1, "min_total": "500"}],
+    [{"rate": 0.1, "customer": 7}],
+    [{"rate": 0.1, "start": "2024-13-01"}],
+    [{"rate": 0.1, "start": "2024-03-02", "end": "2024-03-01"}],
+    [{"rate": 0.1, "customer": "A", "product": "B"}],
+    [{"rate": 0.1, "percent": 10}],
+])
+def test_parse_rules_rejects_bad_rules(data):
+    with pytest.raises(ValueError):
+        parse_rules(data)
+
+
+def test_default_rules_are_the_built_in_policy():
+    assert not config.DISCOUNT_RULES
+    assert active_rules().rules == DEFAULT_RULES
+    assert parse_rules([rule.to_dict() for rule in DEFAULT_RULES]) == list(DEFAULT_RULES)
+
+
+def _configure(monkeypatch, tmp_path, rules):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(rules))
+    monkeypatch.setattr(config, "DISCOUNT_RULES", str(path))
+
+
+SCOPED_RULES = [
+    {"min_total": 100, "rate": 0.05},
+    {"min_total": 1000, "rate": 0.15},
+    {"customer": "C1", "rate": 0.02},
+    {"customer": "C2", "min_total": 50, "rate": 0.25},
+    {"product": "P3", "rate": 0.3},
+    {"start": "2024-03-01", "end": "2024-03-03", "rate": 0.2},
+]
+
+SCOPED_CONTENT = """ORD001|C1|P1|1|10.00|2024-01-01
+ORD002|C2|P1|1|60.00|2024-01-01
+ORD003|C3|P3|2|5.00|2024-01-01
+ORD004|C3|P1|3|40.00|2024-03-02
+ORD005|C3|P1|1|150.00|2024-02-29
+ORD006|C1|P2|4|300.00|2024-03-04
+ORD007| C2 | P3 |+1|1e2|2024-3-1
+Invalid|Line"""
+
+
+def test_configured_rules_apply_to_every_engine(monkeypatch, tmp_path):
+    default_fingerprint = processing_fingerprint()
+    _configure(monkeypatch, tmp_path, SCOPED_RULES)
+    assert processing_fingerprint() != default_fingerprint
+
+    output, errors = process_file_content(SCOPED_CONTENT)
+    assert (output, errors) == process_file_content(SCOPED_CONTENT, engine="columnar")
+
+    aggregator, _ = aggregate_stream([SCOPED_CONTENT], io.StringIO())
+    discounts = {s.customer_name: round(s.total_discount, 6) for s in aggregator.result().summary_report}
+    # C1: 2% of $10, 15% of $1200; C2: 25% of $60, 30% of $100 (P3); C3: 30% of $10, 20% of $120, 5% of $150
+    assert discounts == {"C1": round(0.2 + 180, 6), "C2": 45.0, "C3": round(3 + 24 + 7.5, 6)}
+
+
+def test_configured_rules_in_cents_mode(monkeypatch, tmp_path):
+    _configure(monkeypatch, tmp_path, SCOPED_RULES)
+    monkeypatch.setattr(config, "MONEY_MODE", "cents")
+    rng = random.Random(19)
+    lines = [
+        f"ORD{i}|C{rng.randrange(1, 4)}|P{rng.randrange(1, 4)}|{rng.randint(1, 9)}|{rng.randrange(5000)}."
+        f"{rng.randrange(1000):03d}|2024-{rng.choice(['02-28', '03-01', '03-03', '03-04'])}"
+        for i in range(5000)
+    ]
+    rules = parse_rules(SCOPED_RULES)
+
+    aggregator, _ = aggregate_stream(["\n".join(lines)], io.StringIO())
+
+    expected = {}
+    for line in lines:
+        _, name, product, quantity, price, day = line.split("|")
+        cents = int((int(quantity) * Decimal(price)).quantize(Decimal("0.01"), ROUND_HALF_UP) * 100)
+        rate = _reference_rate(rules, cents / 100, name, product, date.fromisoformat(day))
+        discount = int((cents * Decimal(str(rate))).quantize(Decimal(1), ROUND_HALF_UP))
+        expected[name] = expected.get(name, 0) + discount
+    assert {name: discount for name, _, _, _, discount, _ in aggregator.rows()} == expected
+
+
+def test_rules_fingerprint_ignores_key_order():
+    first = RuleSet(parse_rules([{"rate": 0.1, "min_total": 500, "customer": "A"}]))
+    second = RuleSet(parse_rules([{"customer": "A", "min_total": 500, "rate": 0.1}]))
+    assert first.fingerprint == second.fingerprint
+    assert first.fingerprint != RuleSet([DiscountRule(0.1, 500, customer="B")]).fingerprint